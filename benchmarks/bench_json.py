@@ -0,0 +1,67 @@
+""" Compares the JSON renderer against the json() hook it replaced
+
+Notes:
+    Run from the root of the repository:
+
+        $ PYTHONPATH=. python benchmarks/bench_json.py
+
+    Each input is a list of model objects, as returned by list
+    endpoints, rendered by the previous hasattr based default hook,
+    by the JSON renderer using the objects' json(request) method,
+    and by the JSON renderer using __json_fields__
+"""
+import json
+import timeit
+from distill.renderers import JSON
+from distill.response import Response
+
+
+class Model(object):
+    def __init__(self, i):
+        self.id = i
+        self.name = 'item {0}'.format(i)
+        self.price = i * 1.5
+        self.tags = ['a', 'b']
+
+    def json(self, request):
+        return {'id': self.id, 'name': self.name, 'price': self.price, 'tags': self.tags}
+
+
+class FieldsModel(Model):
+    __json_fields__ = ('id', 'name', 'price', 'tags')
+
+
+def previous(data, request, response):
+    """The JSON renderer before the encoder registry"""
+    response.headers['Content-Type'] = 'application/json'
+
+    def default(obj):
+        if hasattr(obj, 'json'):
+            return obj.json(request)
+        else:
+            raise TypeError('%r is not JSON serializable' % obj)
+    return json.dumps(data, default=default)
+
+
+def time_call(func, data, number):
+    seconds = min(timeit.repeat(lambda: func(data, None, Response()), number=number, repeat=3)) / number
+    return '{0:.2f}ms'.format(seconds * 1e3)
+
+
+def main():
+    renderer = JSON()
+    print('{0:<24} {1:>10} {2:>10} {3:>16}'.format('input', 'previous', 'json()', '__json_fields__'))
+    for count in (10, 1000, 10000):
+        for name, data, fields in [
+                ('list of {0}'.format(count), [Model(i) for i in range(count)],
+                 [FieldsModel(i) for i in range(count)]),
+                ('dict with list of {0}'.format(count), {'items': [Model(i) for i in range(count)]},
+                 {'items': [FieldsModel(i) for i in range(count)]})]:
+            number = max(1, 20000 // count)
+            print('{0:<24} {1:>10} {2:>10} {3:>16}'.format(
+                name, time_call(previous, data, number), time_call(renderer, data, number),
+                time_call(renderer, fields, number)))
+
+
+if __name__ == '__main__':
+    main()
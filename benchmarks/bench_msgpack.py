@@ -0,0 +1,49 @@
+""" Compares the MessagePack encoder and decoder against json
+
+Notes:
+    Run from the root of the repository:
+
+        $ PYTHONPATH=. python benchmarks/bench_msgpack.py
+
+    Reports the time to encode and decode each payload, and the
+    size of the encoded payload.  json is implemented in C, while
+    distill.messagepack is pure Python, so the CPU comparison
+    favours json, the size comparison shows what's saved on the wire
+"""
+import json
+import timeit
+from distill.messagepack import packb, unpackb
+
+PAYLOADS = [
+    ('small object', {'id': 12345, 'name': 'widget', 'active': True, 'price': 19.99}),
+    ('list of 1000 records', [{'id': i, 'name': 'item {0}'.format(i), 'price': i * 0.5, 'tags': ['a', 'b'],
+                               'stock': i % 7 == 0} for i in range(1000)]),
+    ('10000 integers', list(range(10000))),
+    ('binary blob', {'data': b'\x00\x01' * 50000}),
+]
+
+
+def best(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e3
+
+
+def main():
+    print('{0:<22} {1:>11} {2:>11} {3:>11} {4:>11} {5:>10} {6:>10}'.format(
+        'payload', 'json enc', 'mpack enc', 'json dec', 'mpack dec', 'json size', 'mpack size'))
+    for name, payload in PAYLOADS:
+        packed = packb(payload)
+        if isinstance(payload, dict) and isinstance(payload.get('data'), bytes):
+            # json has no binary type, so it is sent as latin-1 text
+            json_payload = {'data': payload['data'].decode('latin-1')}
+        else:
+            json_payload = payload
+        dumped = json.dumps(json_payload)
+        number = max(1, 20000 // len(packed))
+        print('{0:<22} {1:>9.3f}ms {2:>9.3f}ms {3:>9.3f}ms {4:>9.3f}ms {5:>10} {6:>10}'.format(
+            name, best(lambda: json.dumps(json_payload), number), best(lambda: packb(payload), number),
+            best(lambda: json.loads(dumped), number), best(lambda: unpackb(packed), number),
+            len(dumped.encode('utf-8')), len(packed)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" Compares decode_query against parse_query_string
+
+Notes:
+    Run from the root of the repository:
+
+        $ PYTHONPATH=. python benchmarks/bench_querystring.py
+
+    The adversarial inputs are a long, heavily escaped value,
+    which is quadratic for the string concatenation in url_decode,
+    a query with a large number of fields, and malformed escapes,
+    which parse_query_string fails on
+"""
+import timeit
+from distill.helpers import decode_query, parse_query_string
+
+INPUTS = [
+    ('short', 'page=2&sort=name'),
+    ('form', '&'.join('field{0}=some+value+with%20escapes%21&other{0}=plain'.format(i) for i in range(20))),
+    ('unicode', 'q=' + '%E2%9C%93%C3%A9' * 50),
+    ('long escaped value', 'data=' + '%7B%22a%22%3A1%7D' * 20000),
+    ('many fields', '&'.join('k{0}=v{0}'.format(i) for i in range(5000))),
+    ('malformed escapes', 'data=' + '100%+off%zz' * 1000),
+]
+
+
+def time_call(func, query, number):
+    try:
+        func(query)
+    except Exception as ex:
+        return type(ex).__name__
+    seconds = min(timeit.repeat(lambda: func(query), number=number, repeat=3)) / number
+    return '{0:.1f}us'.format(seconds * 1e6)
+
+
+def main():
+    print('{0:<20} {1:>16} {2:>16}'.format('input', 'parse_query_string', 'decode_query'))
+    for name, query in INPUTS:
+        number = max(1, 200000 // len(query))
+        old = time_call(parse_query_string, query, number)
+        new = time_call(decode_query, query, number)
+        print('{0:<20} {1:>18} {2:>16}'.format(name, old, new))
+
+
+if __name__ == '__main__':
+    main()
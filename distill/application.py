@@ -1,11 +1,38 @@
-from inspect import isclass
+from collections import deque
+from inspect import isclass, isfunction, isgenerator, getmro
 import sys
+import warnings
 from functools import partial
 from routes import Mapper
 from distill.exceptions import HTTPNotFound, HTTPErrorResponse
 from distill.request import Request
-from distill.response import Response
+from distill.response import Response, StreamIterable, is_stream, primed
 from distill.renderers import RenderFactory
+from distill.routing import Dispatcher, conditions_used
+from distill.cache import LRUCache, MemoryCache, ResponseCache, CachedResponse
+from distill.buffers import BufferPool
+from distill.compression import Compressor
+from distill.shmcache import SharedMemoryCache
+from distill.conditional import not_modified, make_not_modified, ENTITY_HEADERS
+from distill.decorators import blocking, is_blocking
+
+
+class _InstanceMethod(object):
+    """ A method which falls back to a static method when called on its class
+
+    Notes:
+        Keeps methods which used to be static methods working
+        for callers which still call them on the class
+    """
+
+    def __init__(self, method, fallback):
+        self.method = method
+        self.fallback = fallback
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return getattr(cls, self.fallback)
+        return self.method.__get__(obj, cls)
 
 
 class Distill(object):
@@ -34,10 +61,36 @@ class Distill(object):
         self._after = []
         self._exc_listeners = {}
         self._controllers = {}
+        self._dispatch_table = {}
+        self._frozen = False
+        self._dispatcher = None
+        self._asgi = None
+        self._routes_changed = False
+        self._route_cache_mode = None
+        self.route_cache = None
+        if settings.get('distill.routing.cache_size'):
+            self.route_cache = LRUCache(settings['distill.routing.cache_size'])
+        self.buffer_pool = BufferPool(settings.get('distill.buffers.pool_size', 8),
+                                      settings.get('distill.buffers.max_size', 16777216))
+        self.response_cache = None
+        if settings.get('distill.response_cache.enabled'):
+            if settings.get('distill.response_cache.backend') == 'shm':
+                backend = SharedMemoryCache.from_settings(settings)
+            else:
+                backend = MemoryCache(settings.get('distill.response_cache.max_bytes', 67108864))
+            self.response_cache = ResponseCache(backend)
+        self._etags = settings.get('distill.etags.enabled', False)
+        self.compressor = None
+        if settings.get('distill.compression.enabled'):
+            self.compressor = Compressor.from_settings(settings)
         if controllers is not None:
-            self._controllers.update(controllers)
+            for name, controller in controllers.items():
+                self.add_controller(name, controller)
 
-        RenderFactory.create(settings)
+        self.render_factory = RenderFactory.create(settings)
+        self.fragment_cache = self.render_factory.fragment_cache
+        if settings.get('distill.production'):
+            self.render_factory.precompile()
 
     def __call__(self, env, start_response):
         """ Excpected WSGI method
@@ -45,37 +98,62 @@ class Distill(object):
         Creates new request using the provided env, then traverses
         the root node to the required view node
         """
+        if self.response_cache is not None and env.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+            cached = self._cached_response(env)
+            if cached is not None:
+                start_response(cached.status, cached.wsgi_headers)
+                return cached.iterable
+
         req = Request(env, self)
 
         if self._session_factory:
             req.session = self._session_factory(req)
 
+        iterable = None
         try:
-            resp = self._request(env, req)
-        except HTTPErrorResponse as ex:
-            if self._exc_listeners and ex.__class__ in self._exc_listeners:
-                resp = ex
-                res = self._exc_listeners[ex.__class__](req, resp)
-                if isinstance(res, Response):
-                    resp = res
+            try:
+                resp = self._request(env, req)
+            except HTTPErrorResponse as ex:
+                if self._exc_listeners and ex.__class__ in self._exc_listeners:
+                    res = self._exc_listeners[ex.__class__](req, ex)
+                    resp = self._exception_result(res, ex)
+
+                    self._do_after(req, resp)
+                    self._finalize(env, resp)
+                    start_response(resp.status, resp.wsgi_headers)
+                    iterable = resp.iterable
+                    return iterable
                 else:
-                    resp.body = str(res)
-
-                self._do_after(req, resp)
-                resp.finalize(env.get('wsgi.file_wrapper'))
-                start_response(resp.status, resp.wsgi_headers)
-                return resp.iterable
-            else:
-                self._do_after(req, ex)
-                start_response(ex.status, ex.wsgi_headers, sys.exc_info())
-                # By spec execution shouldn't get here, but in case it does
-                return []  # pragma: no cover
-
-        self._do_after(req, resp)
-        resp.finalize(env.get('wsgi.file_wrapper'))
+                    self._do_after(req, ex)
+                    start_response(ex.status, ex.wsgi_headers, sys.exc_info())
+                    # By spec execution shouldn't get here, but in case it does
+                    return []  # pragma: no cover
+
+            self._do_after(req, resp)
+            self._finalize(env, resp)
+            if req.cache_policy is not None and self.response_cache is not None:
+                self.response_cache.store(env, resp, *req.cache_policy)
+
+            start_response(resp.status, resp.wsgi_headers)
+            iterable = resp.iterable
+            return iterable
+        finally:
+            _release_request(req, iterable)
+
+    @property
+    def asgi(self):
+        """ Returns an ASGI application serving this app
 
-        start_response(resp.status, resp.wsgi_headers)
-        return resp.iterable
+        Notes:
+            Point your ASGI server at app.asgi to serve the
+            application on an event loop, where actions and
+            middleware may be coroutine functions.  Requires
+            Python 3.5 or newer
+        """
+        if self._asgi is None:
+            from distill.asgi import ASGIApplication
+            self._asgi = ASGIApplication(self)
+        return self._asgi
 
     def _request(self, env, req):
         """ Processes the request
@@ -89,33 +167,148 @@ class Distill(object):
 
         self._do_before(req, resp)
 
-        context = self.map.match(req.path, env)
-        if context is not None:
-            req.matchdict = context
-            if 'controller' in context and context['controller'] in self._controllers:
-                if hasattr(self._controllers[context['controller']], context['action']):
-                    cls = self._controllers[context['controller']]
-                    controller = cls()
-                    res = getattr(controller, context['action'])(req, resp)
-                else:
-                    raise HTTPNotFound()
-            elif callable(context['action']):
-                res = context['action'](req, resp)
-            else:
-                raise HTTPNotFound()
+        action = self._resolve(req, env)
+        return self._action_result(action(req, resp), resp)
+
+    def _resolve(self, req, env):
+        """ Returns the action that should handle the request
 
-            if isinstance(res, Response):
-                if isinstance(res, HTTPErrorResponse):
-                    raise res
-                resp = res
-            elif res is not None:
-                resp.body = str(res)
+        Notes:
+            Sets the request's matchdict, and raises HTTPNotFound
+            if no route or action matches the request
+        """
+        context = self._match(req, env)
+        if context is None:
+            raise HTTPNotFound()
 
+        req.matchdict = context
+        if 'controller' in context and context['controller'] in self._controllers:
+            action = self._dispatch_table.get((context['controller'], context['action']))
+            if action is None:
+                raise HTTPNotFound()
+        elif callable(context['action']):
+            action = context['action']
         else:
             raise HTTPNotFound()
 
+        if self.response_cache is not None and env.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+            req.cache_policy = getattr(action, '_distill_cache', None)
+            if req.cache_policy is None and context.get('cache_ttl'):
+                # Route defaults are converted to strings by routes
+                vary = context.get('cache_vary') or ()
+                if not isinstance(vary, (list, tuple)):
+                    vary = [name.strip() for name in vary.split(',')]
+                req.cache_policy = (float(context['cache_ttl']), tuple(vary))
+        return action
+
+    @staticmethod
+    def _action_result(res, resp):
+        """Returns the response for the value returned by an action"""
+        if isinstance(res, Response):
+            if isinstance(res, HTTPErrorResponse):
+                raise res
+            return res
+        elif isgenerator(res):
+            resp.body = primed(res)
+        elif is_stream(res):
+            resp.body = res
+        elif hasattr(res, 'read'):
+            resp.file = res
+        elif res is not None:
+            resp.body = str(res)
+        return resp
+
+    @staticmethod
+    def _exception_result(res, resp):
+        """Returns the response for the value returned by an exception listener"""
+        if isinstance(res, Response):
+            return res
+        resp.body = str(res)
         return resp
 
+    def _cached_response(self, env):
+        """ Returns the cached response for a request, or None
+
+        Notes:
+            A cached response the client already has is answered
+            with 304 Not Modified
+        """
+        cached = self.response_cache.get(env)
+        if cached is not None and not_modified(env, cached):
+            return CachedResponse('304 Not Modified', [(k, v) for k, v in cached.wsgi_headers
+                                                       if k not in ENTITY_HEADERS], b'')
+        return cached
+
+    def _finalize(self, env, resp):
+        """ Prepares the response to be sent
+
+        Notes:
+            Adds an ETag to GET and HEAD responses if ETags are
+            enabled, and answers conditional requests the response
+            satisfies with 304 Not Modified.  Otherwise compresses
+            the response, if compression is enabled, then finalizes
+            it.  Compressed responses only get a weak ETag, since
+            their bytes differ from the uncompressed response
+        """
+        if self._etags and env.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+            resp.add_etag()
+        if not_modified(env, resp):
+            make_not_modified(resp)
+        elif self.compressor is not None and self.compressor.compress(env, resp):
+            etag = resp.headers.get('ETag')
+            if etag is not None and not etag.startswith('W/'):
+                resp.headers['ETag'] = 'W/' + etag
+        resp.finalize(env.get('wsgi.file_wrapper'))
+
+    def _match(self, req, env):
+        """ Matches the request against the routing table
+
+        Notes:
+            If the route cache is enabled, successful matches are
+            cached by method and path, as well as host when any
+            route depends on the sub domain.  Routes using a function
+            condition can't be cached, since the function may depend
+            on anything in the environ
+        """
+        key = None
+        if self.route_cache is not None:
+            key = self._route_cache_key(req, env)
+            if key is not None:
+                context = self.route_cache.get(key)
+                if context is not None:
+                    return context.copy()
+
+        if self._frozen:
+            if self._dispatcher is None:
+                self._dispatcher = Dispatcher(self.map)
+            context = self._dispatcher.match(req.path, env)
+        else:
+            if self._routes_changed:
+                # The mapper only generates its regexps once
+                self.map.create_regs()
+                self._routes_changed = False
+            context = self.map.match(req.path, env)
+
+        if key is not None and context is not None:
+            self.route_cache.put(key, context.copy())
+        return context
+
+    def _route_cache_key(self, req, env):
+        if self._route_cache_mode is None:
+            used = conditions_used(self.map)
+            if 'function' in used:
+                self._route_cache_mode = 'disabled'
+            elif 'sub_domain' in used:
+                self._route_cache_mode = 'host'
+            else:
+                self._route_cache_mode = 'path'
+
+        if self._route_cache_mode == 'path':
+            return env.get('REQUEST_METHOD'), req.path
+        elif self._route_cache_mode == 'host':
+            return env.get('REQUEST_METHOD'), req.path, env.get('HTTP_HOST')
+        return None
+
     def _do_before(self, req, resp):
         if self._before:
             for f in self._before:
@@ -162,8 +355,27 @@ class Distill(object):
             kwargs: Keyword arguments to be passed to the mapper
         """
         self.map.connect(*args, **kwargs)
+        self._dispatcher = None
+        self._routes_changed = True
+        if self.route_cache is not None:
+            self.route_cache.clear()
+            self._route_cache_mode = None
+
+    def freeze(self):
+        """ Compiles the routing table
+
+        Notes:
+            Once frozen, requests are matched using a hash lookup
+            for static routes and a segment trie for parameterized
+            ones, instead of scanning every route in the mapper.
+            Routes added with map_connect after freezing are picked
+            up automatically, routes connected directly on the
+            mapper are not until freeze is called again
+        """
+        self._frozen = True
+        self._dispatcher = Dispatcher(self.map)
 
-    def add_controller(self, name, controller):
+    def add_controller(self, name, controller, lifecycle='request', pool_size=8):
         """ Adds a controller to the application
 
         Notes:
@@ -173,11 +385,77 @@ class Distill(object):
             name matches the one you provided to the controller argument
             of map_connect
 
+            The controller's actions are resolved when it is added.  By
+            default a new instance of the controller is created for every
+            request.  Stateless controllers may instead use the singleton
+            lifecycle, where one instance serves every request, or the
+            pooled lifecycle, where instances are reused once a request
+            is done with them.  Pooled and singleton controllers are
+            shared between threads, so they must not store per request
+            state on self
+
         Args:
             name: Name of the controller
             controller: Controller class
+
+        Kwargs:
+            lifecycle: One of request, singleton or pooled Default: request
+            pool_size: Maximum number of idle pooled instances Default: 8
         """
+        # Resolved before anything is replaced, so an invalid lifecycle leaves the app as it was
+        actions = list(_controller_actions(controller, lifecycle, pool_size))
         self._controllers[name] = controller
+        for key in [k for k in self._dispatch_table if k[0] == name]:
+            del self._dispatch_table[key]
+        for action, method in actions:
+            self._dispatch_table[(name, action)] = method
+
+    def add_static(self, prefix, directory, name=None, **kwargs):
+        """ Serves the files in a directory under a URL prefix
+
+        Notes:
+            See distill.static.StaticFiles for the available kwargs.
+            Only GET and HEAD requests are routed to the files
+
+        Args:
+            prefix: The URL prefix, for example /static
+            directory: The directory to serve
+
+        Kwargs:
+            name: Name of the route Default: static + prefix
+        """
+        from distill.static import StaticFiles
+        static = StaticFiles(directory, **kwargs)
+        prefix = prefix.rstrip('/')
+        self.map_connect(name or 'static' + prefix, prefix + '/{path:.*}', action=static,
+                         conditions={'method': ['GET', 'HEAD']})
+        return static
+
+    def warmup(self):
+        """ Prepares the application to serve requests
+
+        Notes:
+            Freezes the routing table and compiles all templates,
+            so this work isn't done by the first requests.  Servers
+            that fork should call this before forking, so the results
+            are shared between the workers.  Returns the seconds
+            each template took to compile
+        """
+        self.freeze()
+        return self.render_factory.precompile()
+
+    def serve(self, host='127.0.0.1', port=8000, **kwargs):
+        """ Serves the application with the built in prefork server
+
+        Notes:
+            See distill.serve.PreforkServer for the available kwargs
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on
+        """
+        from distill.serve import PreforkServer
+        PreforkServer(self, host, port, **kwargs).run()
 
     def on_except(self, exc, method):
         self._exc_listeners[exc] = method
@@ -185,6 +463,104 @@ class Distill(object):
     def set_session_factory(self, session_factory):
         self._session_factory = session_factory
 
+    def add_renderer(self, name, serializer):
+        """ Adds a renderer to this application
+
+        Notes:
+            Called on the class, as Distill.add_renderer(name,
+            serializer), the renderer is added to the application
+            created last, which is deprecated
+        """
+        self.render_factory.register_renderer(name, serializer)
+
+    add_renderer = _InstanceMethod(add_renderer, '_add_renderer_to_last')
+
     @staticmethod
-    def add_renderer(name, serializer):
-        RenderFactory.add_renderer(name, serializer)
+    def _add_renderer_to_last(name, serializer):
+        warnings.warn('Distill.add_renderer acts on the application created last and is deprecated, '
+                      'use app.add_renderer instead', DeprecationWarning, stacklevel=2)
+        RenderFactory._factory.register_renderer(name, serializer)
+
+
+def _release_request(req, iterable):
+    """ Releases the request once its response no longer needs it
+
+    Notes:
+        A streamed body may still read the request while it is
+        sent, so the request is released when the server closes
+        the iterable instead
+    """
+    if isinstance(iterable, StreamIterable):
+        iterable.on_close = req.release
+    else:
+        req.release()
+
+
+def _controller_actions(cls, lifecycle, pool_size):
+    """ Resolves the actions of a controller class
+
+    Notes:
+        Yields (name, callable) pairs, where each callable
+        accepts the request and response and invokes the action
+        on an instance of the controller according to lifecycle
+    """
+    if lifecycle not in ('request', 'singleton', 'pooled'):
+        raise ValueError('Unknown controller lifecycle {0}'.format(lifecycle))
+
+    if lifecycle == 'singleton':
+        instance = cls()
+    elif lifecycle == 'pooled':
+        pool = deque()
+
+    for name in dir(cls):
+        if name.startswith('__') or not callable(getattr(cls, name)):
+            continue
+
+        if lifecycle == 'singleton':
+            if is_blocking(cls):
+                yield name, blocking(partial(getattr(instance, name)))
+            else:
+                yield name, getattr(instance, name)
+            continue
+
+        function = None
+        for klass in getmro(cls):
+            if name in klass.__dict__:
+                if isfunction(klass.__dict__[name]):
+                    function = klass.__dict__[name]
+                break
+
+        if function is None:
+            # staticmethods, classmethods and other descriptors
+            # need to be bound through the instance
+            function = partial(_call_attribute, name)
+
+        if lifecycle == 'request':
+            action = partial(_call_new, cls, function)
+        else:
+            action = partial(_call_pooled, cls, function, pool, pool_size)
+        if is_blocking(cls) or is_blocking(getattr(cls, name)):
+            blocking(action)
+        if hasattr(getattr(cls, name), '_distill_cache'):
+            action._distill_cache = getattr(cls, name)._distill_cache
+        yield name, action
+
+
+def _call_attribute(name, instance, request, response):
+    return getattr(instance, name)(request, response)
+
+
+def _call_new(cls, function, request, response):
+    return function(cls(), request, response)
+
+
+def _call_pooled(cls, function, pool, pool_size, request, response):
+    try:
+        instance = pool.pop()
+    except IndexError:
+        instance = cls()
+    try:
+        return function(instance, request, response)
+    finally:
+        if len(pool) < pool_size:
+            pool.append(instance)
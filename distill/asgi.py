@@ -0,0 +1,341 @@
+""" ASGI support for Distill applications
+
+Notes:
+    This module requires Python 3.7 or newer.  Everything here
+    is reached through Distill.asgi, or lazily by the renderer
+    and middleware decorators when they wrap an async def action
+"""
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, partial
+from inspect import isawaitable, iscoroutinefunction, isgenerator
+from io import BytesIO
+from distill.application import _release_request
+from distill.decorators import is_blocking
+from distill.exceptions import HTTPErrorResponse
+from distill.request import Request
+from distill.response import Response, primed
+
+_done = object()
+
+
+async def maybe_await(value):
+    """Awaits value if it is awaitable, otherwise returns it unchanged"""
+    if isawaitable(value):
+        return await value
+    return value
+
+
+class ThreadPool(object):
+    """ A bounded pool of threads for running blocking callables
+
+    Notes:
+        queue_depth is the number of calls waiting for a free
+        thread, and active the number of calls currently running
+    """
+
+    def __init__(self, max_workers):
+        """ Init
+
+        Args:
+            max_workers: The maximum number of threads in the pool
+        """
+        self.max_workers = max_workers
+        self.queue_depth = 0
+        self.active = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    async def run(self, func, *args):
+        """ Calls func with args in the pool, returning its result
+
+        Notes:
+            If the caller is cancelled before a thread picks the
+            call up, it's dropped and never made.  Once it's been
+            started the cancellation waits for it to finish, so
+            nothing it uses is released while it's still running
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        with self._lock:
+            self.queue_depth += 1
+        state = {'started': False, 'cancelled': False}
+        future = asyncio.get_running_loop().run_in_executor(self._executor, partial(self._call, func, args, state))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            with self._lock:
+                if not state['started']:
+                    state['cancelled'] = True
+                    self.queue_depth -= 1
+            if state['started']:
+                await asyncio.wait([future])
+            raise
+
+    def _call(self, func, args, state):
+        with self._lock:
+            if state['cancelled']:
+                return None
+            state['started'] = True
+            self.queue_depth -= 1
+            self.active += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def shutdown(self):
+        """Waits for running calls to finish and stops the threads"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class ASGIApplication(object):
+    """ Serves a Distill application over ASGI
+
+    Notes:
+        Requests are routed and handled exactly as they are over
+        WSGI, using the same Request and Response objects, routes,
+        middleware and exception listeners.  Actions, middleware
+        and exception listeners may be coroutine functions, and are
+        awaited on the server's event loop.  Synchronous callables
+        are called directly on the event loop, unless they've been
+        marked with distill.decorators.blocking, in which case they
+        are run in a thread pool.  Generators returned by actions,
+        and any other streamed body, are read in the pool one chunk
+        at a time, so a slow template or file doesn't stall the
+        event loop.  The size of the pool is set by the
+        distill.asgi.thread_pool_size setting
+    """
+
+    def __init__(self, app):
+        """ Init
+
+        Args:
+            app: The Distill application to serve
+        """
+        self.app = app
+        self.pool = ThreadPool(app.settings.get('distill.asgi.thread_pool_size', 8))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+        env = environ(scope, b''.join(chunks))
+        resp = await self.handle(env)
+
+        iterable = resp.iterable
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': int(resp.status.split(' ', 1)[0]),
+                'headers': [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in resp.wsgi_headers]
+            })
+            if isinstance(iterable, list):
+                for chunk in iterable:
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+            else:
+                it = iter(iterable)
+                while True:
+                    chunk = await self.pool.run(next, it, _done)
+                    if chunk is _done:
+                        break
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+        finally:
+            if hasattr(iterable, 'close'):
+                await self.pool.run(iterable.close)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def handle(self, env):
+        """ Handles a request, returning the finalized response
+
+        Notes:
+            Unlike the WSGI interface, an HTTPErrorResponse
+            without an exception listener is returned as the
+            response rather than passed on to the server
+
+        Args:
+            env: The wsgi style environ of the request
+        """
+        app = self.app
+        if app.response_cache is not None and env['REQUEST_METHOD'] in ('GET', 'HEAD'):
+            cached = app._cached_response(env)
+            if cached is not None:
+                return cached
+
+        req = Request(env, app)
+
+        if app._session_factory:
+            req.session = app._session_factory(req)
+
+        # Marks the request as blocking once its action is known
+        state = {'blocking': False}
+        iterable = None
+        try:
+            try:
+                resp = await self._request(env, req, state)
+            except HTTPErrorResponse as ex:
+                if app._exc_listeners and ex.__class__ in app._exc_listeners:
+                    res = await self._call(app._exc_listeners[ex.__class__], req, ex)
+                    resp = app._exception_result(res, ex)
+                else:
+                    resp = ex
+
+            await self._do_after(req, resp, state['blocking'])
+            app._finalize(env, resp)
+            if req.cache_policy is not None and app.response_cache is not None:
+                app.response_cache.store(env, resp, *req.cache_policy)
+            iterable = resp.iterable
+        finally:
+            _release_request(req, iterable)
+        return resp
+
+    async def _request(self, env, req, state):
+        resp = Response()
+
+        await self._do_before(req, resp)
+
+        action = self.app._resolve(req, env)
+        state['blocking'] = is_blocking(action)
+        res = await self._call(action, req, resp)
+        if isgenerator(res):
+            resp.body = await self.pool.run(primed, res)
+            return resp
+        return self.app._action_result(res, resp)
+
+    async def _call(self, func, *args, blocking=False):
+        """Calls func, running it in the pool if it is blocking"""
+        if (blocking or is_blocking(func)) and not iscoroutinefunction(func):
+            return await maybe_await(await self.pool.run(func, *args))
+        return await maybe_await(func(*args))
+
+    async def _do_before(self, req, resp):
+        for f in self.app._before:
+            await self._call(f, req, resp)
+
+    async def _do_after(self, req, resp, blocking):
+        for f in self.app._after:
+            await self._call(f, req, resp, blocking=blocking)
+
+        for f in req.resp_callbacks:
+            await self._call(f, req, resp, blocking=blocking)
+
+
+def environ(scope, body):
+    """ Builds a wsgi style environ from an ASGI connection scope
+
+    Notes:
+        The path is encoded the way PEP 3333 requires, so actions
+        see the same PATH_INFO under ASGI as they do under WSGI
+
+    Args:
+        scope: The ASGI connection scope
+        body: The complete request body
+    """
+    server = scope.get('server') or ('localhost', 80)
+    env = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{0}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+    if scope.get('client'):
+        env['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            env[name] = value
+            continue
+        name = 'HTTP_' + name
+        if name in env:
+            value = env[name] + ',' + value
+        env[name] = value
+    return env
+
+
+def wrap_before(method, action):
+    """Returns a coroutine function calling method then awaiting action"""
+    @wraps(action)
+    async def call(*args):
+        if len(args) == 2:
+            await maybe_await(method(*args))
+        else:
+            await maybe_await(method(args[1], args[2]))
+        return await action(*args)
+    return call
+
+
+def wrap_after(method, action):
+    """Returns a coroutine function awaiting action then calling method"""
+    @wraps(action)
+    async def call(*args):
+        res = await action(*args)
+        if len(args) == 2:
+            await maybe_await(method(*args))
+        else:
+            await maybe_await(method(args[1], args[2]))
+        return res
+    return call
+
+
+def wrap_check(check, action):
+    """Returns a coroutine function returning check's result, or awaiting action when it is None"""
+    @wraps(action)
+    async def call(*args):
+        res = check(args)
+        if res is not None:
+            return res
+        return await action(*args)
+    return call
+
+
+def wrap_render(method, render):
+    """Returns a coroutine function awaiting method and rendering its result"""
+    @wraps(method)
+    async def call(*args, **kwargs):
+        data = await method(*args, **kwargs)
+        return render(data, args)
+    return call
@@ -0,0 +1,50 @@
+import threading
+
+
+class BufferPool(object):
+    """ A thread safe pool of reusable bytearrays
+
+    Notes:
+        Used by Request to read request bodies without allocating
+        a new buffer for every request.  Buffers are allocated in
+        powers of two, so a buffer can be reused for any body up to
+        its size.  Buffers larger than max_size are never pooled
+    """
+
+    def __init__(self, size=8, max_size=16777216, min_size=65536):
+        """ Init
+
+        Kwargs:
+            size: Maximum number of idle buffers to keep
+            max_size: Largest buffer to keep in the pool
+            min_size: Smallest buffer to allocate
+        """
+        self.size = size
+        self.max_size = max_size
+        self.min_size = min_size
+        self._buffers = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        """Returns a bytearray of at least size bytes"""
+        if size > self.max_size:
+            return bytearray(size)
+        with self._lock:
+            for i, buf in enumerate(self._buffers):
+                if len(buf) >= size:
+                    return self._buffers.pop(i)
+        alloc = self.min_size
+        while alloc < size:
+            alloc *= 2
+        return bytearray(alloc)
+
+    def release(self, buf):
+        """Returns buf to the pool, once nothing else uses it"""
+        if len(buf) > self.max_size:
+            return
+        with self._lock:
+            if len(self._buffers) < self.size:
+                self._buffers.append(buf)
+
+    def __len__(self):
+        return len(self._buffers)
@@ -0,0 +1,434 @@
+import binascii
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """ A thread safe, size bounded least recently used cache
+
+    Notes:
+        Once the cache holds size entries, storing a new entry
+        evicts the entry that was used least recently.  The number
+        of cache hits and misses are available as hits and misses
+    """
+
+    def __init__(self, size):
+        """ Init
+
+        Args:
+            size: Maximum number of entries to store
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, marking it as recently used"""
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores value in the cache, evicting the oldest entry if needed"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Removes all entries from the cache"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class MemoryCache(object):
+    """ A thread safe in memory cache bounded by size in bytes
+
+    Notes:
+        Entries expire after their ttl, and once the entries
+        stored add up to more than max_bytes, the least recently
+        used entries are evicted.  Pinned entries are kept apart,
+        they never expire, aren't evicted and aren't counted in
+        max_bytes.  Besides hits and misses, the number of
+        evictions and the bytes stored are available
+    """
+
+    def __init__(self, max_bytes=67108864):
+        """ Init
+
+        Kwargs:
+            max_bytes: Maximum total size of the stored entries
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the value stored for key, unless it has expired"""
+        now = time.time()
+        with self._lock:
+            try:
+                expires, size, value = self._data.pop(key)
+            except KeyError:
+                if key in self._pinned:
+                    self.hits += 1
+                    return self._pinned[key]
+                self.misses += 1
+                return default
+            if expires is not None and expires <= now:
+                self.bytes -= size
+                self.misses += 1
+                return default
+            self._data[key] = (expires, size, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size, ttl=None, pin=False):
+        """ Stores value for ttl seconds
+
+        Notes:
+            Values larger than max_bytes aren't stored, unless
+            they're pinned
+
+        Args:
+            key: The key to store value under
+            value: The value to store
+            size: The size of value in bytes
+
+        Kwargs:
+            ttl: Seconds before the value expires, None to never expire
+            pin: Keep the value until it is replaced or deleted,
+                 ignoring ttl
+        """
+        with self._lock:
+            self._store(key, value, size, ttl, pin)
+
+    def add(self, key, value, size, ttl=None, pin=False):
+        """ Stores value like set, unless a value is already stored for key
+
+        Notes:
+            Returns True if value was stored.  Checking for the
+            key and storing the value happen under one lock
+        """
+        now = time.time()
+        with self._lock:
+            if key in self._pinned:
+                return False
+            old = self._data.get(key)
+            if old is not None and (old[0] is None or old[0] > now):
+                return False
+            return self._store(key, value, size, ttl, pin)
+
+    def _store(self, key, value, size, ttl, pin):
+        """Stores a value, the lock must be held"""
+        self._remove(key)
+        if pin:
+            self._pinned[key] = value
+            return True
+        if size > self.max_bytes:
+            return False
+        expires = time.time() + ttl if ttl is not None else None
+        self._data[key] = (expires, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _) = self._data.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+        return True
+
+    def _remove(self, key):
+        self._pinned.pop(key, None)
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+
+    def delete(self, key):
+        """Removes the value stored for key"""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """Removes all entries from the cache"""
+        with self._lock:
+            self._data.clear()
+            self._pinned.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data) + len(self._pinned)
+
+    def __contains__(self, key):
+        return key in self._data or key in self._pinned
+
+
+class CachedResponse(object):
+    """ A finalized response stored in a ResponseCache
+
+    Notes:
+        Has the status, wsgi_headers and iterable of a finalized
+        Response, so it can be sent the same way
+    """
+
+    def __init__(self, status, wsgi_headers, body):
+        self.status = status
+        self.wsgi_headers = wsgi_headers
+        self.body = body
+        self.headers = dict(wsgi_headers)
+
+    @property
+    def iterable(self):
+        return [self.body]
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(k) + len(str(v)) for k, v in self.wsgi_headers)
+
+
+def _generation(backend, key):
+    """ Returns the current generation stored under key, starting one if there is none
+
+    Notes:
+        Caches sharing a backend prefix their keys with their
+        generation, so one of them is cleared by starting a new
+        generation rather than by clearing the whole backend.
+        A generation is only started with the backend's add, so
+        when several threads or processes find none, they all end
+        up using the one which was stored first.  Generations are
+        pinned, so filling the backend doesn't evict them
+    """
+    generation = backend.get(key)
+    if generation is None:
+        generation = binascii.hexlify(os.urandom(8)).decode('ascii')
+        if not backend.add(key, generation, len(generation), pin=True):
+            # Someone else started one first, or the backend is full
+            generation = backend.get(key, generation)
+    return generation
+
+
+def _next_generation(backend, key):
+    """Starts a new generation under key, so the keys of the previous one can't be reached"""
+    generation = binascii.hexlify(os.urandom(8)).decode('ascii')
+    backend.set(key, generation, len(generation), pin=True)
+    return generation
+
+
+class ResponseCache(object):
+    """ Caches finalized responses of GET and HEAD requests
+
+    Notes:
+        Responses are cached by scheme, host, script name, path and
+        query string, and by the value of each request header they
+        vary on.  Those headers are the ones given when the response
+        was stored, along with any listed in the response's own Vary
+        header, so the headers a path varies on are stored separately
+        from the responses, in the same backend.  Only 200 responses
+        with a body, without Set-Cookie and not marked private or
+        no-store are stored.
+
+        Requests carrying a Cookie or Authorization header are
+        neither stored nor answered from the cache, unless the
+        response varies on that header.
+
+        Keys are prefixed with a generation kept in the backend,
+        clear starts a new one, so the backend can be shared with
+        sessions or other caches.  Entries of an old generation
+        are evicted as the backend fills up
+
+        The number of hits, misses and stored responses are
+        available as hits, misses and stores
+    """
+
+    def __init__(self, backend=None):
+        """ Init
+
+        Kwargs:
+            backend: A MemoryCache, or anything with its get, set,
+                     add, delete and clear methods, such as a
+                     SharedMemoryCache Default: MemoryCache()
+        """
+        self.backend = backend if backend is not None else MemoryCache()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _primary_key(self, env):
+        return self._path_key(env.get('PATH_INFO') or '/', env.get('QUERY_STRING') or '')
+
+    def _path_key(self, path, query):
+        return 'distill.vary', _generation(self.backend, 'distill.response_cache'), path, query
+
+    @staticmethod
+    def _key(primary, record, env):
+        vary, generation = record
+        return primary[1:] + (env.get('wsgi.url_scheme'), env.get('HTTP_HOST') or env.get('SERVER_NAME'),
+                              env.get('SCRIPT_NAME') or '', generation,
+                              tuple(env.get('HTTP_' + name.upper().replace('-', '_')) for name in vary))
+
+    @staticmethod
+    def _has_credentials(env, vary):
+        """Returns True if the request has credentials the response doesn't vary on"""
+        return (env.get('HTTP_COOKIE') is not None and 'cookie' not in vary) or \
+            (env.get('HTTP_AUTHORIZATION') is not None and 'authorization' not in vary)
+
+    def get(self, env):
+        """Returns the CachedResponse for a request, or None"""
+        primary = self._primary_key(env)
+        record = self.backend.get(primary)
+        if record is not None and not self._has_credentials(env, record[0]):
+            cached = self.backend.get(self._key(primary, record, env))
+            if cached is not None:
+                self.hits += 1
+                return cached
+        self.misses += 1
+        return None
+
+    def store(self, env, resp, ttl, vary=()):
+        """ Stores a finalized response
+
+        Notes:
+            Returns True if the response was stored
+
+        Args:
+            env: The wsgi environ of the request
+            resp: The finalized response
+            ttl: Seconds to cache the response for
+
+        Kwargs:
+            vary: Request headers, besides the response's Vary
+                  header, that the response depends on
+        """
+        if not resp.status.startswith('200') or not isinstance(resp.iterable, list):
+            return False
+        headers = resp.wsgi_headers
+        vary = [name.lower() for name in vary]
+        for name, value in headers:
+            name = name.lower()
+            if name == 'set-cookie':
+                return False
+            elif name == 'cache-control' and ('private' in value or 'no-store' in value):
+                return False
+            elif name == 'vary':
+                for header in value.split(','):
+                    header = header.strip().lower()
+                    if header == '*':
+                        return False
+                    if header and header not in vary:
+                        vary.append(header)
+        if self._has_credentials(env, vary):
+            return False
+
+        primary = self._primary_key(env)
+        vary = tuple(sorted(vary))
+        record = self.backend.get(primary)
+        if record is None or record[0] != vary:
+            # Responses stored under a previous record can't be reached anymore
+            record = (vary, binascii.hexlify(os.urandom(8)).decode('ascii'))
+            self.backend.set(primary, record, len(repr(record)))
+        cached = CachedResponse(resp.status, headers, b''.join(resp.iterable))
+        self.backend.set(self._key(primary, record, env), cached, cached.size, ttl)
+        self.stores += 1
+        return True
+
+    def invalidate(self, path, query=''):
+        """Invalidates every cached response for a path and query string, on any host"""
+        self.backend.delete(self._path_key(path, query))
+
+    def clear(self):
+        """Removes every cached response, leaving anything else in the backend"""
+        _next_generation(self.backend, 'distill.response_cache')
+
+
+class FragmentCache(object):
+    """ Caches the rendered output of template blocks
+
+    Notes:
+        Fragments are cached by the template's name and the key
+        given in the template, so the same key can be used in
+        different templates.  Mako templates rendered by the
+        RenderFactory cache a block with the cached attribute:
+
+            <%block name="nav" cached="True" cache_key="nav" cache_timeout="60">
+
+        Keys are also prefixed with the cache's namespace, so the
+        fragment caches of several applications can share a backend
+        without seeing each other's fragments.  Like a ResponseCache,
+        keys are prefixed with a generation kept in the backend, so
+        clearing the cache leaves anything else stored in a shared
+        backend.  The number of hits and misses are available as
+        hits and misses
+    """
+
+    def __init__(self, backend=None, ttl=None, namespace=''):
+        """ Init
+
+        Kwargs:
+            backend: A MemoryCache, or anything with its get, set,
+                     add, delete and clear methods, such as a
+                     SharedMemoryCache Default: MemoryCache()
+            ttl: Seconds to cache fragments which don't set a
+                 cache_timeout for, None to cache them until evicted
+            namespace: Separates these fragments from those of other
+                       caches using the same backend
+        """
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template, key, default=None):
+        """Returns the cached output of a fragment, or default"""
+        value = self.backend.get(self._key(template, key))
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, template, key, value, ttl=None):
+        """ Caches the output of a fragment
+
+        Args:
+            template: The name of the template the fragment is in
+            key: The fragment's key
+            value: The rendered fragment
+
+        Kwargs:
+            ttl: Seconds to cache the fragment for, Default: self.ttl
+        """
+        size = len(value) if isinstance(value, bytes) else len(value.encode('utf-8'))
+        self.backend.set(self._key(template, key), value, size, ttl if ttl is not None else self.ttl)
+
+    def invalidate(self, template, key):
+        """Removes a fragment from the cache, so it is rendered again"""
+        self.backend.delete(self._key(template, key))
+
+    def clear(self):
+        """Removes every cached fragment, leaving anything else in the backend"""
+        _next_generation(self.backend, ('distill.fragment_cache', self.namespace))
+
+    def _key(self, template, key):
+        return ('distill.fragment', self.namespace, _generation(self.backend, ('distill.fragment_cache', self.namespace)),
+                template, key)
@@ -0,0 +1,188 @@
+""" Response compression
+
+Notes:
+    Compression is enabled with the distill.compression.enabled
+    setting, and is applied to each response just before it is
+    finalized.  Bodies, files and streamed bodies are all compressed,
+    files and streams incrementally as they are sent
+"""
+import zlib
+from distill.response import FileIterable
+
+DEFAULT_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                 'application/xhtml+xml', 'image/svg+xml', '+json', '+xml')
+
+
+def negotiate(accept_encoding):
+    """ Returns the encoding to use for an Accept-Encoding header
+
+    Notes:
+        Returns gzip or deflate, preferring gzip when the client
+        accepts both equally, or None if the client accepts neither
+
+    Args:
+        accept_encoding: The value of the Accept-Encoding header
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(','):
+        params = item.split(';')
+        name = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    if 'x-gzip' in qualities and 'gzip' not in qualities:
+        qualities['gzip'] = qualities['x-gzip']
+
+    best, best_quality = None, 0.0
+    for encoding in ('gzip', 'deflate'):
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressobj(encoding, level):
+    """Returns a zlib compressor producing gzip or deflate data"""
+    if encoding == 'gzip':
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS)
+
+
+class CompressedStream(object):
+    """ Compresses an iterable of chunks as it is consumed
+
+    Notes:
+        Each chunk is flushed as it is compressed, so the client
+        receives data as soon as the underlying iterable produces it.
+        Closing the stream closes the underlying iterable
+    """
+
+    def __init__(self, chunks, encoding, level):
+        self.chunks = chunks
+        self._iter = iter(chunks)
+        self._compressor = compressobj(encoding, level)
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self._done:
+            try:
+                chunk = next(self._iter)
+            except StopIteration:
+                self._done = True
+                return self._compressor.flush()
+            if not isinstance(chunk, bytes) and hasattr(chunk, 'encode'):
+                chunk = chunk.encode('utf-8')
+            if not len(chunk):
+                continue
+            data = self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                return data
+        raise StopIteration()
+
+    next = __next__
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+class Compressor(object):
+    """ Compresses responses the client accepts compressed
+
+    Notes:
+        Only responses with a compressible Content-Type are
+        compressed, and bodies or files known to be smaller than
+        min_size are sent as they are.  Responses which already
+        have a Content-Encoding are never compressed again
+    """
+
+    def __init__(self, level=6, min_size=1024, types=DEFAULT_TYPES, block_size=8192):
+        """ Init
+
+        Kwargs:
+            level: zlib compression level Default: 6
+            min_size: Smallest body to compress Default: 1024
+            types: Compressible content types, a type is compressible
+                   if it starts with, or ends with, any of them
+            block_size: Size of the blocks files are read in Default: 8192
+        """
+        self.level = level
+        self.min_size = min_size
+        self.types = tuple(types)
+        self.block_size = block_size
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Returns a Compressor configured by the distill.compression.* settings"""
+        return cls(level=settings.get('distill.compression.level', 6),
+                   min_size=settings.get('distill.compression.min_size', 1024),
+                   types=settings.get('distill.compression.types', DEFAULT_TYPES))
+
+    def compressible(self, content_type):
+        """Returns True if responses of content_type should be compressed"""
+        if not content_type:
+            return False
+        content_type = content_type.split(';', 1)[0].strip().lower()
+        return content_type.startswith(self.types) or content_type.endswith(self.types)
+
+    def compress(self, env, resp):
+        """ Compresses resp if the request accepts a compressed response
+
+        Notes:
+            Returns True if the response was compressed
+
+        Args:
+            env: The wsgi environ of the request
+            resp: The response, before it has been finalized
+        """
+        status = resp.status[:3]
+        if status in ('204', '206', '304') or status[0] == '1' or 'Content-Encoding' in resp.headers:
+            return False
+        if not self.compressible(resp.headers.get('Content-Type')):
+            return False
+
+        vary = resp.headers.get('Vary')
+        if not vary:
+            resp.headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            resp.headers['Vary'] = vary + ', Accept-Encoding'
+
+        encoding = negotiate(env.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return False
+
+        body = resp.body
+        if isinstance(body, (bytes, str)) or (body is not None and not hasattr(body, '__iter__')):
+            if not body:
+                return False
+            if not isinstance(body, bytes):
+                body = body.encode('utf-8') if hasattr(body, 'encode') else str(body).encode('utf-8')
+            if len(body) < self.min_size:
+                return False
+            compressor = compressobj(encoding, self.level)
+            resp.body = compressor.compress(body) + compressor.flush()
+        elif body is not None:
+            resp.body = CompressedStream(body, encoding, self.level)
+            resp.headers.pop('Content-Length', None)
+        elif resp.file:
+            if resp.file_len is not None and resp.file_len < self.min_size:
+                return False
+            resp.body = CompressedStream(FileIterable(resp.file, self.block_size), encoding, self.level)
+            resp.file = None
+            resp.file_len = None
+            resp.headers.pop('Content-Length', None)
+        else:
+            return False
+        resp.headers['Content-Encoding'] = encoding
+        return True
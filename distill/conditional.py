@@ -0,0 +1,117 @@
+""" ETags and conditional requests
+
+Notes:
+    GET and HEAD requests carrying If-None-Match or If-Modified-Since
+    are answered with a bodyless 304 Not Modified when the response's
+    ETag or Last-Modified header shows the client's copy is current.
+    ETags are compared weakly, as RFC 7232 requires for If-None-Match
+"""
+import hashlib
+import os
+from email.utils import formatdate, mktime_tz, parsedate_tz
+
+try:  # pragma: no cover
+    hashlib.blake2b
+except AttributeError:  # pragma: no cover
+    def _digest(data):
+        return hashlib.md5(data).hexdigest()
+else:
+    def _digest(data):
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# Headers a 304 response must not carry, since it has no body
+ENTITY_HEADERS = ('Content-Type', 'Content-Length', 'Content-Encoding', 'Content-Range', 'Transfer-Encoding')
+
+
+def quote_etag(value, weak=False):
+    """Returns value as an ETag header value, quoting it if needed"""
+    if not (value.startswith('"') or value.startswith('W/"')):
+        value = '"{0}"'.format(value)
+    if weak and not value.startswith('W/'):
+        value = 'W/' + value
+    return value
+
+
+def http_date(timestamp):
+    """Returns an HTTP date for a unix timestamp"""
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    """Returns the unix timestamp of an HTTP date, or None if it is invalid"""
+    parsed = parsedate_tz(value) if value else None
+    if parsed is None:
+        return None
+    return mktime_tz(parsed)
+
+
+def body_etag(body):
+    """Returns a strong ETag for a response body"""
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    return '"{0}"'.format(_digest(body))
+
+
+def file_etag(file):
+    """ Returns a weak ETag and the modification time of a file
+
+    Notes:
+        The ETag is built from the file's size and modification
+        time, so the file doesn't need to be read.  Returns None
+        for file-like objects which aren't backed by a real file
+    """
+    try:
+        st = os.fstat(file.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None, None
+    return 'W/"{0:x}-{1:x}"'.format(int(st.st_mtime * 1000000), st.st_size), st.st_mtime
+
+
+def etag_matches(if_none_match, etag):
+    """Returns True if etag is in the If-None-Match header, using weak comparison"""
+    if if_none_match.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def not_modified(env, resp):
+    """ Returns True if the client's cached copy of resp is current
+
+    Notes:
+        If-None-Match takes precedence over If-Modified-Since,
+        which is only used when the request has no If-None-Match
+    """
+    if env.get('REQUEST_METHOD') not in ('GET', 'HEAD') or not resp.status.startswith('200'):
+        return False
+
+    if_none_match = env.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etag = resp.headers.get('ETag')
+        return etag is not None and etag_matches(if_none_match, etag)
+
+    if_modified_since = parse_http_date(env.get('HTTP_IF_MODIFIED_SINCE'))
+    last_modified = parse_http_date(resp.headers.get('Last-Modified'))
+    if if_modified_since is None or last_modified is None:
+        return False
+    return last_modified <= if_modified_since
+
+
+def make_not_modified(resp):
+    """Turns resp into a bodyless 304 Not Modified response"""
+    resp.status = '304 Not Modified'
+    if hasattr(resp.body, 'close'):
+        resp.body.close()
+    if resp.file is not None and hasattr(resp.file, 'close'):
+        resp.file.close()
+    resp.body = None
+    resp.file = None
+    resp.file_len = None
+    for header in ENTITY_HEADERS:
+        resp.headers.pop(header, None)
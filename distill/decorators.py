@@ -1,8 +1,15 @@
 from functools import wraps
+from distill.conditional import etag_matches, quote_etag
+from distill.helpers import iscoroutinefunction
+from distill.response import Response
 
 
 def before(method):
     def _do(action):
+        if iscoroutinefunction(action):
+            from distill.asgi import wrap_before
+            return wrap_before(method, action)
+
         @wraps(action)
         def call(*args):
             if len(args) == 2:
@@ -16,6 +23,10 @@ def before(method):
 
 def after(method):
     def _do(action):
+        if iscoroutinefunction(action):
+            from distill.asgi import wrap_after
+            return wrap_after(method, action)
+
         @wraps(action)
         def call(*args):
             res = action(*args)
@@ -26,3 +37,94 @@ def after(method):
             return res
         return call
     return _do
+
+
+def etag(method, weak=False):
+    """ Supplies the ETag of an action's response before the action runs
+
+    Notes:
+        method is called with the request and should cheaply
+        return the ETag the response will have, for example from
+        a version number or update time, or None if it can't.  When
+        the request's If-None-Match matches, a 304 Not Modified is
+        returned without calling the action, otherwise the ETag is
+        set on the action's response
+
+    Args:
+        method: Function returning the ETag for a request
+
+    Kwargs:
+        weak: Mark the ETag as weak Default: False
+    """
+    def _check(args):
+        request, response = args[-2], args[-1]
+        value = method(request)
+        if value is None:
+            return None
+        value = quote_etag(str(value), weak)
+        if_none_match = request.env.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and request.method in ('GET', 'HEAD') and etag_matches(if_none_match, value):
+            return Response('304 Not Modified', {'ETag': value})
+        response.headers['ETag'] = value
+        return None
+
+    def _do(action):
+        if iscoroutinefunction(action):
+            from distill.asgi import wrap_check
+            return wrap_check(_check, action)
+
+        @wraps(action)
+        def call(*args):
+            res = _check(args)
+            if res is not None:
+                return res
+            return action(*args)
+        return call
+    return _do
+
+
+def cache_response(ttl, vary=()):
+    """ Caches the responses of an action
+
+    Notes:
+        Requires the distill.response_cache.enabled setting.
+        Successful responses to GET and HEAD requests are cached by
+        path and query string for ttl seconds, and served from the
+        cache without routing the request or calling the action.
+        Responses that depend on a request header, such as Cookie
+        or Accept-Language, must list it in vary.  An action can
+        skip caching a response by setting request.cache_policy
+        to None
+
+    Args:
+        ttl: Seconds to cache responses for
+
+    Kwargs:
+        vary: Request headers the response depends on
+    """
+    def _do(action):
+        action._distill_cache = (ttl, tuple(vary))
+        return action
+    return _do
+
+
+def blocking(obj):
+    """ Marks an action, controller or middleware as blocking
+
+    Notes:
+        When the application is served over ASGI, blocking
+        callables are run in the application's thread pool rather
+        than on the event loop.  Marking an action or controller
+        also runs the after middleware and response callbacks of
+        its requests in the pool.  Before middleware is called
+        before the route is known, so it is only run in the pool
+        when the middleware itself is marked.  Over WSGI the
+        marker has no effect
+    """
+    obj._distill_blocking = True
+    return obj
+
+
+def is_blocking(obj):
+    """Returns True if obj has been marked as blocking"""
+    return getattr(obj, '_distill_blocking', False)
@@ -0,0 +1,161 @@
+""" Converting objects to JSON serializable values
+
+Notes:
+    Objects are converted by a function looked up by their type,
+    which is found once per type and cached.  Classes can provide
+    a json(request) method, list their attributes in __json_fields__,
+    or have a function registered for them with register
+"""
+import keyword
+import re
+import threading
+
+_NATIVE = frozenset([dict, list, tuple, str, int, float, bool, type(None)])
+try:  # pragma: no cover
+    _NATIVE = _NATIVE | frozenset([unicode, long])
+except NameError:  # pragma: no cover
+    pass
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def compile_fields(fields):
+    """ Returns a function converting an object to a dict of its fields
+
+    Notes:
+        The function is generated for the fields, so it creates
+        the dict with a single literal rather than a loop.  Fields
+        which can't be written as obj.field, such as keywords, are
+        read with getattr instead
+
+    Args:
+        fields: The names of the attributes to convert
+    """
+    fields = tuple(fields)
+    if not all(_IDENTIFIER.match(field) and not keyword.iskeyword(field) for field in fields):
+        return lambda obj, request: dict((field, getattr(obj, field)) for field in fields)
+    source = 'def encode(obj, request):\n    return {{{0}}}\n'.format(
+        ', '.join('{0!r}: obj.{0}'.format(field) for field in fields))
+    namespace = {}
+    exec(source, namespace)
+    return namespace['encode']
+
+
+def _call_json(obj, request):
+    return obj.json(request)
+
+
+def _to_list(obj, request):
+    return list(obj)
+
+
+def _is_iterator(cls):
+    """Returns True for iterators and generators, but not files"""
+    return (hasattr(cls, '__next__') or hasattr(cls, 'next')) and not hasattr(cls, 'read')
+
+
+class JSONEncoders(object):
+    """ A registry of functions converting objects to JSON serializable values
+
+    Notes:
+        A type is converted by the function registered for it or
+        its closest base class, then by its __json_fields__, then
+        by its json(request) method.  Iterators and generators
+        are converted to lists.  The function found is cached for
+        each type, so it is only looked up once
+    """
+
+    def __init__(self):
+        self._registered = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def register(self, cls, func):
+        """ Registers the function converting instances of cls
+
+        Args:
+            cls: The class to convert, including its subclasses
+            func: Callable taking the object and the current
+                  request, returning a JSON serializable value
+        """
+        with self._lock:
+            self._registered[cls] = func
+            self._cache = {}
+
+    def encoder(self, cls):
+        """Returns the function converting instances of cls, or None"""
+        try:
+            return self._cache[cls]
+        except KeyError:
+            pass
+        func = None
+        for base in getattr(cls, '__mro__', (cls,)):
+            if base in self._registered:
+                func = self._registered[base]
+                break
+        else:
+            if getattr(cls, '__json_fields__', None) is not None:
+                func = compile_fields(cls.__json_fields__)
+            elif hasattr(cls, 'json'):
+                func = _call_json
+            elif _is_iterator(cls):
+                func = _to_list
+        self._cache[cls] = func
+        return func
+
+    def default(self, request):
+        """ Returns a default hook for json.dumps
+
+        Notes:
+            Objects of a type without an encoder are still
+            converted if they have a json method of their own
+        """
+        cache = self._cache
+
+        def default(obj):
+            func = cache.get(type(obj)) or self.encoder(type(obj))
+            if func is None:
+                if hasattr(obj, 'json'):
+                    return obj.json(request)
+                raise TypeError('%r is not JSON serializable' % obj)
+            return func(obj, request)
+        return default
+
+    def prepare(self, data, request):
+        """ Converts the objects of homogeneous lists ahead of serializing
+
+        Notes:
+            Lists of objects of one type, either the data itself
+            or the values of a dict, are converted with a single
+            lookup instead of calling the default hook for every
+            item.  Items of any other type are left for the hook
+        """
+        if isinstance(data, list):
+            return self._prepare_list(data, request)
+        elif isinstance(data, dict):
+            prepared = None
+            for key, value in data.items():
+                if isinstance(value, list):
+                    converted = self._prepare_list(value, request)
+                    if converted is not value:
+                        if prepared is None:
+                            prepared = dict(data)
+                        prepared[key] = converted
+            if prepared is not None:
+                return prepared
+        return data
+
+    def _prepare_list(self, items, request):
+        if not items:
+            return items
+        cls = type(items[0])
+        if cls in _NATIVE:
+            return items
+        func = self.encoder(cls)
+        if func is None:
+            return items
+        return [func(item, request) if type(item) is cls else item for item in items]
+
+
+encoders = JSONEncoders()
+register = encoders.register
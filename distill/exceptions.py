@@ -51,6 +51,11 @@ class HTTPNotAcceptable(HTTPErrorResponse):
         super(HTTPNotAcceptable, self).__init__("406 Not Acceptable", title, description)
 
 
+class HTTPRequestEntityTooLarge(HTTPErrorResponse):
+    def __init__(self, title="413 Request Entity Too Large", description="Request body is too large"):
+        super(HTTPRequestEntityTooLarge, self).__init__("413 Request Entity Too Large", title, description)
+
+
 class HTTPInternalServerError(HTTPErrorResponse):
     def __init__(self, title="500 Internal Server Error", description="An error has occurred processing your request"):
         super(HTTPInternalServerError, self).__init__("500 Internal Server Error", title, description)
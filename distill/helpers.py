@@ -4,6 +4,15 @@
 import re
 import time
 from distill import PY2, PY3
+try:  # pragma: no cover
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
+try:  # pragma: no cover
+    from inspect import iscoroutinefunction
+except ImportError:  # pragma: no cover
+    def iscoroutinefunction(func):
+        return False
 
 
 class cached_property(object):  # pragma: no cover
@@ -119,6 +128,238 @@ def url_decode(string):
     return decoded_uri
 
 
+_ESCAPE = re.compile('%([0-9a-fA-F]{2})')
+# Escapes which decode to a delimiter, so they have to be decoded after splitting
+_SPLIT_ESCAPES = re.compile(b'%(?:26|3[dD])')
+
+
+def unquote_bytes(data):
+    """ Decodes the percent escapes and plus signs in data
+
+    Notes:
+        The escapes are decoded together with bytearray.fromhex,
+        malformed escapes are left as they are
+
+    Args:
+        data: The bytes to be decoded
+    """
+    if b'+' in data:
+        data = data.replace(b'+', b' ')
+    if b'%' not in data:
+        return data
+    return _unquote(data)
+
+
+def _unquote(data):
+    # Split as latin-1 text, the digits of every escape are decoded with a
+    # single fromhex, and the list of the decoded characters replaces them
+    parts = _ESCAPE.split(data.decode('latin-1'))
+    parts[1::2] = bytearray.fromhex(str(''.join(parts[1::2]))).decode('latin-1')
+    return ''.join(parts).encode('latin-1')
+
+
+def decode_query(data, max_fields=None, charset='utf-8'):
+    """ Parses a query string or url encoded form into a MultiDict
+
+    Notes:
+        Keys and values are both decoded, and fields without
+        a value are kept with an empty value.  Raises ValueError
+        if there are more than max_fields fields.
+
+        Unless an escaped & or = would change how it is split,
+        the query is unquoted and decoded as a whole before it
+        is split into fields
+
+    Args:
+        data: The query string, as bytes or a native string
+
+    Kwargs:
+        max_fields: The maximum number of fields, or None
+        charset: The encoding of the decoded keys and values
+    """
+    if not isinstance(data, bytes):
+        try:
+            data = data.encode('latin-1')
+        except UnicodeEncodeError:
+            data = data.encode('utf-8')
+
+    if b'+' in data:
+        data = data.replace(b'+', b' ')
+    if b'%' in data:
+        if _SPLIT_ESCAPES.search(data) is not None:
+            return _decode_fields(data, max_fields, charset)
+        data = _unquote(data)
+    fields = data.decode(charset, 'replace').split('&')
+    if max_fields is not None and len(fields) > max_fields:
+        _check_fields(fields, max_fields)
+
+    params = MultiDict()
+    multi = params._multi
+    setitem = dict.__setitem__
+    for field in fields:
+        if not field:
+            continue
+        key, _, value = field.partition('=')
+        if key in params:
+            if key in multi:
+                multi[key].append(value)
+            else:
+                multi[key] = [params[key], value]
+        setitem(params, key, value)
+    return params
+
+
+def _decode_fields(data, max_fields, charset):
+    """Decodes a query with escaped delimiters, unquoting each field on its own"""
+    fields = data.split(b'&')
+    if max_fields is not None and len(fields) > max_fields:
+        _check_fields(fields, max_fields)
+
+    params = MultiDict()
+    for field in fields:
+        if not field:
+            continue
+        key, _, value = field.partition(b'=')
+        key = (_unquote(key) if b'%' in key else key).decode(charset, 'replace')
+        value = (_unquote(value) if b'%' in value else value).decode(charset, 'replace')
+        params.add(key, value)
+    return params
+
+
+def _check_fields(fields, max_fields):
+    if len([f for f in fields if f]) > max_fields:
+        raise ValueError('Query has more than {0} fields'.format(max_fields))
+
+
+def best_match(accept, offers):
+    """ Returns the offered media type the Accept header prefers
+
+    Notes:
+        Returns the first offer when there is no Accept header,
+        and None when the client accepts none of the offers.
+        Offers the client accepts equally are preferred in the
+        order they are given
+
+    Args:
+        accept: The value of the Accept header, or None
+        offers: The media types which can be produced
+    """
+    if not accept:
+        return offers[0] if offers else None
+    ranges = []
+    for item in accept.split(','):
+        params = item.split(';')
+        media_range = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_range:
+            ranges.append((media_range, quality))
+
+    best, best_quality = None, 0.0
+    for offer in offers:
+        offer_type = offer.lower()
+        major = offer_type.split('/', 1)[0] + '/*'
+        # The most specific matching range determines the quality
+        quality, specificity = 0.0, -1
+        for media_range, range_quality in ranges:
+            if media_range == offer_type:
+                rank = 2
+            elif media_range == major:
+                rank = 1
+            elif media_range == '*/*':
+                rank = 0
+            else:
+                continue
+            if rank > specificity:
+                quality, specificity = range_quality, rank
+        if quality > best_quality:
+            best, best_quality = offer, quality
+    return best
+
+
+class MultiDict(dict):
+    """ A dict which may hold several values for a key
+
+    Notes:
+        Used by Request for GET and POST.  Indexing the dict
+        returns the last value given for a key, exactly like a
+        regular dict, while getall returns every value in the
+        order they were given
+    """
+
+    def __init__(self, *args, **kwargs):
+        if args or kwargs:
+            super(MultiDict, self).__init__(*args, **kwargs)
+        # Only keys with more than one value are kept here
+        self._multi = {}
+
+    def add(self, key, value):
+        """Adds value for key, keeping any existing values"""
+        if key in self:
+            if key in self._multi:
+                self._multi[key].append(value)
+            else:
+                self._multi[key] = [self[key], value]
+        dict.__setitem__(self, key, value)
+
+    def getall(self, key):
+        """Returns a list of every value for key"""
+        if key in self._multi:
+            return list(self._multi[key])
+        elif key in self:
+            return [self[key]]
+        return []
+
+    def getone(self, key):
+        """ Returns the only value for key
+
+        Notes:
+            Raises KeyError if key has no values or more than one
+        """
+        if key in self._multi:
+            raise KeyError('{0} has {1} values'.format(key, len(self._multi[key])))
+        return self[key]
+
+    def __setitem__(self, key, value):
+        self._multi.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._multi.pop(key, None)
+
+    def pop(self, key, *args):
+        self._multi.pop(key, None)
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._multi.pop(key, None)
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._multi.clear()
+
+    def copy(self):
+        copy = MultiDict(self)
+        copy._multi = dict((k, list(v)) for k, v in self._multi.items())
+        return copy
+
+    def __repr__(self):
+        return 'MultiDict({0!r})'.format([(k, v) for k in self for v in self.getall(k)])
+
+
 class CaseInsensitiveDict(dict):
     """ A case-insensitive dict object
 
@@ -176,6 +417,75 @@ class CaseInsensitiveDict(dict):
         return item.lower() in self._dict
 
 
+_MISSING = object()
+_DELETED = object()
+
+
+class CopyOnWriteDict(MutableMapping):
+    """ A writable view of another dict
+
+    Notes:
+        Used by Request for the application's settings.  Reads
+        fall through to the underlying dict, while writes and
+        deletes are stored on the view, so changes made during
+        a request never affect the application or other requests,
+        without copying every setting for each request.  As with
+        dict.copy, mutable values are shared with the underlying
+        dict rather than copied
+    """
+
+    def __init__(self, base):
+        self._base = base
+        self._local = {}
+
+    def __getitem__(self, key):
+        value = self._local.get(key, _MISSING)
+        if value is _MISSING:
+            return self._base[key]
+        elif value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._local.get(key, _MISSING)
+        if value is _MISSING:
+            return self._base.get(key, default)
+        elif value is _DELETED:
+            return default
+        return value
+
+    def __setitem__(self, key, value):
+        self._local[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._local[key] = _DELETED
+
+    def __contains__(self, key):
+        value = self._local.get(key, _MISSING)
+        if value is _MISSING:
+            return key in self._base
+        return value is not _DELETED
+
+    def __iter__(self):
+        for key in self._base:
+            if key not in self._local:
+                yield key
+        for key, value in self._local.items():
+            if value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
 def text_(s):  # pragma: no cover
     if PY3:
         if type(s) == bytes:
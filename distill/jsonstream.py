@@ -0,0 +1,161 @@
+""" Incremental parsing of large JSON documents
+
+Notes:
+    Only the top level of the document is parsed incrementally,
+    each element of a top level array, or each key/value pair of
+    a top level object, is decoded with json as soon as it has been
+    read completely.  Memory use is bounded by the size of the
+    largest element rather than the size of the document
+"""
+import codecs
+import json
+import numbers
+import re
+
+_WHITESPACE = ' \t\n\r'
+# What may be left of a number split between chunks, once its digits have been decoded
+_NUMBER_TAIL = re.compile(r'(?:\.|[eE][+-]?)\Z')
+_decoder = json.JSONDecoder()
+
+
+class _Reader(object):
+    """Buffers decoded text read from a stream"""
+
+    def __init__(self, stream, length, chunk_size, encoding):
+        self.stream = stream
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.buf = u''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=0):
+        """ Reads from the stream until at least size more characters are buffered
+
+        Notes:
+            Returns False if the stream is exhausted.  Characters
+            before pos are discarded
+        """
+        if self.eof:
+            return False
+        target = len(self.buf) - self.pos + max(size, 1)
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        while len(self.buf) < target:
+            read = self.chunk_size
+            if self.remaining is not None:
+                read = min(read, self.remaining)
+            chunk = self.stream.read(read) if read else b''
+            if self.remaining is not None:
+                self.remaining -= len(chunk)
+            if not chunk:
+                self.buf += self.decoder.decode(b'', True)
+                self.eof = True
+                return False
+            if not isinstance(chunk, bytes):
+                self.buf += chunk
+            else:
+                self.buf += self.decoder.decode(chunk)
+        return True
+
+    def skip_whitespace(self):
+        """Returns the next non whitespace character, or None at the end"""
+        while True:
+            buf = self.buf
+            pos = self.pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.fill() and self.pos >= len(self.buf):
+                return None
+
+    def expect(self, chars):
+        char = self.skip_whitespace()
+        if char is None or char not in chars:
+            raise ValueError('Expecting one of {0!r} at offset {1}'.format(chars, self.pos))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """ Decodes the next value in the buffer
+
+        Notes:
+            A value is only accepted once a character follows
+            it, since a number at the end of the buffer may
+            continue in the next chunk.  A number followed only
+            by the start of a fraction or exponent, such as 1.
+            or 1e-, is read further as well.  After a failed
+            attempt the buffer is doubled before decoding again,
+            so a large value is decoded a logarithmic number of
+            times
+        """
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.fill(len(self.buf) - self.pos):
+                    # Retry once with everything that could be read
+                    value, end = _decoder.raw_decode(self.buf, self.pos)
+                    self.pos = end
+                    return value
+                continue
+            if self.eof or (end < len(self.buf) and not (isinstance(value, numbers.Number) and
+                                                          _NUMBER_TAIL.match(self.buf, end))):
+                self.pos = end
+                return value
+            self.fill()
+
+
+def iter_json(stream, length=None, chunk_size=65536, encoding='utf-8'):
+    """ Yields the top level items of a JSON document as they are read
+
+    Notes:
+        For an array each element is yielded, for an object
+        each (key, value) pair.  Any other document is yielded
+        as a single value.  Raises ValueError if the document is
+        malformed, possibly after yielding some items
+
+    Args:
+        stream: File-like object to read the document from
+
+    Kwargs:
+        length: Number of bytes to read, or None to read to EOF
+        chunk_size: Number of bytes to read at a time
+        encoding: The encoding of the document
+    """
+    reader = _Reader(stream, length, chunk_size, encoding)
+    start = reader.skip_whitespace()
+    if start == '[':
+        reader.pos += 1
+        if reader.skip_whitespace() == ']':
+            reader.pos += 1
+        else:
+            while True:
+                yield reader.decode()
+                if reader.expect(',]') == ']':
+                    break
+    elif start == '{':
+        reader.pos += 1
+        if reader.skip_whitespace() == '}':
+            reader.pos += 1
+        else:
+            while True:
+                if reader.skip_whitespace() != '"':
+                    raise ValueError('Expecting property name at offset {0}'.format(reader.pos))
+                key = reader.decode()
+                reader.expect(':')
+                yield key, reader.decode()
+                if reader.expect(',}') == '}':
+                    break
+    else:
+        while reader.fill(reader.chunk_size):
+            pass
+        yield json.loads(reader.buf)
+        return
+
+    if reader.skip_whitespace() is not None:
+        raise ValueError('Extra data at offset {0}'.format(reader.pos))
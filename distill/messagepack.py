@@ -0,0 +1,283 @@
+""" A pure Python MessagePack encoder and decoder
+
+Notes:
+    Implements the MessagePack format, including the bin and str8
+    types, without any extension types besides passing them through
+    as ExtType.  Text is encoded as str, bytes as bin, and lists and
+    tuples as arrays.  On Python 2 a str is encoded as bin
+"""
+import struct
+from collections import namedtuple
+from distill import PY2
+
+if PY2:  # pragma: no cover
+    text_type = unicode
+    integer_types = (int, long)
+else:  # pragma: no cover
+    text_type = str
+    integer_types = (int,)
+
+ExtType = namedtuple('ExtType', 'code data')
+
+_B = struct.Struct('>B')
+_BB = struct.Struct('>BB')
+_BH = struct.Struct('>BH')
+_BI = struct.Struct('>BI')
+_BQ = struct.Struct('>BQ')
+_Bb = struct.Struct('>Bb')
+_Bh = struct.Struct('>Bh')
+_Bi = struct.Struct('>Bi')
+_Bq = struct.Struct('>Bq')
+_Bd = struct.Struct('>Bd')
+_BBb = struct.Struct('>BBb')
+_BHb = struct.Struct('>BHb')
+_BIb = struct.Struct('>BIb')
+
+_FIXINTS = [_B.pack(i) for i in range(128)]
+
+
+def _int(value):
+    if 0 <= value < 128:
+        return _FIXINTS[value]
+    elif -32 <= value < 0:
+        return _B.pack(value & 0xff)
+    elif value > 0:
+        if value <= 0xff:
+            return _BB.pack(0xcc, value)
+        elif value <= 0xffff:
+            return _BH.pack(0xcd, value)
+        elif value <= 0xffffffff:
+            return _BI.pack(0xce, value)
+        elif value <= 0xffffffffffffffff:
+            return _BQ.pack(0xcf, value)
+    elif value >= -0x80:
+        return _Bb.pack(0xd0, value)
+    elif value >= -0x8000:
+        return _Bh.pack(0xd1, value)
+    elif value >= -0x80000000:
+        return _Bi.pack(0xd2, value)
+    elif value >= -0x8000000000000000:
+        return _Bq.pack(0xd3, value)
+    raise OverflowError('Integer {0} is too large for MessagePack'.format(value))
+
+
+def _header(length, fix, fix_max, formats):
+    """Returns the header of a str, bin, array or map of length items"""
+    if fix is not None and length <= fix_max:
+        return _B.pack(fix | length)
+    code8, code16, code32 = formats
+    if code8 is not None and length <= 0xff:
+        return _BB.pack(code8, length)
+    elif length <= 0xffff:
+        return _BH.pack(code16, length)
+    elif length <= 0xffffffff:
+        return _BI.pack(code32, length)
+    raise ValueError('Object of length {0} is too large for MessagePack'.format(length))
+
+
+def _ext(code, data):
+    length = len(data)
+    fixed = {1: 0xd4, 2: 0xd5, 4: 0xd6, 8: 0xd7, 16: 0xd8}.get(length)
+    if fixed is not None:
+        return _Bb.pack(fixed, code) + data
+    elif length <= 0xff:
+        return _BBb.pack(0xc7, length, code) + data
+    elif length <= 0xffff:
+        return _BHb.pack(0xc8, length, code) + data
+    return _BIb.pack(0xc9, length, code) + data
+
+
+def packb(obj, default=None):
+    """ Returns obj encoded as MessagePack
+
+    Args:
+        obj: The object to encode
+
+    Kwargs:
+        default: Called with objects which can't be encoded,
+                 returning a value which can be
+    """
+    parts = []
+    append = parts.append
+
+    def pack(obj):
+        cls = type(obj)
+        if cls is text_type:
+            data = obj.encode('utf-8')
+            length = len(data)
+            append(_header(length, 0xa0, 31, (0xd9, 0xda, 0xdb)))
+            append(data)
+        elif cls is int or (PY2 and cls in integer_types):
+            append(_int(obj))
+        elif obj is None:
+            append(b'\xc0')
+        elif obj is True:
+            append(b'\xc3')
+        elif obj is False:
+            append(b'\xc2')
+        elif cls is float:
+            append(_Bd.pack(0xcb, obj))
+        elif cls is dict:
+            append(_header(len(obj), 0x80, 15, (None, 0xde, 0xdf)))
+            for key, value in obj.items():
+                pack(key)
+                pack(value)
+        elif cls is list or cls is tuple:
+            append(_header(len(obj), 0x90, 15, (None, 0xdc, 0xdd)))
+            for item in obj:
+                pack(item)
+        elif cls is bytes or cls is bytearray or cls is memoryview:
+            data = bytes(obj)
+            append(_header(len(data), None, 0, (0xc4, 0xc5, 0xc6)))
+            append(data)
+        elif cls is ExtType:
+            append(_ext(obj.code, bytes(obj.data)))
+        elif isinstance(obj, integer_types):
+            append(_int(obj))
+        elif isinstance(obj, float):
+            append(_Bd.pack(0xcb, obj))
+        elif isinstance(obj, text_type):
+            pack(text_type(obj))
+        elif isinstance(obj, bytes):
+            pack(bytes(obj))
+        elif isinstance(obj, dict):
+            pack(dict(obj))
+        elif isinstance(obj, (list, tuple)):
+            pack(list(obj))
+        elif default is not None:
+            pack(default(obj))
+        else:
+            raise TypeError('%r is not MessagePack serializable' % obj)
+
+    pack(obj)
+    return b''.join(parts)
+
+
+class _Unpacker(object):
+    """ Decodes a single MessagePack document from a buffer
+
+    Notes:
+        Reading past the end of the buffer raises IndexError or
+        struct.error, which unpackb reports as truncated data
+    """
+
+    def __init__(self, data):
+        if PY2:  # pragma: no cover
+            data = bytearray(data)
+        elif type(data) is not bytes:
+            data = bytes(data)
+        self.data = data
+        self.pos = 0
+
+    def _take(self, length):
+        start = self.pos
+        self.pos = end = start + length
+        if end > len(self.data):
+            raise IndexError()
+        return self.data[start:end]
+
+    def _unpack(self, fmt):
+        start = self.pos
+        self.pos = start + fmt.size
+        return fmt.unpack_from(self.data, start)[0]
+
+    def _map(self, length):
+        result = {}
+        decode = self.decode
+        for _ in range(length):
+            key = decode()
+            if type(key) is list:
+                key = tuple(key)
+            result[key] = decode()
+        return result
+
+    def _ext(self, length):
+        code = self._unpack(_SIGNED[1])
+        return ExtType(code, bytes(self._take(length)))
+
+    def decode(self):
+        data = self.data
+        pos = self.pos
+        code = data[pos]
+        pos += 1
+        self.pos = pos
+        if code <= 0x7f:
+            return code
+        elif code >= 0xe0:
+            return code - 0x100
+        elif code >= 0xa0 and code <= 0xbf:
+            end = pos + (code & 0x1f)
+            if end > len(data):
+                raise IndexError()
+            self.pos = end
+            return data[pos:end].decode('utf-8')
+        elif code <= 0x8f:
+            return self._map(code & 0x0f)
+        elif code <= 0x9f:
+            decode = self.decode
+            return [decode() for _ in range(code & 0x0f)]
+        elif code == 0xc0:
+            return None
+        elif code == 0xc2:
+            return False
+        elif code == 0xc3:
+            return True
+        elif code == 0xcc:
+            self.pos = pos + 1
+            return data[pos]
+        elif code == 0xcd:
+            self.pos = pos + 2
+            return (data[pos] << 8) | data[pos + 1]
+        elif code == 0xcb:
+            return self._unpack(_FLOAT64)
+        elif 0xcc <= code <= 0xcf:
+            return self._unpack(_UNSIGNED[1 << (code - 0xcc)])
+        elif 0xd0 <= code <= 0xd3:
+            return self._unpack(_SIGNED[1 << (code - 0xd0)])
+        elif 0xd9 <= code <= 0xdb:
+            return self._take(self._unpack(_UNSIGNED[1 << (code - 0xd9)])).decode('utf-8')
+        elif 0xc4 <= code <= 0xc6:
+            return bytes(self._take(self._unpack(_UNSIGNED[1 << (code - 0xc4)])))
+        elif code == 0xdc or code == 0xdd:
+            decode = self.decode
+            return [decode() for _ in range(self._unpack(_UNSIGNED[2 if code == 0xdc else 4]))]
+        elif code == 0xde or code == 0xdf:
+            return self._map(self._unpack(_UNSIGNED[2 if code == 0xde else 4]))
+        elif code == 0xca:
+            return self._unpack(_FLOAT32)
+        elif 0xc7 <= code <= 0xc9:
+            return self._ext(self._unpack(_UNSIGNED[1 << (code - 0xc7)]))
+        elif 0xd4 <= code <= 0xd8:
+            return self._ext(1 << (code - 0xd4))
+        raise ValueError('Invalid MessagePack type 0x{0:x} at offset {1}'.format(code, pos - 1))
+
+
+_UNSIGNED = {1: struct.Struct('>B'), 2: struct.Struct('>H'), 4: struct.Struct('>I'), 8: struct.Struct('>Q')}
+_SIGNED = {1: struct.Struct('>b'), 2: struct.Struct('>h'), 4: struct.Struct('>i'), 8: struct.Struct('>q')}
+_FLOAT32 = struct.Struct('>f')
+_FLOAT64 = struct.Struct('>d')
+
+
+def unpackb(data):
+    """ Decodes a MessagePack document
+
+    Notes:
+        Raises ValueError if the data is truncated, malformed
+        or followed by extra data.  Arrays used as map keys are
+        decoded as tuples, any other key which can't be used in
+        a dict, such as a map, is malformed data
+
+    Args:
+        data: A bytes-like object holding the document
+    """
+    unpacker = _Unpacker(data)
+    try:
+        value = unpacker.decode()
+    except (IndexError, struct.error):
+        raise ValueError('Truncated MessagePack data')
+    except (UnicodeDecodeError, RuntimeError, TypeError) as e:
+        # TypeError is raised for a map key which can't be hashed, such as a map
+        raise ValueError('Invalid MessagePack data: {0}'.format(e))
+    if unpacker.pos != len(unpacker.data):
+        raise ValueError('Extra data at offset {0}'.format(unpacker.pos))
+    return value
@@ -0,0 +1,303 @@
+""" Streaming multipart/form-data parser
+
+Notes:
+    The request body is read in fixed size chunks, so memory use
+    is bounded by the chunk size and the spool threshold rather
+    than by the size of the upload.  Form fields are kept in memory,
+    while file parts are written to a SpooledTemporaryFile, which
+    moves to disk once it grows past the spool threshold
+"""
+import re
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from distill.exceptions import HTTPBadRequest, HTTPRequestEntityTooLarge
+
+_PARAM_RE = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:\\.|[^"\\])*"|[^;]*)')
+
+
+def parse_header(value):
+    """ Parses a header such as Content-Disposition
+
+    Notes:
+        Returns the main value and a dict of its parameters,
+        with quoted parameter values unquoted
+
+    Args:
+        value: The header's value
+    """
+    main = value.split(';', 1)[0].strip().lower()
+    params = {}
+    for name, param in _PARAM_RE.findall(value):
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = re.sub(r'\\(.)', r'\1', param[1:-1])
+        params[name.lower()] = param
+    return main, params
+
+
+class MultipartPart(object):
+    """ A single part of a multipart/form-data body
+
+    Notes:
+        File parts keep their data in file, a file-like object
+        positioned at the start of the data.  For form fields value
+        is the decoded text, as it was with cgi.FieldStorage
+    """
+
+    def __init__(self, headers, spool_threshold, max_size):
+        """ Init
+
+        Args:
+            headers: Dict of the part's headers, with lowercase names
+            spool_threshold: Size at which file parts are moved to disk
+            max_size: The maximum size of the part, or None
+        """
+        self.headers = headers
+        self.size = 0
+        self.max_size = max_size
+        self._value = None
+        disposition, params = parse_header(headers.get('content-disposition', ''))
+        self.name = params.get('name')
+        self.filename = params.get('filename')
+        self.type, type_params = parse_header(headers.get('content-type', 'text/plain'))
+        self.charset = type_params.get('charset', 'utf-8')
+        if self.filename is None:
+            self.file = BytesIO()
+        else:
+            self.file = SpooledTemporaryFile(max_size=spool_threshold)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise HTTPRequestEntityTooLarge(description='Part {0} is too large'.format(self.name))
+        self.file.write(data)
+
+    def finish(self):
+        self.file.seek(0)
+        if self.filename is None:
+            data = self.file.getvalue()
+            try:
+                self._value = data.decode(self.charset, 'replace')
+            except LookupError:
+                self._value = data.decode('utf-8', 'replace')
+
+    @property
+    def value(self):
+        """Returns the text of a form field, or the contents of a file part"""
+        if self._value is not None:
+            return self._value
+        pos = self.file.tell()
+        self.file.seek(0)
+        data = self.file.read()
+        self.file.seek(pos)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartParser(object):
+    """ Parses a multipart/form-data body from a stream
+
+    Notes:
+        Both CRLF and bare LF line endings are accepted.  A
+        malformed body raises HTTPBadRequest, and exceeding any
+        of the limits raises HTTPRequestEntityTooLarge
+    """
+
+    def __init__(self, stream, boundary, content_length=None, chunk_size=65536, spool_threshold=1048576,
+                 max_part_size=16777216, max_field_size=1048576, max_body_size=33554432, max_parts=1000,
+                 max_header_size=16384):
+        """ Init
+
+        Args:
+            stream: File-like object to read the body from
+            boundary: The boundary from the Content-Type header
+
+        Kwargs:
+            content_length: Number of bytes to read, or None to read to EOF
+            chunk_size: Number of bytes to read at a time
+            spool_threshold: Size at which a file part is spooled to disk
+            max_part_size: Maximum size of any one part, None for no limit
+                           Default: 16MiB
+            max_field_size: Maximum size of a part that isn't a file
+                            Default: 1MiB
+            max_body_size: Maximum size of the entire body, None for no limit
+                           Default: 32MiB
+            max_parts: Maximum number of parts
+            max_header_size: Maximum size of the headers of a part
+        """
+        if not boundary:
+            raise HTTPBadRequest(description='Missing multipart boundary')
+        if max_body_size is not None and content_length is not None and content_length > max_body_size:
+            raise HTTPRequestEntityTooLarge()
+        if not isinstance(boundary, bytes):
+            boundary = boundary.encode('latin-1')
+        self.stream = stream
+        self.delimiter = b'--' + boundary
+        self.remaining = content_length
+        self.chunk_size = chunk_size
+        self.spool_threshold = spool_threshold
+        self.max_part_size = max_part_size
+        self.max_field_size = max_field_size
+        self.max_body_size = max_body_size
+        self.max_parts = max_parts
+        self.max_header_size = max_header_size
+        self.read_size = 0
+        self._buf = bytearray()
+        self._eof = False
+
+    def _fill(self):
+        """Reads the next chunk into the buffer, returns False at EOF"""
+        if self._eof:
+            return False
+        size = self.chunk_size
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+        chunk = self.stream.read(size) if size else b''
+        if not chunk:
+            self._eof = True
+            return False
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('latin-1')
+        if self.remaining is not None:
+            self.remaining -= len(chunk)
+        self.read_size += len(chunk)
+        if self.max_body_size is not None and self.read_size > self.max_body_size:
+            raise HTTPRequestEntityTooLarge()
+        self._buf += chunk
+        return True
+
+    def _need(self, size):
+        while len(self._buf) < size:
+            if not self._fill():
+                raise HTTPBadRequest(description='Unexpected end of multipart body')
+
+    def _readline(self):
+        buf = self._buf
+        start = 0
+        while True:
+            i = buf.find(b'\n', start)
+            if i >= 0:
+                line = bytes(buf[:i])
+                del buf[:i + 1]
+                return line[:-1] if line.endswith(b'\r') else line
+            if len(buf) > self.max_header_size:
+                raise HTTPRequestEntityTooLarge(description='Multipart headers are too large')
+            start = len(buf)
+            if not self._fill():
+                raise HTTPBadRequest(description='Unexpected end of multipart body')
+
+    def _skip_preamble(self):
+        buf = self._buf
+        delimiter = self.delimiter
+        while True:
+            if buf.startswith(delimiter):
+                del buf[:len(delimiter)]
+                return
+            i = buf.find(b'\n' + delimiter)
+            if i >= 0:
+                del buf[:i + 1 + len(delimiter)]
+                return
+            if len(buf) > len(delimiter):
+                del buf[:len(buf) - len(delimiter)]
+            if not self._fill():
+                raise HTTPBadRequest(description='Multipart boundary not found')
+
+    def _read_headers(self):
+        headers = {}
+        size = 0
+        name = None
+        while True:
+            line = self._readline()
+            if not line:
+                return headers
+            size += len(line)
+            if size > self.max_header_size:
+                raise HTTPRequestEntityTooLarge(description='Multipart headers are too large')
+            line = line.decode('utf-8', 'replace')
+            if line[0] in ' \t' and name is not None:
+                headers[name] += ' ' + line.strip()
+                continue
+            if ':' not in line:
+                raise HTTPBadRequest(description='Malformed multipart header')
+            name, value = line.split(':', 1)
+            name = name.strip().lower()
+            headers[name] = value.strip()
+
+    def _read_data(self, part):
+        buf = self._buf
+        separator = b'\n' + self.delimiter
+        start = 0
+        while True:
+            i = buf.find(separator, start)
+            if i >= 0:
+                end = i - 1 if i > 0 and buf[i - 1] == 13 else i
+                part.write(bytes(buf[:end]))
+                del buf[:i + len(separator)]
+                return
+            # Keep enough of the buffer for a separator, and the
+            # carriage return before it, split across two chunks
+            safe = len(buf) - len(separator) - 1
+            if safe > 0:
+                part.write(bytes(buf[:safe]))
+                del buf[:safe]
+            start = max(len(buf) - len(separator), 0)
+            if not self._fill():
+                raise HTTPBadRequest(description='Unexpected end of multipart body')
+
+    def __iter__(self):
+        """Yields each part of the body as it is read"""
+        self._skip_preamble()
+        count = 0
+        while True:
+            self._need(2)
+            if self._buf[:2] == b'--':
+                break
+            # Anything else after the delimiter up to the line end is padding
+            self._readline()
+
+            count += 1
+            if self.max_parts is not None and count > self.max_parts:
+                raise HTTPRequestEntityTooLarge(description='Too many multipart parts')
+
+            headers = self._read_headers()
+            part = MultipartPart(headers, self.spool_threshold, self.max_part_size)
+            if part.filename is None and self.max_field_size is not None:
+                if self.max_part_size is None or self.max_field_size < self.max_part_size:
+                    part.max_size = self.max_field_size
+            self._read_data(part)
+            part.finish()
+            yield part
+
+        # Discard the epilogue
+        while self._fill():
+            del self._buf[:]
+
+
+def parse_form(stream, content_type, content_length=None, settings=None):
+    """ Parses a multipart/form-data body into a dict
+
+    Notes:
+        Form fields map to their text value, and file parts map
+        to their MultipartPart.  The parser's limits are read
+        from the distill.multipart.* settings
+
+    Args:
+        stream: File-like object to read the body from
+        content_type: The request's Content-Type header
+        content_length: The request's Content-Length, or None
+        settings: The request's settings
+    """
+    if settings is None:
+        settings = {}
+    _, params = parse_header(content_type)
+    parser = MultipartParser(
+        stream, params.get('boundary'), content_length,
+        chunk_size=settings.get('distill.multipart.chunk_size', 65536),
+        spool_threshold=settings.get('distill.multipart.spool_threshold', 1048576),
+        max_part_size=settings.get('distill.multipart.max_part_size', 16777216),
+        max_field_size=settings.get('distill.multipart.max_field_size', 1048576),
+        max_body_size=settings.get('distill.multipart.max_body_size', 33554432),
+        max_parts=settings.get('distill.multipart.max_parts', 1000))
+    return dict((part.name, part.value if part.filename is None else part) for part in parser)
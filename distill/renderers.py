@@ -1,9 +1,215 @@
+import os
+import threading
+import time
+import warnings
 from functools import wraps
+from mako.cache import CacheImpl, register_plugin
 from mako.lookup import TemplateLookup
+from mako.runtime import Context
 from distill import PY2
 import json
-from distill.exceptions import HTTPInternalServerError
-from distill.response import Response
+from distill.helpers import iscoroutinefunction
+from distill.cache import FragmentCache, MemoryCache
+from distill.encoders import encoders as default_encoders
+from distill.shmcache import SharedMemoryCache
+from distill.exceptions import HTTPInternalServerError, HTTPNotAcceptable
+from distill.helpers import best_match
+from distill.messagepack import packb
+from distill.response import Response, is_stream
+try:  # pragma: no cover
+    from queue import Queue, Full
+except ImportError:  # pragma: no cover
+    from Queue import Queue, Full
+
+if PY2:  # pragma: no cover
+    string_types = basestring
+else:  # pragma: no cover
+    string_types = str
+
+
+class FragmentCacheImpl(CacheImpl):
+    """ Mako cache implementation storing fragments in a FragmentCache
+
+    Notes:
+        The FragmentCache is passed by the RenderFactory in the
+        lookup's cache_args, and fragments are keyed by the uri
+        of the template they are in
+    """
+
+    def get_or_create(self, key, creation_function, **kw):
+        value = self.get(key, **kw)
+        if value is None:
+            value = creation_function()
+            self.set(key, value, **kw)
+        return value
+
+    def set(self, key, value, **kw):
+        kw['fragment_cache'].set(self.cache.template.uri, key, value, kw.get('timeout'))
+
+    def get(self, key, **kw):
+        return kw['fragment_cache'].get(self.cache.template.uri, key)
+
+    def invalidate(self, key, **kw):
+        kw['fragment_cache'].invalidate(self.cache.template.uri, key)
+
+
+register_plugin('distill', __name__, 'FragmentCacheImpl')
+
+
+class _Closed(Exception):
+    """Raised in the rendering thread once the TemplateStream is closed"""
+
+
+class RenderPool(object):
+    """ A bounded pool of threads rendering TemplateStreams
+
+    Notes:
+        Threads are started as streams are submitted, up to
+        max_workers, and are then reused.  Streams submitted
+        while every thread is busy wait for a free one
+    """
+
+    def __init__(self, max_workers):
+        """ Init
+
+        Args:
+            max_workers: The maximum number of threads in the pool
+        """
+        self.max_workers = max_workers
+        self._tasks = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func):
+        """Calls func in one of the pool's threads"""
+        self._tasks.put(func)
+        with self._lock:
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            self._tasks.get()()
+
+
+_render_pool = RenderPool(16)
+
+
+class TemplateStream(object):
+    """ Renders a Mako template in chunks as it is iterated
+
+    Notes:
+        The template is rendered in a separate thread, started
+        when the first chunk is requested.  Output is collected
+        into chunks of chunk_size characters which are passed
+        through a queue of at most queue_size chunks, so a slow
+        client pauses the rendering rather than letting the
+        output pile up.  Closing the stream stops the rendering
+        at the template's next write, and so does waiting longer
+        than timeout for the client to take a chunk, so a stream
+        which is never closed can't keep its thread busy.  Threads
+        come from a RenderPool, by default one of 16 threads shared
+        by every stream.  Exceptions raised by the template are
+        raised by the iteration
+    """
+    _done = object()
+
+    def __init__(self, template, data, chunk_size=8192, queue_size=8, timeout=60, pool=None):
+        """ Init
+
+        Args:
+            template: The mako Template to render
+            data: The data to be passed to the template
+
+        Kwargs:
+            chunk_size: Characters to collect before sending a chunk
+            queue_size: Chunks which can be rendered ahead of the client
+            timeout: Seconds to wait for the client to take a chunk
+                     before rendering is abandoned
+            pool: The RenderPool to render in
+        """
+        self.template = template
+        self.data = data
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._queue = Queue(queue_size)
+        self._parts = []
+        self._size = 0
+        self._pool = pool or _render_pool
+        self._started = False
+        self._rendered = threading.Event()
+        self._closed = False
+        self._finished = False
+
+    def write(self, text):
+        """Called by the template with its output"""
+        if self._closed:
+            raise _Closed()
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if self._parts:
+            chunk = u''.join(self._parts)
+            self._parts = []
+            self._size = 0
+            self._put(chunk)
+
+    def _put(self, item):
+        deadline = time.time() + self.timeout
+        while not self._closed:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except Full:
+                if time.time() >= deadline:
+                    self._closed = True
+        raise _Closed()
+
+    def _render(self):
+        try:
+            try:
+                self.template.render_context(Context(self, **self.data))
+                self._flush()
+            except _Closed:
+                return
+            except BaseException as e:
+                self._put(e)
+                return
+            self._put(self._done)
+        except _Closed:
+            pass
+        finally:
+            self._rendered.set()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration()
+        if not self._started:
+            self._started = True
+            self._pool.submit(self._render)
+        item = self._queue.get()
+        if item is self._done:
+            self._finished = True
+            raise StopIteration()
+        if isinstance(item, BaseException):
+            self._finished = True
+            raise item
+        return item
+
+    next = __next__
+
+    def close(self):
+        self._closed = True
+        self._finished = True
 
 
 class RenderFactory(object):
@@ -15,16 +221,35 @@ class RenderFactory(object):
 
     def __init__(self, settings):
         """ Init
-         Args:
+         Notes:
+            In production mode, set by distill.production, templates
+            aren't checked for changes each time they are rendered.
+            TemplateStreams are rendered by a pool of at most
+            distill.template_stream.threads threads, Default: 16
+
+        Args:
             settings: The application's settings dict
         """
+        self.production = settings.get('distill.production', False)
+        if settings.get('distill.fragment_cache.backend') == 'shm':
+            backend = SharedMemoryCache.from_settings(settings)
+        else:
+            backend = MemoryCache(settings.get('distill.fragment_cache.max_bytes', 16777216))
+        # Applications sharing a backend are told apart by their templates
+        self.fragment_cache = FragmentCache(backend, settings.get('distill.fragment_cache.ttl'),
+                                            settings.get('distill.fragment_cache.namespace',
+                                                         settings.get('distill.document_root', '')))
+        lookup_kwargs = {'filesystem_checks': not self.production, 'cache_impl': 'distill',
+                         'cache_args': {'fragment_cache': self.fragment_cache}}
         if PY2:  # pragma: no cover
-            self._template_lookup = TemplateLookup(output_encoding='ascii')
+            self._template_lookup = TemplateLookup(output_encoding='ascii', **lookup_kwargs)
         else:  # pragma: no cover
-            self._template_lookup = TemplateLookup(input_encoding='utf-8')
+            self._template_lookup = TemplateLookup(input_encoding='utf-8', **lookup_kwargs)
         self._template_lookup.directories.append(settings.get('distill.document_root', ''))
         self._template_lookup.module_directory = settings.get('distill.document_root', '')
         self._renderers = {}
+        self._render_pool = RenderPool(settings.get('distill.template_stream.threads', 16))
+        self.compile_times = {}
 
     def __call__(self, template, data, request, response, **rkwargs):
         """ Actually render the response
@@ -38,6 +263,13 @@ class RenderFactory(object):
             data: The data to be passed to the template
             request: Current request
             response: Current response
+
+        Kwargs:
+            stream: Return a TemplateStream for Mako templates,
+                    sending the page as it is rendered
+            chunk_size: Size of the chunks of a TemplateStream
+            timeout: Seconds a TemplateStream waits for the
+                     client to take a chunk, Default: 60
         """
 
         if '.mako' == template.lower()[-5:]:
@@ -46,6 +278,10 @@ class RenderFactory(object):
 
             response.headers['Content-Type'] = 'text/html'
             data['req'] = request
+            if rkwargs.get('stream'):
+                return TemplateStream(self._template_lookup.get_template(template), data,
+                                      rkwargs.get('chunk_size', 8192), timeout=rkwargs.get('timeout', 60),
+                                      pool=self._render_pool)
             return self._template_lookup.get_template(template).render(**data)
         elif template in self._renderers:
             return self._renderers[template](data, request, response, **rkwargs)
@@ -55,21 +291,84 @@ class RenderFactory(object):
         """Adds template to the current instances renderers dict"""
         self._renderers[name] = serializer
 
+    def precompile(self):
+        """ Compiles every Mako template in the template directories
+
+        Notes:
+            Templates are otherwise compiled the first time they
+            are rendered.  Returns a dict of the seconds each
+            template took to compile, which are also kept in
+            compile_times.  Templates which were already compiled
+            aren't compiled again
+        """
+        compiled = {}
+        for directory in self._template_lookup.directories:
+            if not directory:
+                continue
+            for root, dirs, files in os.walk(directory):
+                for name in files:
+                    if name.lower().endswith('.mako'):
+                        uri = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+                        if uri not in self.compile_times:
+                            start = time.time()
+                            self._template_lookup.get_template(uri)
+                            self.compile_times[uri] = time.time() - start
+                        compiled[uri] = self.compile_times[uri]
+        return compiled
+
     @staticmethod
     def create(settings):
-        """Initializes the RenderFactory"""
-        RenderFactory._factory = RenderFactory(settings)
-        RenderFactory._factory.register_renderer('json', JSON())
+        """ Creates a RenderFactory with the default renderers
+
+        Notes:
+            Each Distill application creates its own factory.  The
+            factory created last is also used to render for requests
+            which don't belong to an application.  Returns the factory
+        """
+        factory = RenderFactory(settings)
+        factory.register_renderer('json', JSON())
+        factory.register_renderer('msgpack', MessagePack())
+        factory.register_renderer('negotiate', Negotiate())
+        RenderFactory._factory = factory
+        return factory
+
+    @staticmethod
+    def for_request(request):
+        """Returns the RenderFactory of the request's application, or the global one"""
+        factory = getattr(getattr(request, 'app', None), 'render_factory', None)
+        return factory if factory is not None else RenderFactory._factory
 
     @staticmethod
     def render(template, data, request, response, **rkwargs):
         """Returns the rendered response to a template"""
-        return RenderFactory._factory(template, data, request, response, **rkwargs)
+        return RenderFactory.for_request(request)(template, data, request, response, **rkwargs)
+
+    @staticmethod
+    def _last_factory(name, replacement):
+        """Warns that a static method is deprecated, returning the factory created last"""
+        warnings.warn('RenderFactory.{0} acts on the application created last and is deprecated, '
+                      'use {1} instead'.format(name, replacement), DeprecationWarning, stacklevel=3)
+        return RenderFactory._factory
 
     @staticmethod
     def add_renderer(name, serializer):
-        """Adds a template to the RenderFactory"""
-        RenderFactory._factory.register_renderer(name, serializer)
+        """ Adds a template to the RenderFactory created last
+
+        Notes:
+            Deprecated, with several applications it can't tell
+            which one is meant, use app.add_renderer instead
+        """
+        RenderFactory._last_factory('add_renderer', 'app.add_renderer').register_renderer(name, serializer)
+
+    @staticmethod
+    def precompile_templates():
+        """ Compiles every template known to the RenderFactory created last
+
+        Notes:
+            Deprecated, with several applications it can't tell
+            which one is meant, use app.warmup instead
+        """
+        return RenderFactory._last_factory('precompile_templates', 'app.warmup').precompile()
 
 
 def renderer(template, **rkwargs):
@@ -81,31 +380,40 @@ def renderer(template, **rkwargs):
         to the template, as such their meaning will vary
         accordingly
     """
+    def _do_render(data, args):
+        if isinstance(data, Response):
+            return data
+        if len(args) == 2:
+            return RenderFactory.render(template, data, *args, **rkwargs)
+        else:
+            return RenderFactory.render(template, data, args[1], args[2], **rkwargs)
+
     def _render(method):
+        if iscoroutinefunction(method):
+            from distill.asgi import wrap_render
+            return wrap_render(method, _do_render)
+
         @wraps(method)
         def _call(*args, **kwargs):
-            data = method(*args, **kwargs)
-            if isinstance(data, Response):
-                return data
-            if len(args) == 2:
-                return RenderFactory.render(template, data, *args, **rkwargs)
-            else:
-                return RenderFactory.render(template, data, args[1], args[2], **rkwargs)
+            return _do_render(method(*args, **kwargs), args)
         return _call
     return _render
 
 
 class JSON(object):
-    def __init__(self, serializer=json.dumps, **kwargs):
+    def __init__(self, serializer=json.dumps, encoders=None, **kwargs):
         """ Init
          Args:
             serializer: The serialzer to be used to stringify the object
+            encoders: The JSONEncoders converting objects which aren't
+                      serializable, Default: distill.encoders.encoders
             kwargs: All kwargs will be passed to the serializer
         """
         self.serializer = serializer
+        self.encoders = encoders if encoders is not None else default_encoders
         self.kw = kwargs
 
-    def __call__(self, data, request, response, pad=False):
+    def __call__(self, data, request, response, pad=False, stream=False, chunk_size=65536):
         """ Render the response to the template
 
         Notes:
@@ -119,14 +427,138 @@ class JSON(object):
             request: The current request, to be used as needed
             response: The current response
 
+        Kwargs:
+            pad: Prefix the output with )]}', to prevent JSON hijacking
+            stream: Return a generator encoding the data as the response
+                    is sent, in chunks of about chunk_size characters.
+                    Streaming always uses json.JSONEncoder, with the
+                    serializer's kwargs.  Iterators in data are encoded
+                    as arrays as they are consumed
+            chunk_size: Size of the chunks when streaming
         """
         response.headers['Content-Type'] = 'application/json'
 
-        def default(obj):
-            if hasattr(obj, 'json'):
-                return obj.json(request)
-            else:
-                raise TypeError('%r is not JSON serializable' % obj)
+        default = self.encoders.default(request)
+        if stream:
+            encoder = json.JSONEncoder(default=default, **self.kw)
+            return _iter_chunks(_iter_json(data, encoder), chunk_size, ")]}',\n" if pad else '')
+        data = self.encoders.prepare(data, request)
         if pad:
             return ")]}',\n" + self.serializer(data, default=default, **self.kw)
-        return self.serializer(data, default=default, **self.kw)
\ No newline at end of file
+        return self.serializer(data, default=default, **self.kw)
+
+
+class MessagePack(object):
+    def __init__(self, encoders=None):
+        """ Init
+         Args:
+            encoders: The JSONEncoders converting objects which MessagePack
+                      can't encode, Default: distill.encoders.encoders
+        """
+        self.encoders = encoders if encoders is not None else default_encoders
+
+    def __call__(self, data, request, response, **rkwargs):
+        """ Renders data as MessagePack
+
+        Notes:
+            Objects are converted the same way the JSON renderer
+            converts them, see distill.encoders.  The keyword
+            arguments of other renderers, such as stream and pad
+            passed on by Negotiate, are ignored
+
+        Args:
+            data: The data to be rendered
+            request: The current request, to be used as needed
+            response: The current response
+        """
+        response.headers['Content-Type'] = 'application/msgpack'
+        return packb(self.encoders.prepare(data, request), default=self.encoders.default(request))
+
+
+class Negotiate(object):
+    def __init__(self, renderers=None):
+        """ Init
+         Notes:
+            Renders the data with the renderer for the media type
+            preferred by the request's Accept header, raising
+            HTTPNotAcceptable if none are acceptable
+
+         Args:
+            renderers: A list of (media type, renderer) pairs, in order of
+                       preference, Default: JSON, then MessagePack
+        """
+        if renderers is None:
+            renderers = [('application/json', JSON()), ('application/msgpack', MessagePack()),
+                         ('application/x-msgpack', MessagePack())]
+        self.renderers = list(renderers)
+        self._offers = [media_type for media_type, _ in self.renderers]
+        self._by_type = dict(self.renderers)
+
+    def __call__(self, data, request, response, **rkwargs):
+        """ Renders data in the media type the client prefers
+
+        Args:
+            data: The data to be rendered
+            request: The current request
+            response: The current response
+        """
+        media_type = best_match(request.headers.get('Accept') if request is not None else None, self._offers)
+        vary = response.headers.get('Vary')
+        if not vary:
+            response.headers['Vary'] = 'Accept'
+        elif 'accept' not in [v.strip().lower() for v in vary.split(',')]:
+            response.headers['Vary'] = vary + ', Accept'
+        if media_type is None:
+            raise HTTPNotAcceptable(description='Acceptable types are {0}'.format(', '.join(self._offers)))
+        body = self._by_type[media_type](data, request, response, **rkwargs)
+        response.headers['Content-Type'] = media_type
+        return body
+
+
+def _iter_json(data, encoder):
+    """ Yields the JSON encoding of data in pieces
+
+    Notes:
+        An iterator, either data itself or a value of a dict,
+        is encoded as an array as it is consumed, rather than
+        being converted to a list first
+    """
+    if is_stream(data):
+        yield '['
+        separator = ''
+        for item in data:
+            yield separator
+            separator = encoder.item_separator
+            for piece in encoder.iterencode(item):
+                yield piece
+        yield ']'
+    elif isinstance(data, dict) and any(is_stream(value) for value in data.values()) \
+            and all(isinstance(key, string_types) for key in data):
+        yield '{'
+        separator = ''
+        for key, value in (sorted(data.items()) if encoder.sort_keys else data.items()):
+            yield separator
+            separator = encoder.item_separator
+            yield encoder.encode(key)
+            yield encoder.key_separator
+            for piece in _iter_json(value, encoder):
+                yield piece
+        yield '}'
+    else:
+        for piece in encoder.iterencode(data):
+            yield piece
+
+
+def _iter_chunks(pieces, chunk_size, prefix=''):
+    """Joins the small pieces produced by an encoder into chunks of about chunk_size"""
+    parts = [prefix]
+    size = len(prefix)
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    if size:
+        yield ''.join(parts)
@@ -1,8 +1,12 @@
-import cgi
 import json
 import re
+from distill import PY2
 from routes import URLGenerator
-from distill.helpers import cached_property, parse_query_string, CaseInsensitiveDict, text_
+from distill.multipart import MultipartPart, parse_form
+from distill.jsonstream import iter_json
+from distill.messagepack import unpackb
+from distill.exceptions import HTTPBadRequest, HTTPRequestEntityTooLarge
+from distill.helpers import cached_property, decode_query, CaseInsensitiveDict, MultiDict, CopyOnWriteDict, text_
 
 
 class Request(object):
@@ -12,18 +16,21 @@ class Request(object):
         """ Init
          Notes:
             Parses all relavent environ variables and stores
-            them on the request
+            them on the request.  The url generator, query string
+            and request body are only processed when first accessed
 
         Args:
             env: The wsgi environ variable
             app: The application's instance
         """
 
-        self.settings = app.settings.copy()
+        self.app = app
+        self.settings = CopyOnWriteDict(app.settings)
         self.env = env
-        self.url = URLGenerator(app.map, env)
         self.session = None
         self.resp_callbacks = []
+        # (ttl, vary) when the response should be cached, see Distill._resolve
+        self.cache_policy = None
 
         self.stream = env['wsgi.input']
         self.errors = env['wsgi.errors']
@@ -49,24 +56,153 @@ class Request(object):
         else:
             self.content_length = 0
 
-        if 'QUERY_STRING' in env and env['QUERY_STRING']:
-            self.GET = parse_query_string(env['QUERY_STRING'])
-        else:
-            self.GET = {}
-        if self.content_type and "application/x-www-form-urlencoded" in self.content_type:
-            data = self.stream.read(self.content_length)
-            self.POST = parse_query_string(data)
-        elif self.content_type and 'multipart/form-data' in self.content_type:
-            fs_env = self.env.copy()
-            fs_env.setdefault('CONTENT_LENGTH', '0')
-            fs_env['QUERY_STRING'] = ''
-            self.POST = cgi.FieldStorage(fp=self.stream, environ=fs_env, keep_blank_values=True)
-            self.POST = dict([(field.name, field.value) if field.filename is None
-                              else (field.name, field) for field in self.POST.list])
-        else:
-            self.POST = {}
-            if self.stream is not None:
-                self.body = self.stream.read(self.content_length)
+    @cached_property()
+    def url(self):
+        """Returns a routes URLGenerator for the application's map"""
+        return URLGenerator(self.app.map, self.env)
+
+    @cached_property()
+    def GET(self):
+        """Returns the parsed query string as a MultiDict"""
+        return self._decode_query(self.env.get('QUERY_STRING'))
+
+    @cached_property()
+    def POST(self):
+        """ Returns the parsed form body
+
+        Notes:
+            Only url encoded and multipart forms are parsed,
+            for any other content type this is empty.  Url
+            encoded forms are parsed into a MultiDict.  See
+            distill.multipart for the limits on multipart forms
+        """
+        if self._is_form('application/x-www-form-urlencoded'):
+            return self._decode_query(self.stream.read(self.content_length))
+        elif self._is_form('multipart/form-data'):
+            return parse_form(self.stream, self.content_type, self.content_length or None, self.settings)
+        return {}
+
+    @cached_property()
+    def body_view(self):
+        """ Returns a memoryview of the raw request body
+
+        Notes:
+            The body is read into a buffer borrowed from the
+            application's buffer pool, so reading a body doesn't
+            allocate a new bytes object.  The view is released once
+            the response has been sent.  A buffer is only reused if
+            no slice of the view is still held then, use body for
+            a copy which outlives the request.  Like body, form
+            bodies have no view.  A body larger than the
+            distill.request.max_body_size setting, 32MiB by default,
+            raises HTTPRequestEntityTooLarge before anything is read
+        """
+        if self._is_form('application/x-www-form-urlencoded') or self._is_form('multipart/form-data') \
+                or self.stream is None:
+            raise AttributeError('body_view')
+
+        length = self.content_length
+        max_size = self.settings.get('distill.request.max_body_size', 33554432)
+        if length and max_size is not None and length > max_size:
+            raise HTTPRequestEntityTooLarge()
+        readinto = getattr(self.stream, 'readinto', None)
+        if readinto is None or not length:
+            data = self.stream.read(length)
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            return memoryview(data)
+
+        pool = getattr(self.app, 'buffer_pool', None)
+        buf = pool.acquire(length) if pool is not None else bytearray(length)
+        view = memoryview(buf)
+        read = 0
+        while read < length:
+            n = readinto(view[read:length])
+            if not n:
+                break
+            read += n
+        view.release()
+        if pool is not None:
+            self._buffer = buf
+        return memoryview(buf)[:read]
+
+    @cached_property()
+    def body(self):
+        """ Returns the raw request body
+
+        Notes:
+            Form bodies are only available through POST, so
+            as with a request without an input stream, the
+            request has no body attribute for them
+        """
+        try:
+            return self.body_view.tobytes()
+        except AttributeError:
+            raise AttributeError('body')
+
+    def iter_json(self, chunk_size=65536):
+        """ Yields the top level items of a JSON body as they are read
+
+        Notes:
+            For an array body each element is yielded, and for an
+            object each (key, value) pair, so large bodies can be
+            processed while they are still being received.  The body
+            is read directly from the input stream, so this can't be
+            used once the body has been read some other way.  See
+            distill.jsonstream.iter_json
+
+        Kwargs:
+            chunk_size: Number of bytes to read at a time
+        """
+        return iter_json(self.stream, self.content_length or None, chunk_size)
+
+    def release(self):
+        """ Returns the body's buffer to the buffer pool
+
+        Notes:
+            Called by the application once the response has been
+            finalized, or for a streamed response once it has been
+            sent.  The view of the body is released, and the buffer
+            is only returned to the pool if nothing else still holds
+            a view of it, so a retained slice can never show another
+            request's body.  The temporary files of uploaded files
+            are closed
+        """
+        form = getattr(self, '_cache', {}).get('POST')
+        if form:
+            for value in form.values():
+                if isinstance(value, MultipartPart):
+                    value.file.close()
+
+        buf = self.__dict__.pop('_buffer', None)
+        if buf is None:
+            return
+        self._cache.pop('body_view').release()
+        try:
+            # Resizing a bytearray fails while a view of it exists
+            buf.append(0)
+        except BufferError:
+            return
+        del buf[-1]
+        self.app.buffer_pool.release(buf)
+
+    def _decode_query(self, data):
+        """ Decodes a query string or url encoded form into a MultiDict
+
+        Notes:
+            The number of fields is limited by the
+            distill.request.max_fields setting, beyond which
+            HTTPBadRequest is raised
+        """
+        if not data:
+            return MultiDict()
+        try:
+            return decode_query(data, self.settings.get('distill.request.max_fields', 1000))
+        except ValueError:
+            raise HTTPBadRequest(description='Too many fields')
+
+    def _is_form(self, content_type):
+        return bool(self.content_type) and content_type in self.content_type
 
     @cached_property()
     def headers(self):
@@ -85,7 +221,12 @@ class Request(object):
 
     @cached_property()
     def json_body(self):
-        return json.loads(text_(self.body))
+        return json.loads(text_(self.body_view.tobytes()) if PY2 else str(self.body_view, 'utf-8'))
+
+    @cached_property()
+    def msgpack_body(self):
+        """The body decoded as MessagePack, see distill.messagepack"""
+        return unpackb(self.body_view)
 
     @cached_property()
     def cookies(self):
@@ -1,4 +1,7 @@
+import datetime
+import calendar
 from distill import PY3
+from distill.conditional import quote_etag, http_date, body_etag, file_etag
 
 
 class Response(object):
@@ -11,6 +14,7 @@ class Response(object):
         self.body = None
         self.file = None
         self.file_len = None
+        self.block_size = 8 * 1024
         self.iterable = None
 
     @property
@@ -28,6 +32,60 @@ class Response(object):
                 wsgilist.append(l)
         return wsgilist
 
+    @property
+    def etag(self):
+        """Returns the response's ETag header"""
+        return self.headers.get('ETag')
+
+    @etag.setter
+    def etag(self, value):
+        """ Sets the ETag header
+
+        Notes:
+            Unquoted values are quoted, pass a value starting
+            with W/ for a weak ETag
+        """
+        if value is None:
+            self.headers.pop('ETag', None)
+        else:
+            self.headers['ETag'] = quote_etag(value)
+
+    @property
+    def last_modified(self):
+        """Returns the response's Last-Modified header"""
+        return self.headers.get('Last-Modified')
+
+    @last_modified.setter
+    def last_modified(self, value):
+        """Sets the Last-Modified header from a datetime, unix timestamp or HTTP date"""
+        if value is None:
+            self.headers.pop('Last-Modified', None)
+            return
+        if isinstance(value, datetime.datetime):
+            value = calendar.timegm(value.utctimetuple())
+        if not isinstance(value, str):
+            value = http_date(value)
+        self.headers['Last-Modified'] = value
+
+    def add_etag(self):
+        """ Computes an ETag for the response, unless it already has one
+
+        Notes:
+            Bodies are hashed, giving a strong ETag.  Files get a
+            weak ETag from their size and modification time, and a
+            Last-Modified header.  Streamed bodies get no ETag
+        """
+        if 'ETag' in self.headers:
+            return
+        if isinstance(self.body, (bytes, str)) or (self.body is not None and not hasattr(self.body, '__iter__')):
+            if self.body:
+                self.headers['ETag'] = body_etag(self.body)
+        elif self.body is None and self.file:
+            etag, mtime = file_etag(self.file)
+            if etag is not None:
+                self.headers['ETag'] = etag
+                self.headers.setdefault('Last-Modified', http_date(mtime))
+
     def set_cookie(self, name, value, path="/", max_age=3600, domain=None,
                    secure=False, comment=None):
         """ Allows you to set a cookie on the client
@@ -74,15 +132,18 @@ class Response(object):
             to the WSGI server.  This includes setting
             Content-Length, wrapping the response's file
             descriptor as described in PEP333, and converting
-            the response body to an interable
+            the response body to an interable.  If the body
+            is an iterator or generator it is streamed to the
+            client as it is produced, without a Content-Length
 
         Args:
             wsgi_file_wrapper: Wrapping function provided by WSGI server
 
         """
 
-        if self.body:
-            self.headers['Content-Length'] = str(len(self.body))
+        if is_stream(self.body):
+            self.iterable = StreamIterable(self.body)
+        elif self.body:
             if PY3:  # pragma: no cover
                 if type(self.body) == str:
                     self.iterable = [bytes(self.body, 'utf-8')]
@@ -90,12 +151,109 @@ class Response(object):
                     self.iterable = [bytes(self.body)]
             else:  # pragma: no cover
                 self.iterable = [self.body]
+            self.headers['Content-Length'] = str(len(self.iterable[0]))
         elif self.file:
             if self.file_len:
                 self.headers['Content-Length'] = str(self.file_len)
             if wsgi_file_wrapper:
-                self.iterable = wsgi_file_wrapper(self.file, 8 * 1024)
+                self.iterable = wsgi_file_wrapper(self.file, self.block_size)
             else:
-                self.iterable = iter(lambda: self.file.read(8 * 1024), b'')
+                self.iterable = FileIterable(self.file, self.block_size)
         else:
             self.iterable = []
+
+
+def is_stream(body):
+    """ Returns True if body should be streamed to the client
+
+    Notes:
+        Iterators and generators are streamed, strings, files
+        and any other values are not.  Files are iterators of
+        lines, but are sent with response.file instead
+    """
+    if isinstance(body, (bytes, str)) or hasattr(body, 'read'):
+        return False
+    return hasattr(body, '__next__') or hasattr(body, 'next')
+
+
+def primed(generator):
+    """ Runs a generator up to its first chunk, returning a generator of every chunk
+
+    Notes:
+        Used for generators returned by actions, so the status
+        and headers set before the first yield are set before
+        the response is started.  Closing the returned generator
+        closes the original one
+
+    Args:
+        generator: The generator to run
+    """
+    try:
+        first = next(generator)
+    except StopIteration:
+        return iter([])
+
+    def chunks():
+        try:
+            yield first
+            for chunk in generator:
+                yield chunk
+        finally:
+            generator.close()
+    return chunks()
+
+
+class StreamIterable(object):
+    """ The WSGI iterable of a streamed body
+
+    Notes:
+        Chunks are passed through as they are produced, with
+        text encoded as UTF-8.  Chunks may also be memoryviews
+        or any other bytes-like object, which are copied to bytes
+        as PEP 3333 requires.  Closing the iterable closes the
+        body, so a generator's finally blocks are run even if the
+        client goes away before the body has been sent.  on_close
+        is then called, if it has been set
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.on_close = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self.body)
+        if type(chunk) is bytes:
+            return chunk
+        elif hasattr(chunk, 'encode'):
+            return chunk.encode('utf-8')
+        elif isinstance(chunk, memoryview):
+            return chunk.tobytes()
+        return bytes(chunk)
+
+    next = __next__
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+
+class FileIterable(object):
+    """Reads a file in blocks, closing it when the response is closed"""
+
+    def __init__(self, file, block_size):
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.file.read(self.block_size), b'')
+
+    def close(self):
+        if hasattr(self.file, 'close'):
+            self.file.close()
@@ -0,0 +1,168 @@
+import itertools
+
+
+class _Node(object):
+    """A single level of the dispatcher's segment trie"""
+    __slots__ = ('children', 'wildcard', 'routes', 'catchall')
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.routes = []
+        self.catchall = []
+
+
+class Dispatcher(object):
+    """ Compiled lookup table for the routes in a Mapper
+
+    Notes:
+        Routes without any variables are stored in a dict keyed
+        by their full path, parameterized routes are stored in a
+        trie keyed by path segment.  Matching a URL only runs the
+        regular expressions of the routes that could possibly match
+        it, in the same order the Mapper would have tried them, so
+        the result is identical to Mapper.match.
+
+        Mappers using features the trie can't reason about, such as
+        a prefix, always_scan or debug mode, are matched by falling
+        back to the Mapper itself.
+    """
+
+    def __init__(self, mapper):
+        """ Init
+
+        Args:
+            mapper: The routes Mapper to compile
+        """
+        self.mapper = mapper
+        self._static = {}
+        self._root = _Node()
+        self._always = []
+        self._fallback = bool(mapper.prefix or mapper.always_scan or mapper.debug)
+        if self._fallback:
+            return
+
+        mapper.create_regs()
+        for index, route in enumerate(mapper.matchlist):
+            if route.static:
+                continue
+            self._add(self._rank(route, index), route)
+
+    @staticmethod
+    def _rank(route, index):
+        """ Returns the sort key the Mapper would try this route in
+
+        Notes:
+            Newer versions of routes try routes with the longest
+            static prefix first, older versions try them in the order
+            they were connected
+        """
+        if not hasattr(route, 'routelist'):  # pragma: no cover
+            return 0, index
+        prefix = ''.join(itertools.takewhile(lambda p: not isinstance(p, dict), route.routelist))
+        if route.minimization and not prefix.startswith('/'):
+            prefix = '/' + prefix
+        return -len(prefix.rstrip('/')), index
+
+    def _add(self, rank, route):
+        if route.minimization:
+            self._always.append((rank, route))
+            return
+
+        segments = [[]]
+        for part in route.routelist:
+            if isinstance(part, dict):
+                segments[-1].append(part)
+            else:
+                pieces = part.split('/')
+                segments[-1].append(pieces[0])
+                segments.extend([piece] for piece in pieces[1:])
+
+        if all(not isinstance(p, dict) for segment in segments for p in segment):
+            path = '/'.join(''.join(segment) for segment in segments)
+            self._static.setdefault(path, []).append((rank, route))
+            return
+
+        node = self._root
+        for segment in segments:
+            variables = [p for p in segment if isinstance(p, dict)]
+            if not variables:
+                node = node.children.setdefault(''.join(segment), _Node())
+            elif any(self._spans_segments(route, var) for var in variables):
+                node.catchall.append((rank, route))
+                return
+            else:
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+        node.routes.append((rank, route))
+
+    @staticmethod
+    def _spans_segments(route, var):
+        """Returns True if a path variable may match across a /"""
+        return var['type'] == '*' or var['name'] in route.reqs or var['name'] == 'controller'
+
+    def candidates(self, url):
+        """ Returns the routes that could match the url
+
+        Notes:
+            The routes are returned in the order the mapper
+            would try them
+        """
+        found = list(self._static.get(url, ()))
+        nodes = [(self._root, url.split('/'), 0)]
+        while nodes:
+            node, segments, depth = nodes.pop()
+            if node.catchall:
+                found.extend(node.catchall)
+            if depth == len(segments):
+                found.extend(node.routes)
+                continue
+            child = node.children.get(segments[depth])
+            if child is not None:
+                nodes.append((child, segments, depth + 1))
+            if node.wildcard is not None:
+                nodes.append((node.wildcard, segments, depth + 1))
+        found.extend(self._always)
+        found.sort(key=lambda r: r[0])
+        return [route for _, route in found]
+
+    def match(self, url, environ=None):
+        """ Match a URL against the compiled routes
+
+        Notes:
+            Behaves exactly as Mapper.match, returning None
+            if no route matches the url
+
+        Args:
+            url: The path to match
+            environ: The wsgi environ variable
+        """
+        mapper = self.mapper
+        if self._fallback:
+            return mapper.match(url, environ)
+
+        environ = environ or mapper.environ
+        for route in self.candidates(url):
+            match = route.match(url, environ, mapper.sub_domains, mapper.sub_domains_ignore,
+                                mapper.domain_match)
+            if isinstance(match, dict) or match:
+                return match
+        return None
+
+
+def conditions_used(mapper):
+    """ Returns the names of the route conditions used by a mapper
+
+    Notes:
+        Enabling sub_domains on the mapper is reported as
+        the sub_domain condition, since every match then
+        depends on the requested host
+    """
+    used = set()
+    if mapper.sub_domains:
+        used.add('sub_domain')
+    for route in mapper.matchlist:
+        if route.conditions:
+            used.update(route.conditions)
+    return used
@@ -0,0 +1,651 @@
+""" A prefork HTTP/1.1 server for Distill applications
+
+Notes:
+    The master process loads and warms up the application, binds
+    the listening socket and then forks the workers, so the
+    application's routes, templates and modules are shared
+    copy-on-write between all of them.  Each worker serves
+    connections from the shared socket using a bounded number of
+    threads, with HTTP/1.1 keep-alive.
+
+    The master understands the following signals:
+
+        SIGHUP: Gracefully replace all workers
+        SIGTERM, SIGINT: Gracefully stop the server
+        SIGQUIT: Stop the server immediately
+
+    Since workers are forked from the master, a graceful restart
+    does not pick up code changes.  Restart the master for that.
+"""
+import argparse
+import errno
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from importlib import import_module
+try:  # pragma: no cover
+    from http.server import BaseHTTPRequestHandler
+    from socketserver import TCPServer
+    from urllib.parse import unquote
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from SocketServer import TCPServer
+    from urllib import unquote
+
+
+class FileWrapper(object):
+    """ The server's wsgi.file_wrapper
+
+    Notes:
+        When the wrapped file has a file descriptor and the
+        response has a Content-Length, the file is sent with
+        sendfile rather than read into memory
+    """
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+        if hasattr(filelike, 'close'):
+            self.close = filelike.close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.filelike.read(self.blksize)
+        if data:
+            return data
+        raise StopIteration
+
+    next = __next__
+
+
+class _Input(object):
+    """Limits reads from the connection to the request body"""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, buf):
+        view = memoryview(buf)
+        if len(view) > self.remaining:
+            view = view[:self.remaining]
+        read = self.rfile.readinto(view)
+        self.remaining -= read
+        return read
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self, limit):
+        """Discards the unread body, returning False if it exceeds limit"""
+        if self.remaining > limit:
+            return False
+        while self.remaining:
+            if not self.read(64 * 1024):
+                return False
+        return True
+
+
+def _read_chunked(rfile):
+    """Decodes a chunked request body into a temporary file"""
+    body = tempfile.SpooledTemporaryFile(1024 * 1024)
+    while True:
+        size = int(rfile.readline(1024).split(b';', 1)[0], 16)
+        if size == 0:
+            break
+        while size:
+            data = rfile.read(min(size, 64 * 1024))
+            if not data:
+                raise ValueError('Incomplete chunked body')
+            body.write(data)
+            size -= len(data)
+        rfile.readline(1024)
+    # Discard any trailers
+    while rfile.readline(1024).strip():
+        pass
+    length = body.tell()
+    body.seek(0)
+    return body, length
+
+
+class WSGIRequestHandler(BaseHTTPRequestHandler):
+    """Handles HTTP/1.1 connections, passing each request to the application"""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'Distill'
+
+    def setup(self):
+        self.timeout = self.server.keepalive
+        BaseHTTPRequestHandler.setup(self)
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.error:
+            # Timeouts of idle connections and clients going away
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            return
+
+        self.run_wsgi()
+        self.server.request_done()
+        if self.server.stopping:
+            self.close_connection = True
+
+    def environ(self):
+        """Builds the wsgi environ for the current request"""
+        path, _, query = self.path.partition('?')
+        env = {
+            'REQUEST_METHOD': self.command,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.server.server_name,
+            'SERVER_PORT': str(self.server.server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+
+        for name, value in self.headers.items():
+            name = name.upper().replace('-', '_')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                env[name] = value
+                continue
+            name = 'HTTP_' + name
+            if name in env:
+                value = env[name] + ',' + value
+            env[name] = value
+
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            body, length = _read_chunked(self.rfile)
+            env['CONTENT_LENGTH'] = str(length)
+            env['wsgi.input'] = _Input(body, length)
+        else:
+            env['wsgi.input'] = _Input(self.rfile, int(env.get('CONTENT_LENGTH') or 0))
+        return env
+
+    def run_wsgi(self):
+        self._status = None
+        self._headers = None
+        self._headers_sent = False
+        self._chunked = False
+        try:
+            env = self.environ()
+        except ValueError:
+            self.send_error(400)
+            self.close_connection = True
+            return
+
+        try:
+            result = self.server.app(env, self.start_response)
+            try:
+                if not (isinstance(result, FileWrapper) and self._sendfile(result)):
+                    for data in result:
+                        if data:
+                            self.write(data)
+                if not self._headers_sent:
+                    self.send_headers()
+                if self._chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        except socket.error:
+            self.close_connection = True
+            return
+        except Exception:
+            traceback.print_exc()
+            self.close_connection = True
+            if not self._headers_sent:
+                self.send_error(500)
+            return
+
+        if not env['wsgi.input'].drain(64 * 1024):
+            self.close_connection = True
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info:
+            try:
+                if self._headers_sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self._status is not None:
+            raise AssertionError('start_response called twice')
+        self._status = status
+        self._headers = headers
+        return self.write
+
+    def send_headers(self):
+        """Sends the status line and headers, choosing how the body is framed"""
+        code, _, message = self._status.partition(' ')
+        code = int(code)
+        self.send_response(code, message)
+        names = set()
+        for name, value in self._headers:
+            self.send_header(name, value)
+            names.add(name.lower())
+
+        if 'content-length' not in names and code >= 200 and code not in (204, 304) \
+                and self.command != 'HEAD':
+            if self.request_version == 'HTTP/1.1':
+                self._chunked = True
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                self.close_connection = True
+
+        if self.close_connection:
+            if 'connection' not in names:
+                self.send_header('Connection', 'close')
+        elif self.request_version == 'HTTP/1.0':
+            self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+        self._headers_sent = True
+
+    def write(self, data):
+        if not self._headers_sent:
+            self.send_headers()
+        if self.command == 'HEAD':
+            return
+        if self._chunked:
+            self.wfile.write(('%x\r\n' % len(data)).encode('ascii'))
+            self.wfile.write(data)
+            self.wfile.write(b'\r\n')
+        else:
+            self.wfile.write(data)
+
+    def _sendfile(self, wrapper):
+        """Sends a wrapped file with sendfile, returning False if that isn't possible"""
+        filelike = wrapper.filelike
+        try:
+            filelike.fileno()
+        except (AttributeError, OSError, ValueError):
+            return False
+
+        self.send_headers()
+        if self._chunked or self.command == 'HEAD':
+            for data in wrapper:
+                self.write(data)
+            return True
+
+        count = None
+        for name, value in self._headers:
+            if name.lower() == 'content-length':
+                count = int(value)
+        offset = filelike.tell() if hasattr(filelike, 'tell') else 0
+        self.wfile.flush()
+        self.connection.sendfile(filelike, offset, count)
+        return True
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class WorkerServer(TCPServer):
+    """ Serves requests from a listening socket in a worker process
+
+    Notes:
+        Each connection is handled in its own thread, with at most
+        threads connections being handled at once.  When max_requests
+        is set the server stops after handling that many requests
+    """
+
+    def __init__(self, sock, app, threads=16, keepalive=5, max_requests=0, access_log=False):
+        TCPServer.__init__(self, sock.getsockname()[:2], WSGIRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_name = self.server_address[0]
+        self.server_port = self.server_address[1]
+        self.app = app
+        self.keepalive = keepalive
+        self.max_requests = max_requests
+        self.access_log = access_log
+        self.handled = 0
+        self.stopping = False
+        self._threads = threads
+        self._slots = threading.BoundedSemaphore(threads)
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        thread = threading.Thread(target=self._process, args=(request, client_address))
+        thread.daemon = True
+        thread.start()
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def handle_error(self, request, client_address):
+        traceback.print_exc()
+
+    def request_done(self):
+        with self._lock:
+            self.handled += 1
+            if self.max_requests and self.handled >= self.max_requests:
+                self.stop()
+
+    def stop(self):
+        """Stops accepting connections, letting current requests finish"""
+        if not self.stopping:
+            self.stopping = True
+            thread = threading.Thread(target=self.shutdown)
+            thread.daemon = True
+            thread.start()
+
+    def serve(self, graceful_timeout=30):
+        """Serves requests until stopped, then waits for running requests"""
+        self.serve_forever(poll_interval=0.5)
+        deadline = time.time() + graceful_timeout
+        for _ in range(self._threads):
+            if not self._slots.acquire(timeout=max(deadline - time.time(), 0)):
+                break
+
+
+def bind(host, port, backlog=1024):
+    """ Creates the listening socket shared by the workers
+
+    Notes:
+        SO_REUSEPORT is set where available, so a new master can
+        bind the same address while an old one is shutting down
+    """
+    info = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+    sock = socket.socket(info[0], socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(info[4])
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class PreforkServer(object):
+    """ Runs a Distill application in a pool of forked worker processes
+
+    Notes:
+        See the module documentation for the signals understood
+        by the master process
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=8000, workers=None, threads=16, max_requests=0,
+                 keepalive=5, graceful_timeout=30, backlog=1024, warmup=True, access_log=False):
+        """ Init
+
+        Args:
+            app: The application to serve
+
+        Kwargs:
+            host: Address to listen on Default: 127.0.0.1
+            port: Port to listen on Default: 8000
+            workers: Number of worker processes Default: Number of CPUs
+            threads: Connections handled at once per worker Default: 16
+            max_requests: Recycle workers after this many requests, 0 to disable Default: 0
+            keepalive: Seconds to wait for the next request on a connection Default: 5
+            graceful_timeout: Seconds stopping workers may take to finish Default: 30
+            backlog: Listen backlog of the socket Default: 1024
+            warmup: Warm up the application before forking Default: True
+            access_log: Log every request to stderr Default: False
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or _cpu_count()
+        self.threads = threads
+        self.max_requests = max_requests
+        self.keepalive = keepalive
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.warmup = warmup
+        self.access_log = access_log
+        self.socket = None
+        self._children = {}
+        self._stopping = {}
+        self._signals = []
+        self._pipe = None
+        self._running = False
+
+    def run(self):
+        """Serves the application until the master is stopped"""
+        if self.warmup and hasattr(self.app, 'warmup'):
+            compile_times = self.app.warmup()
+            if compile_times:
+                slowest = max(compile_times, key=compile_times.get)
+                sys.stderr.write('Compiled {0} templates in {1:.3f}s, slowest {2} ({3:.3f}s)\n'.format(
+                    len(compile_times), sum(compile_times.values()), slowest, compile_times[slowest]))
+        self.socket = bind(self.host, self.port, self.backlog)
+        gc.collect()
+        if hasattr(gc, 'freeze'):  # pragma: no cover
+            # Keeps the collector from dirtying shared pages in the workers
+            gc.freeze()
+
+        self._pipe = os.pipe()
+        for fd in self._pipe:
+            _set_nonblocking(fd)
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGQUIT, signal.SIGCHLD):
+            signal.signal(sig, self._signal)
+
+        self._running = True
+        try:
+            while self._running or self._children:
+                self._handle_signals()
+                self._reap()
+                self._kill_slow()
+                if self._running:
+                    self._maintain()
+                self._sleep()
+        finally:
+            self.socket.close()
+            for fd in self._pipe:
+                os.close(fd)
+
+    def _signal(self, sig, frame):
+        self._signals.append(sig)
+        try:
+            os.write(self._pipe[1], b'.')
+        except OSError:  # pragma: no cover
+            pass
+
+    def _sleep(self):
+        try:
+            ready = select.select([self._pipe[0]], [], [], 1.0)[0]
+            if ready:
+                while os.read(self._pipe[0], 64):
+                    pass
+        except (select.error, OSError) as ex:
+            if ex.args[0] not in (errno.EAGAIN, errno.EINTR):  # pragma: no cover
+                raise
+
+    def _handle_signals(self):
+        while self._signals:
+            sig = self._signals.pop(0)
+            if sig == signal.SIGHUP:
+                old = list(self._children)
+                for _ in range(self.workers):
+                    self._spawn()
+                for pid in old:
+                    self._stop_worker(pid)
+            elif sig in (signal.SIGTERM, signal.SIGINT):
+                self._running = False
+                for pid in list(self._children):
+                    self._stop_worker(pid)
+            elif sig == signal.SIGQUIT:
+                self._running = False
+                for pid in list(self._children):
+                    self._kill(pid, signal.SIGKILL)
+
+    def _stop_worker(self, pid):
+        if pid not in self._stopping:
+            self._stopping[pid] = time.time() + self.graceful_timeout
+            self._kill(pid, signal.SIGTERM)
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except OSError as ex:  # pragma: no cover
+            if ex.errno != errno.ESRCH:
+                raise
+
+    def _kill_slow(self):
+        now = time.time()
+        for pid, deadline in list(self._stopping.items()):
+            if now > deadline:
+                self._kill(pid, signal.SIGKILL)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as ex:
+                if ex.errno == errno.ECHILD:
+                    return
+                raise  # pragma: no cover
+            if not pid:
+                return
+            self._children.pop(pid, None)
+            self._stopping.pop(pid, None)
+
+    def _maintain(self):
+        active = len(self._children) - len(self._stopping)
+        for _ in range(self.workers - active):
+            self._spawn()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = time.time()
+            return
+
+        code = 0
+        try:
+            self._work()
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _work(self):
+        """Runs in the forked worker process"""
+        for fd in self._pipe:
+            os.close(fd)
+        for sig in (signal.SIGHUP, signal.SIGCHLD, signal.SIGQUIT):
+            signal.signal(sig, signal.SIG_DFL)
+        # Ctrl-C is sent to the whole process group, let the master handle it
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        server = WorkerServer(self.socket, self.app, self.threads, self.keepalive,
+                              self.max_requests, self.access_log)
+        signal.signal(signal.SIGTERM, lambda sig, frame: server.stop())
+        server.serve(self.graceful_timeout)
+
+
+def _set_nonblocking(fd):
+    import fcntl
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):  # pragma: no cover
+        return 1
+
+
+def load_app(spec):
+    """ Imports the application named by spec
+
+    Args:
+        spec: The application as module:attribute, attribute defaults to app
+    """
+    module, _, attr = spec.partition(':')
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    obj = import_module(module)
+    for name in (attr or 'app').split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def main(argv=None):
+    """Entry point for the distill command"""
+    parser = argparse.ArgumentParser(prog='distill')
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='Serve an application with a prefork server')
+    serve.add_argument('app', help='The application to serve, as module:attribute')
+    serve.add_argument('-b', '--bind', default='127.0.0.1:8000', help='Address to listen on, as host:port')
+    serve.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes')
+    serve.add_argument('-t', '--threads', type=int, default=16, help='Connections handled at once per worker')
+    serve.add_argument('--max-requests', type=int, default=0, help='Recycle workers after this many requests')
+    serve.add_argument('--keepalive', type=float, default=5, help='Seconds to keep idle connections open')
+    serve.add_argument('--graceful-timeout', type=float, default=30,
+                       help='Seconds stopping workers may take to finish')
+    serve.add_argument('--no-warmup', action='store_true', help="Don't warm up the application before forking")
+    serve.add_argument('--access-log', action='store_true', help='Log every request to stderr')
+    args = parser.parse_args(argv)
+
+    if args.command != 'serve':
+        parser.print_help()
+        return 1
+
+    host, _, port = args.bind.rpartition(':')
+    PreforkServer(load_app(args.app), host or '0.0.0.0', int(port), workers=args.workers,
+                  threads=args.threads, max_requests=args.max_requests, keepalive=args.keepalive,
+                  graceful_timeout=args.graceful_timeout, warmup=not args.no_warmup,
+                  access_log=args.access_log).run()
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
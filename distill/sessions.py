@@ -1,5 +1,6 @@
 import base64
 from distill import PY3
+from distill.shmcache import SharedMemoryCache
 import os
 try:  # pragma: no cover
     import cPickle as pickle
@@ -75,6 +76,119 @@ def modified(func):
     return access
 
 
+class StoredSession(BaseSession):
+    """ A session stored by a session storage
+
+    Notes:
+        Session data is pickled and stored under the SSID kept
+        in the ssid cookie.  Subclasses implement where it is
+        stored with _load, _store and _remove, and set _max_age
+    """
+    _max_age = 10080
+
+    def __init__(self, request):
+        self.request = request
+        self.new = True
+        self.dirty = False
+        self.ssid = request.cookies.get('ssid')
+        self.invalid = False
+        data = {}
+
+        if self.ssid:
+            stored = self._load(self.ssid)
+            if stored is None:
+                # Session has been removed, remove cookie from request
+                del request.cookies['ssid']
+                return
+            data.update(stored)
+
+        dict.__init__(self, data)
+
+    def _load(self, ssid):  # pragma: no cover
+        """Returns the stored session items, or None if there is no session"""
+        raise NotImplementedError('StoredSession._load not implemented')
+
+    def _store(self, ssid, items):  # pragma: no cover
+        raise NotImplementedError('StoredSession._store not implemented')
+
+    def _remove(self, ssid):  # pragma: no cover
+        raise NotImplementedError('StoredSession._remove not implemented')
+
+    @modified
+    def changed(self):
+        self.dirty = True
+
+    @modified
+    def invalidate(self):
+        self.invalid = True
+
+    get = dict.get
+    __getitem__ = dict.__getitem__
+    items = dict.items
+    __iter__ = dict.__iter__
+    values = dict.values
+    keys = dict.keys
+    __contains__ = dict.__contains__
+    __len__ = dict.__len__
+
+    clear = modified(dict.clear)
+    update = modified(dict.update)
+    setdefault = modified(dict.setdefault)
+    pop = modified(dict.pop)
+    popitem = modified(dict.popitem)
+    __setitem__ = modified(dict.__setitem__)
+    __delitem__ = modified(dict.__delitem__)
+
+    def flash(self, msg, queue='', allow_duplicate=True):
+        msgs = self.setdefault('_f_' + queue, [])
+        if allow_duplicate or msg not in msgs:
+            msgs.append(msg)
+
+    def pop_flash(self, queue=''):
+        return self.pop('_f_' + queue, [])
+
+    def peek_flash(self, queue=''):
+        return self.get('_f_' + queue, [])
+
+    def new_csrf_token(self):
+        token = base64.b64encode(os.urandom(32))
+        self['__csrft__'] = token
+        return token
+
+    def get_csrf_token(self):
+        token = self.get('__csrft__', None)
+        if token is None:
+            token = self.new_csrf_token()
+        return token
+
+    def save(self, response):
+        """ Saves session data
+
+        Notes:
+            This method serializes all data contained in the
+            session object using pickle.  As such, all variables
+            stored in the session should be pickleable.  It is
+            not recomended to use the session to store python
+            objects, instead you should store their state
+
+        Args:
+            response: The current response object
+        """
+        if not self.dirty:
+            return
+
+        if self.ssid is None:
+            self.ssid = self.new_ssid()
+            response.set_cookie('ssid', self.ssid, max_age=self._max_age)
+
+        if self.invalid:
+            self._remove(self.ssid)
+            response.set_cookie('ssid', '', max_age=0)
+            return
+
+        self._store(self.ssid, list(self.items()))
+
+
 def UnencryptedLocalSessionStorage(settings):
     """ Creates a new UnencryptedLocalSession
 
@@ -97,105 +211,59 @@ def UnencryptedLocalSessionStorage(settings):
     if 'distill.sessions.max_age' in settings:  # pragma: no cover
         max_age = settings['distill.sessions.max_age']
 
-    class UnecryptedLocalSession(BaseSession):
+    class UnecryptedLocalSession(StoredSession):
         _dir = dir_
         _max_age = max_age
 
-        def __init__(self, request):
-            self.request = request
-            self.new = True
-            self.dirty = False
-            self.ssid = request.cookies.get('ssid')
-            self.invalid = False
-            data = {}
-
-            if self.ssid:
-                store = os.path.join(self._dir, request.cookies['ssid'])
-                if not os.path.isfile(store):
-                    # File has been deleted, remove cookie from request
-                    del request.cookies['ssid']
-                    return
-
-                with open(store, 'rb') as fp:
-                    data.update(pickle.load(fp))
-
-            dict.__init__(self, data)
-
-        @modified
-        def changed(self):
-            self.dirty = True
-
-        @modified
-        def invalidate(self):
-            self.invalid = True
-
-        get = dict.get
-        __getitem__ = dict.__getitem__
-        items = dict.items
-        __iter__ = dict.__iter__
-        values = dict.values
-        keys = dict.keys
-        __contains__ = dict.__contains__
-        __len__ = dict.__len__
-
-        clear = modified(dict.clear)
-        update = modified(dict.update)
-        setdefault = modified(dict.setdefault)
-        pop = modified(dict.pop)
-        popitem = modified(dict.popitem)
-        __setitem__ = modified(dict.__setitem__)
-        __delitem__ = modified(dict.__delitem__)
-
-        def flash(self, msg, queue='', allow_duplicate=True):
-            msgs = self.setdefault('_f_' + queue, [])
-            if allow_duplicate or msg not in msgs:
-                msgs.append(msg)
-
-        def pop_flash(self, queue=''):
-            return self.pop('_f_' + queue, [])
-
-        def peek_flash(self, queue=''):
-            return self.get('_f_' + queue, [])
-
-        def new_csrf_token(self):
-            token = base64.b64encode(os.urandom(32))
-            self['__csrft__'] = token
-            return token
-
-        def get_csrf_token(self):
-            token = self.get('__csrft__', None)
-            if token is None:
-                token = self.new_csrf_token()
-            return token
-
-        def save(self, response):
-            """ Saves session data to a file
-
-            Notes:
-                This method serializes all data contained in the
-                session object using pickle.  As such, all variables
-                stored in the session should be pickleable.  It is
-                not recomended to use the session to store python
-                objects, instead you should store their state
-
-            Args:
-                response: The current response object
-            """
-            if not self.dirty:
-                return
+        def _load(self, ssid):
+            store = os.path.join(self._dir, ssid)
+            if not os.path.isfile(store):
+                return None
+            with open(store, 'rb') as fp:
+                return pickle.load(fp)
 
-            if self.ssid is None:
-                self.ssid = self.new_ssid()
-                response.set_cookie('ssid', self.ssid, max_age=self._max_age)
+        def _store(self, ssid, items):
+            with open(os.path.join(self._dir, ssid), 'wb+') as fp:
+                pickle.dump(items, fp, pickle.HIGHEST_PROTOCOL)
 
-            store = os.path.join(self._dir, self.ssid)
+        def _remove(self, ssid):
+            os.remove(os.path.join(self._dir, ssid))
 
-            if self.invalid:
-                os.remove(store)
-                response.set_cookie('ssid', '', max_age=0)
-                return
+    return UnecryptedLocalSession
+
+
+def SharedMemorySessionStorage(settings, cache=None):
+    """ Creates a new session class stored in a SharedMemoryCache
+
+    Notes:
+        Every worker process on a host sees the same sessions.
+        Sessions expire distill.sessions.max_age seconds after
+        they were last saved, and sessions too large for a slot
+        of the cache aren't stored
+
+    Args:
+        settings: Current application settings dict
+
+    Kwargs:
+        cache: The cache to store sessions in, Default: the
+               cache configured by the distill.shm_cache.* settings
+    """
+    if cache is None:
+        cache = SharedMemoryCache.from_settings(settings)
+
+    max_age = settings.get('distill.sessions.max_age', 10080)
+
+    class SharedMemorySession(StoredSession):
+        _cache = cache
+        _max_age = max_age
+
+        def _load(self, ssid):
+            return self._cache.get(('distill.session', ssid))
+
+        def _store(self, ssid, items):
+            self._cache.set(('distill.session', ssid), items, ttl=self._max_age)
 
-            with open(store, 'wb+') as fp:
-                pickle.dump(list(self.items()), fp, pickle.HIGHEST_PROTOCOL)
+        def _remove(self, ssid):
+            self._cache.delete(('distill.session', ssid))
 
-    return UnecryptedLocalSession
\ No newline at end of file
+    return SharedMemorySession
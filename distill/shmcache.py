@@ -0,0 +1,360 @@
+""" A cache shared by every process on a host
+
+Notes:
+    Entries are stored in fixed size slots of a memory mapped file,
+    so every worker of a PreforkServer, and any other process mapping
+    the same file, shares one cache.  Slots are grouped in sets of
+    ways, a key can only be stored in the set its hash selects.
+
+    Writers lock the set they write to, with a lockf byte range lock
+    between processes and a thread lock within one.  Readers don't
+    lock at all, each slot carries a sequence number which writers
+    make odd while the slot is being written, so a reader retries
+    when the number is odd or changed while it copied the slot.
+
+    Values are unpickled, so anyone who can write to the file can run
+    code in every process using it.  The file, and the directory of
+    the default path, must be owned by the current user and must not
+    be writable by anyone else
+"""
+import errno
+import hashlib
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+try:  # pragma: no cover
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+try:  # pragma: no cover
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+_MAGIC = b'DSHM'
+_FILE_HEADER = struct.Struct('<4sIII')
+_HEADER_SIZE = 64
+# seq, key digest, expiry time (0 for never, negative for pinned), value length
+_SLOT_HEADER = struct.Struct('<I16sdI')
+_EMPTY = b'\0' * 16
+_RETRIES = 64
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _check_owner(st, path):
+    """Raises OSError unless st is owned by the current user and only writable by them"""
+    if not hasattr(os, 'getuid'):  # pragma: no cover
+        return
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise OSError(errno.EPERM, 'Not owned by the current user, or writable by others', path)
+
+
+def default_path():
+    """ Returns the path of the cache used when distill.shm_cache.path isn't set
+
+    Notes:
+        The file is distill.shm in $XDG_RUNTIME_DIR, or else in a
+        distill-<uid> directory of the temporary directory, which
+        is created readable only by the current user
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        uid = os.getuid() if hasattr(os, 'getuid') else os.getpid()
+        directory = os.path.join(tempfile.gettempdir(), 'distill-{0}'.format(uid))
+        try:
+            os.mkdir(directory, 0o700)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+        raise OSError(errno.ENOTDIR, 'Not a directory', directory)
+    _check_owner(st, directory)
+    return os.path.join(directory, 'distill.shm')
+
+
+def _digest(key):
+    """Returns a 16 byte digest of a key, stable between processes"""
+    if not isinstance(key, bytes):
+        key = repr(key).encode('utf-8')
+    digest = hashlib.md5(key).digest()
+    # An all zero digest marks an empty slot
+    return digest if digest != _EMPTY else b'\1' + digest[1:]
+
+
+class SharedMemoryCache(object):
+    """ A cache stored in a memory mapped file
+
+    Notes:
+        Has the same get, set, delete and clear methods as
+        MemoryCache, so it can be used as the backend of a
+        ResponseCache, a FragmentCache or the session storage.
+        Values are pickled, values which don't fit in a slot
+        aren't stored.  When every slot of a set is in use, the
+        entry closest to expiring is evicted.  Pinned entries are
+        stored with a negative expiry time, they never expire and
+        are never evicted.
+
+        Keys must have a stable repr, such as strings, numbers
+        and tuples of them.  The hits, misses and evictions
+        counters only count operations of the current process
+    """
+
+    def __init__(self, path, slots=8192, slot_size=8192, ways=8):
+        """ Init
+
+        Notes:
+            The file is created if it doesn't exist, and
+            reinitialized if it was created with a different
+            number or size of slots.  Raises OSError if the file
+            is a symbolic link, isn't owned by the current user or
+            is writable by other users
+
+        Args:
+            path: The file to map
+
+        Kwargs:
+            slots: Number of slots, rounded up to a multiple of ways
+            slot_size: Size of a slot in bytes, including a 32 byte header
+            ways: Number of slots a key can be stored in
+        """
+        if slot_size <= _SLOT_HEADER.size:
+            raise ValueError('slot_size must be larger than {0}'.format(_SLOT_HEADER.size))
+        self.path = path
+        self.ways = ways
+        self.sets = max(1, (slots + ways - 1) // ways)
+        self.slots = self.sets * ways
+        self.slot_size = slot_size
+        self.max_value_size = slot_size - _SLOT_HEADER.size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        size = _HEADER_SIZE + self.slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+        try:
+            _check_owner(os.fstat(self._fd), path)
+        except OSError:
+            os.close(self._fd)
+            raise
+        self._lock_range(0, 0)
+        try:
+            header = os.read(self._fd, _FILE_HEADER.size)
+            expected = _FILE_HEADER.pack(_MAGIC, 1, self.slots, slot_size)
+            if header != expected:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, expected)
+        finally:
+            self._unlock_range(0, 0)
+        self._map = mmap.mmap(self._fd, size)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """ Returns the SharedMemoryCache configured by the distill.shm_cache.* settings
+
+        Notes:
+            One instance is kept per path, so everything
+            configured with the same settings in a process
+            shares both the cache and its locks.  Without a
+            distill.shm_cache.path, default_path() is used
+        """
+        path = settings.get('distill.shm_cache.path') or default_path()
+        with _caches_lock:
+            if path not in _caches:
+                _caches[path] = cls(path, slots=settings.get('distill.shm_cache.slots', 8192),
+                                    slot_size=settings.get('distill.shm_cache.slot_size', 8192),
+                                    ways=settings.get('distill.shm_cache.ways', 8))
+            return _caches[path]
+
+    def _lock_range(self, start, length):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+
+    def _unlock_range(self, start, length):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _set_offset(self, digest):
+        index = struct.unpack_from('<Q', digest)[0] % self.sets
+        return _HEADER_SIZE + index * self.ways * self.slot_size
+
+    def _read(self, offset, digest):
+        """ Returns (expires, data) of the slot at offset if it holds digest
+
+        Notes:
+            Returns None if the slot holds a different key, and
+            treats a slot being written throughout every retry
+            as not holding it
+        """
+        mm = self._map
+        for _ in range(_RETRIES):
+            seq, slot_digest, expires, length = _SLOT_HEADER.unpack_from(mm, offset)
+            if seq & 1:
+                continue
+            if slot_digest != digest:
+                return None
+            start = offset + _SLOT_HEADER.size
+            data = mm[start:start + min(length, self.max_value_size)]
+            if struct.unpack_from('<I', mm, offset)[0] == seq:
+                return expires, data
+        return None
+
+    def _write(self, offset, digest, expires, data):
+        """Writes a slot, the set it belongs to must be locked"""
+        mm = self._map
+        seq = struct.unpack_from('<I', mm, offset)[0]
+        struct.pack_into('<I', mm, offset, (seq + 1) & 0xffffffff)
+        start = offset + _SLOT_HEADER.size
+        mm[start:start + len(data)] = data
+        struct.pack_into('<16sdI', mm, offset + 4, digest, expires, len(data))
+        struct.pack_into('<I', mm, offset, (seq + 2) & 0xffffffff)
+
+    def get(self, key, default=None):
+        """Returns the value stored for key, unless it has expired"""
+        digest = _digest(key)
+        offset = self._set_offset(digest)
+        for way in range(self.ways):
+            found = self._read(offset + way * self.slot_size, digest)
+            if found is not None:
+                expires, data = found
+                if 0 < expires <= time.time():
+                    break
+                try:
+                    value = pickle.loads(data)
+                except Exception:
+                    break
+                self.hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def set(self, key, value, size=None, ttl=None, pin=False):
+        """ Stores value for ttl seconds
+
+        Notes:
+            Returns False if the pickled value doesn't fit in a slot,
+            or every slot it could go in holds a pinned entry
+
+        Args:
+            key: The key to store value under
+            value: The value to store, it must be pickleable
+            size: Unused, the size of the pickled value is used
+
+        Kwargs:
+            ttl: Seconds before the value expires, None to never expire
+            pin: Keep the value until it is replaced or deleted,
+                 ignoring ttl
+        """
+        return self._store(key, value, ttl, pin, True)
+
+    def add(self, key, value, size=None, ttl=None, pin=False):
+        """ Stores value like set, unless a value is already stored for key
+
+        Notes:
+            Returns True if value was stored.  Checking for the
+            key and storing the value happen under the set's lock,
+            so only one of several processes adding a key stores it
+        """
+        return self._store(key, value, ttl, pin, False)
+
+    def _store(self, key, value, ttl, pin, replace):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_value_size:
+            if replace:
+                self.delete(key)
+            return False
+        digest = _digest(key)
+        now = time.time()
+        if pin:
+            expires = -1.0
+        else:
+            expires = now + ttl if ttl is not None else 0.0
+        offset = self._set_offset(digest)
+        length = self.ways * self.slot_size
+        with self._lock:
+            self._lock_range(offset, length)
+            try:
+                target = victim = None
+                victim_expires = None
+                for way in range(self.ways):
+                    slot = offset + way * self.slot_size
+                    _, slot_digest, slot_expires, _ = _SLOT_HEADER.unpack_from(self._map, slot)
+                    if slot_digest == digest:
+                        if not replace and not 0 < slot_expires <= now:
+                            return False
+                        target = slot
+                        break
+                    if target is None and (slot_digest == _EMPTY or 0 < slot_expires <= now):
+                        target = slot
+                    if slot_expires < 0:
+                        continue
+                    rank = slot_expires or float('inf')
+                    if victim is None or rank < victim_expires:
+                        victim, victim_expires = slot, rank
+                if target is None:
+                    if victim is None:
+                        return False
+                    target = victim
+                    self.evictions += 1
+                self._write(target, digest, expires, data)
+            finally:
+                self._unlock_range(offset, length)
+        return True
+
+    def delete(self, key):
+        """Removes the value stored for key"""
+        digest = _digest(key)
+        offset = self._set_offset(digest)
+        length = self.ways * self.slot_size
+        with self._lock:
+            self._lock_range(offset, length)
+            try:
+                for way in range(self.ways):
+                    slot = offset + way * self.slot_size
+                    if _SLOT_HEADER.unpack_from(self._map, slot)[1] == digest:
+                        self._write(slot, _EMPTY, 0.0, b'')
+            finally:
+                self._unlock_range(offset, length)
+
+    def clear(self):
+        """Removes all entries from the cache"""
+        with self._lock:
+            self._lock_range(0, 0)
+            try:
+                for slot in range(self.slots):
+                    offset = _HEADER_SIZE + slot * self.slot_size
+                    if _SLOT_HEADER.unpack_from(self._map, offset)[1] != _EMPTY:
+                        self._write(offset, _EMPTY, 0.0, b'')
+            finally:
+                self._unlock_range(0, 0)
+
+    def close(self):
+        """Unmaps the file"""
+        with _caches_lock:
+            if _caches.get(self.path) is self:
+                del _caches[self.path]
+        self._map.close()
+        os.close(self._fd)
+
+    def __len__(self):
+        now = time.time()
+        count = 0
+        for slot in range(self.slots):
+            _, digest, expires, _ = _SLOT_HEADER.unpack_from(self._map, _HEADER_SIZE + slot * self.slot_size)
+            if digest != _EMPTY and not 0 < expires <= now:
+                count += 1
+        return count
+
+    def __contains__(self, key):
+        return self.get(key, _EMPTY) is not _EMPTY
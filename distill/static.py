@@ -0,0 +1,513 @@
+""" Static file serving
+
+Notes:
+    Mount a directory on an application with Distill.add_static.
+    Open file descriptors and their stat results are cached, and
+    files are read with pread, so one descriptor is shared by every
+    request for a file.  When the server provides wsgi.file_wrapper,
+    files are sent with sendfile, otherwise they're sent from a memory
+    map.  Range requests, including multiple ranges, are supported
+"""
+import binascii
+import errno
+import mimetypes
+import mmap
+import os
+import posixpath
+import stat
+import threading
+import time
+from collections import OrderedDict
+from distill.conditional import http_date, not_modified, parse_http_date, make_not_modified
+from distill.exceptions import HTTPNotFound
+
+
+class CachedFile(object):
+    """ An open file descriptor shared between requests
+
+    Notes:
+        The descriptor is closed once the file has been evicted
+        from the cache and no response is still using it
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            self.stat = os.fstat(self.fd)
+        except OSError:
+            os.close(self.fd)
+            raise
+        self.checked = time.time()
+        self.refs = 0
+        self.evicted = False
+        self._mmap = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.stat.st_size
+
+    @property
+    def etag(self):
+        return '"{0:x}-{1:x}-{2:x}"'.format(self.stat.st_ino, int(self.stat.st_mtime * 1000000), self.stat.st_size)
+
+    def pread(self, size, offset):
+        if hasattr(os, 'pread'):
+            return os.pread(self.fd, size, offset)
+        with self._lock:  # pragma: no cover
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, size)
+
+    def mmap(self):
+        """ Returns a read only memory map of the file, or None if it can't be mapped
+
+        Notes:
+            Reading a page of a map past the end of a file raises
+            SIGBUS, so None is also returned once the file has been
+            changed in place since it was cached.  A file truncated
+            while a response is being sent from its map still does
+            that, use_mmap should only be used for files which are
+            replaced rather than rewritten
+        """
+        try:
+            st = os.fstat(self.fd)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime) != (self.stat.st_size, self.stat.st_mtime):
+            return None
+        with self._lock:
+            if self._mmap is None and self.size:
+                try:
+                    self._mmap = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ)
+                except (EnvironmentError, ValueError):
+                    return None
+            return self._mmap
+
+    def reopen(self, offset):
+        """ Returns a new descriptor of the file, positioned at offset
+
+        Notes:
+            Raises OSError if the file can't be opened, or if the
+            path is now a different file
+        """
+        fd = os.open(self.path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            st = os.fstat(fd)
+            if (st.st_dev, st.st_ino) != (self.stat.st_dev, self.stat.st_ino):
+                raise OSError(errno.ENOENT, 'File has been replaced', self.path)
+            os.lseek(fd, offset, os.SEEK_SET)
+        except OSError:
+            os.close(fd)
+            raise
+        return fd
+
+    def changed(self):
+        """Returns True if the file on disk is no longer the cached file"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return True
+        return (st.st_ino, st.st_size, st.st_mtime) != (self.stat.st_ino, self.stat.st_size, self.stat.st_mtime)
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Still exported by a response being sent, the
+                # map is then closed once it's garbage collected
+                pass
+            self._mmap = None
+        os.close(self.fd)
+        self.fd = None
+
+
+class FileCache(object):
+    """ A thread safe cache of open files
+
+    Notes:
+        Files are checked for changes on disk once they've been
+        cached for ttl seconds.  Once more than max_open files are
+        open, the least recently used files are evicted
+    """
+
+    def __init__(self, ttl=5, max_open=256):
+        """ Init
+
+        Kwargs:
+            ttl: Seconds before a cached file is checked for changes
+            max_open: Maximum number of files to keep open
+        """
+        self.ttl = ttl
+        self.max_open = max_open
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        """ Returns the CachedFile for path, opening it if needed
+
+        Notes:
+            Raises OSError if the file can't be opened.  The file
+            must be passed to release once the caller is done with it
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._files.pop(path, None)
+            if cached is not None and now - cached.checked > self.ttl:
+                if cached.changed():
+                    self._evict(cached)
+                    cached = None
+                else:
+                    cached.checked = now
+            if cached is None:
+                cached = CachedFile(path)
+            cached.refs += 1
+            self._files[path] = cached
+            while len(self._files) > self.max_open:
+                self._evict(self._files.popitem(last=False)[1])
+            return cached
+
+    def release(self, cached):
+        with self._lock:
+            cached.refs -= 1
+            if cached.evicted and cached.refs == 0:
+                cached.close()
+
+    def _evict(self, cached):
+        cached.evicted = True
+        if cached.refs == 0:
+            cached.close()
+
+    def clear(self):
+        with self._lock:
+            for cached in self._files.values():
+                self._evict(cached)
+            self._files.clear()
+
+    def __len__(self):
+        return len(self._files)
+
+
+class FileSlice(object):
+    """ A file-like view of part of a cached file
+
+    Notes:
+        Reads use pread, so slices of the same file can be read
+        concurrently.  fileno and tell allow servers to send the
+        slice with sendfile.  Some servers take the offset to send
+        from with lseek rather than tell, so a slice which doesn't
+        start at the beginning of the file has a descriptor of its
+        own, positioned at its start.  Closing the slice releases
+        the file
+    """
+
+    def __init__(self, cache, cached, start, length):
+        self._cache = cache
+        self._cached = cached
+        self.start = start
+        self.length = length
+        self.pos = 0
+        self._fd = None
+
+    def read(self, size=-1):
+        remaining = self.length - self.pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        data = self._cached.pread(size, self.start + self.pos)
+        self.pos += len(data)
+        return data
+
+    def fileno(self):
+        if not self.start:
+            return self._cached.fd
+        if self._fd is None:
+            self._fd = self._cached.reopen(self.start)
+        return self._fd
+
+    def tell(self):
+        return self.start + self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.pos = offset - self.start
+        elif whence == 1:
+            self.pos += offset
+        else:
+            self.pos = self.length + offset
+        return self.tell()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._cached is not None:
+            self._cache.release(self._cached)
+            self._cached = None
+
+    @property
+    def closed(self):
+        return self._cached is None
+
+
+class MmapChunks(object):
+    """Iterates over memoryviews of part of a memory mapped file"""
+
+    def __init__(self, cache, cached, mapped, start, length, block_size):
+        self._cache = cache
+        self._cached = cached
+        self._view = memoryview(mapped)
+        self.pos = start
+        self.end = start + length
+        self.block_size = block_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pos >= self.end or self._view is None:
+            raise StopIteration()
+        end = min(self.pos + self.block_size, self.end)
+        chunk = self._view[self.pos:end]
+        self.pos = end
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            self._cache.release(self._cached)
+
+
+def parse_range(header, size, max_ranges=16):
+    """ Parses a Range header into a list of (start, end) pairs
+
+    Notes:
+        end is exclusive.  Returns None if the header is malformed
+        or has too many ranges, in which case it should be ignored,
+        and an empty list if none of the ranges can be satisfied
+
+    Args:
+        header: The value of the Range header
+        size: The size of the file
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    specs = header[6:].split(',')
+    if len(specs) > max_ranges:
+        return None
+    ranges = []
+    for spec in specs:
+        start, sep, end = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not start:
+                suffix = int(end)
+                if suffix <= 0 or not size:
+                    continue
+                ranges.append((max(size - suffix, 0), size))
+                continue
+            start = int(start)
+            end = int(end) + 1 if end else size
+        except ValueError:
+            return None
+        if start < 0 or end <= start < size:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size)))
+    return ranges
+
+
+class StaticFiles(object):
+    """ Serves the files in a directory
+
+    Notes:
+        Used as an action, with the path of the requested file
+        relative to the directory in the path variable of the
+        route's matchdict.  Paths leaving the directory, hidden
+        files and directories are answered with HTTPNotFound
+    """
+
+    def __init__(self, directory, cache_ttl=5, max_open=256, block_size=65536, max_age=None, max_ranges=16,
+                 index='index.html', use_mmap=True):
+        """ Init
+
+        Args:
+            directory: The directory to serve files from
+
+        Kwargs:
+            cache_ttl: Seconds before a cached file is checked for changes
+            max_open: Maximum number of files to keep open
+            block_size: Size of the blocks files are sent in
+            max_age: Adds a Cache-Control max-age if set
+            max_ranges: Maximum number of ranges in a Range request
+            index: File served for a directory, or None
+            use_mmap: Send from a memory map when sendfile isn't available
+        """
+        self.directory = os.path.abspath(directory)
+        self.cache = FileCache(cache_ttl, max_open)
+        self.block_size = block_size
+        self.max_age = max_age
+        self.max_ranges = max_ranges
+        self.index = index
+        self.use_mmap = use_mmap
+
+    def resolve(self, path):
+        """Returns the filesystem path of a request path, or None if it isn't allowed"""
+        if '\x00' in path or '\\' in path:
+            return None
+        parts = []
+        for part in posixpath.normpath('/' + path).split('/'):
+            if not part:
+                continue
+            if part.startswith('.'):
+                return None
+            parts.append(part)
+        return os.path.join(self.directory, *parts)
+
+    def __call__(self, request, response):
+        path = self.resolve(request.matchdict.get('path') or '')
+        if path is None:
+            raise HTTPNotFound()
+        cached = self._acquire(path)
+        if self.index and stat.S_ISDIR(cached.stat.st_mode):
+            self.cache.release(cached)
+            path = os.path.join(path, self.index)
+            cached = self._acquire(path)
+        if not stat.S_ISREG(cached.stat.st_mode):
+            self.cache.release(cached)
+            raise HTTPNotFound()
+
+        size = cached.size
+        content_type, encoding = mimetypes.guess_type(path)
+        if encoding is not None:
+            # Compressed files are sent as they are, not decoded by the client
+            content_type = 'application/gzip' if encoding == 'gzip' else None
+        response.headers['Content-Type'] = content_type or 'application/octet-stream'
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['ETag'] = cached.etag
+        response.headers['Last-Modified'] = http_date(cached.stat.st_mtime)
+        if self.max_age is not None:
+            response.headers['Cache-Control'] = 'public, max-age={0}'.format(self.max_age)
+
+        if not_modified(request.env, response):
+            self.cache.release(cached)
+            make_not_modified(response)
+            return response
+
+        ranges = None
+        if 'HTTP_RANGE' in request.env and self._if_range(request.env.get('HTTP_IF_RANGE'), cached):
+            ranges = parse_range(request.env['HTTP_RANGE'], size, self.max_ranges)
+        if ranges is not None and not ranges:
+            self.cache.release(cached)
+            response.status = '416 Range Not Satisfiable'
+            response.headers['Content-Range'] = 'bytes */{0}'.format(size)
+            del response.headers['Content-Type']
+            return response
+
+        if ranges is None:
+            self._send(request, response, cached, 0, size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response.status = '206 Partial Content'
+            response.headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end - 1, size)
+            self._send(request, response, cached, start, end - start)
+        else:
+            response.status = '206 Partial Content'
+            self._send_multipart(response, cached, ranges, size)
+        return response
+
+    def _acquire(self, path):
+        try:
+            return self.cache.acquire(path)
+        except (OSError, IOError):
+            raise HTTPNotFound()
+
+    @staticmethod
+    def _if_range(if_range, cached):
+        """ Returns True if there is no If-Range, or it matches the file
+
+        Notes:
+            A date only matches the file's exact Last-Modified
+            date, as RFC 7233 requires
+        """
+        if not if_range:
+            return True
+        if if_range.startswith('W/'):
+            # Weak ETags can't be used with If-Range
+            return False
+        if if_range.startswith('"'):
+            return if_range.strip() == cached.etag
+        date = parse_http_date(if_range)
+        return date is not None and int(cached.stat.st_mtime) == date
+
+    def _send(self, request, response, cached, start, length):
+        response.block_size = self.block_size
+        if 'wsgi.file_wrapper' not in request.env and self.use_mmap:
+            mapped = cached.mmap()
+            if mapped is not None:
+                response.body = MmapChunks(self.cache, cached, mapped, start, length, self.block_size)
+                response.headers['Content-Length'] = str(length)
+                return
+        response.file = FileSlice(self.cache, cached, start, length)
+        response.file_len = length
+        if not length:
+            response.headers['Content-Length'] = '0'
+
+    def _send_multipart(self, response, cached, ranges, size):
+        boundary = binascii.hexlify(os.urandom(16)).decode('ascii')
+        content_type = response.headers['Content-Type']
+        headers = []
+        length = 0
+        for start, end in ranges:
+            part = ('\r\n--{0}\r\nContent-Type: {1}\r\nContent-Range: bytes {2}-{3}/{4}\r\n\r\n'
+                    .format(boundary, content_type, start, end - 1, size)).encode('latin-1')
+            headers.append(part)
+            length += len(part) + end - start
+        trailer = '\r\n--{0}--\r\n'.format(boundary).encode('latin-1')
+        length += len(trailer)
+
+        response.headers['Content-Type'] = 'multipart/byteranges; boundary={0}'.format(boundary)
+        response.headers['Content-Length'] = str(length)
+        response.body = _MultipartRanges(self.cache, cached, zip(headers, ranges), trailer, self.block_size)
+
+
+class _MultipartRanges(object):
+    """Iterates over the parts of a multipart/byteranges body"""
+
+    def __init__(self, cache, cached, parts, trailer, block_size):
+        self._cache = cache
+        self._cached = cached
+        self._chunks = self._iter(list(parts), trailer, block_size)
+
+    def _iter(self, parts, trailer, block_size):
+        for header, (start, end) in parts:
+            yield header
+            while start < end:
+                data = self._cached.pread(min(block_size, end - start), start)
+                if not data:
+                    return
+                start += len(data)
+                yield data
+        yield trailer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._cached is None:
+            raise StopIteration()
+        return next(self._chunks)
+
+    next = __next__
+
+    def close(self):
+        if self._cached is not None:
+            self._chunks.close()
+            self._cache.release(self._cached)
+            self._cached = None
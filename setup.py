@@ -11,6 +11,9 @@ setup(
     description='Just another python web framework',
     install_requires=['mako', 'routes'],
     test_suite='nose.collector',
+    entry_points={
+        'console_scripts': ['distill = distill.serve:main'],
+    },
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Intended Audience :: Developers",
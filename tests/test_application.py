@@ -1,4 +1,7 @@
 import os
+import shutil
+import tempfile
+import warnings
 from distill.sessions import UnencryptedLocalSessionStorage
 
 try:
@@ -6,7 +9,8 @@ try:
 except ImportError:
     import unittest
 import json
-from distill.decorators import before, after
+from io import BytesIO
+from distill.decorators import before, after, cache_response
 from distill.exceptions import HTTPNotFound, HTTPBadRequest, HTTPErrorResponse, HTTPInternalServerError
 from distill.application import Distill
 from distill.renderers import renderer, JSON
@@ -94,6 +98,20 @@ class TestController(object):
         return {'data': True}
 
 
+class CountingController(object):
+    instances = 0
+
+    def __init__(self):
+        CountingController.instances += 1
+
+    def GET_count(self, request, response):
+        return str(CountingController.instances)
+
+    @staticmethod
+    def GET_static(request, response):
+        return 'static'
+
+
 def edit_res(request, response):
     response.status = '719 I am not a teapot'
     response.body = 'Hello'
@@ -169,6 +187,39 @@ class TestApplication(unittest.TestCase):
         resp, body = self.simulate_request(app, 'GET', '/internalservererror', None, '')
         self.assertEqual(resp.status, '200 OK')
 
+    def test_frozen(self):
+        app = Distill(settings={
+            'distill.document_root': os.path.abspath(os.path.join(os.path.dirname(__file__), 'res'))
+        })
+        app.add_renderer('prettyjson', JSON(indent=4))
+        app.add_controller('testcontroller', TestController)
+        app.map_connect('home', '/', action=GET_home, conditions={"method": ["GET"]})
+        app.map_connect('userinfo', '/:user/userinfo', action=userinfo)
+        app.map_connect('homecontroller', '/controller', action='GET_home', controller='testcontroller')
+        app.map_connect('homecontroller3', '/actionNA', action='noaction', controller='testcontroller')
+        app.map_connect('editresp', '/editresp', action=edit_res)
+        app.map_connect('user', '/:user', action=user)
+        app.freeze()
+
+        resp, body = self.simulate_request(app, 'GET', '', None, '')
+        self.assertIn('X-Resp-Callback', resp.headers)
+        self.assertRaises(HTTPNotFound, self.simulate_request, app, 'POST', '', None, '')
+        self.assertRaises(HTTPNotFound, self.simulate_request, app, 'GET', '/foo/bar/baz', None, '')
+        self.assertRaises(HTTPNotFound, self.simulate_request, app, 'GET', '/actionNA', None, '')
+
+        resp, body = self.simulate_request(app, 'GET', '/controller', None, '')
+        self.assertTrue(json.loads(body)['data'])
+        resp, body = self.simulate_request(app, 'GET', '/editresp', None, '')
+        self.assertEqual(body, 'Hello')
+        self.assertRaises(HTTPErrorResponse, self.simulate_request, app, 'POST', '/Foo/userinfo', None, '')
+        resp, body = self.simulate_request(app, 'GET', '/Foo', None, '')
+        self.assertEqual(body, 'Hello world')
+
+        # Routes connected after freezing are picked up
+        app.map_connect('late', '/late/route', action=edit_res)
+        resp, body = self.simulate_request(app, 'GET', '/late/route', None, '')
+        self.assertEqual(body, 'Hello')
+
     def test_before_after(self):
         def test_before1(request, response):
             response.headers['X-Before1'] = 'true'
@@ -208,14 +259,214 @@ class TestApplication(unittest.TestCase):
         resp, body = self.simulate_request(app, 'GET', '/internalservererror', None, '')
         self.assertEqual(resp.status, '200 OK')
 
+    def test_controller_lifecycle(self):
+        app = Distill()
+        for name in ['request', 'singleton', 'pooled']:
+            app.map_connect('count' + name, '/count/' + name, controller=name, action='GET_count')
+            app.map_connect('static' + name, '/static/' + name, controller=name, action='GET_static')
+
+        CountingController.instances = 0
+        app.add_controller('request', CountingController)
+        self.assertEqual(self.simulate_request(app, 'GET', '/count/request', None, '')[1], '1')
+        self.assertEqual(self.simulate_request(app, 'GET', '/count/request', None, '')[1], '2')
+        self.assertEqual(self.simulate_request(app, 'GET', '/static/request', None, '')[1], 'static')
+
+        CountingController.instances = 0
+        app.add_controller('singleton', CountingController, lifecycle='singleton')
+        self.assertEqual(self.simulate_request(app, 'GET', '/count/singleton', None, '')[1], '1')
+        self.assertEqual(self.simulate_request(app, 'GET', '/count/singleton', None, '')[1], '1')
+        self.assertEqual(self.simulate_request(app, 'GET', '/static/singleton', None, '')[1], 'static')
+
+        CountingController.instances = 0
+        app.add_controller('pooled', CountingController, lifecycle='pooled', pool_size=1)
+        self.assertEqual(self.simulate_request(app, 'GET', '/count/pooled', None, '')[1], '1')
+        self.assertEqual(self.simulate_request(app, 'GET', '/count/pooled', None, '')[1], '1')
+        self.assertEqual(self.simulate_request(app, 'GET', '/static/pooled', None, '')[1], 'static')
+
+        self.assertRaises(ValueError, app.add_controller, 'bad', CountingController, lifecycle='bad')
+        self.assertRaises(ValueError, app.add_controller, 'pooled', CountingController, lifecycle='bad')
+        self.assertEqual(self.simulate_request(app, 'GET', '/count/pooled', None, '')[1], '1')
+
+    def test_route_cache(self):
+        app = Distill(settings={'distill.routing.cache_size': 2})
+        app.map_connect('userinfo', '/:user/userinfo', action=userinfo)
+        app.map_connect('editresp', '/editresp', action=edit_res, conditions={"method": ["GET"]})
+
+        resp, body = self.simulate_request(app, 'GET', '/editresp', None, '')
+        self.assertEqual(body, 'Hello')
+        resp, body = self.simulate_request(app, 'GET', '/editresp', None, '')
+        self.assertEqual(body, 'Hello')
+        self.assertEqual(app.route_cache.hits, 1)
+        self.assertEqual(app.route_cache.misses, 1)
+        self.assertRaises(HTTPNotFound, self.simulate_request, app, 'POST', '/editresp', None, '')
+        self.assertEqual(app.route_cache.misses, 2)
+
+        self.simulate_request(app, 'GET', '/Dreae/userinfo', None, '')
+        self.simulate_request(app, 'GET', '/Foo/userinfo', None, '')
+        self.assertEqual(len(app.route_cache), 2)
+        self.assertNotIn(('GET', '/editresp'), app.route_cache)
+
+        app.map_connect('user', '/:user', action=user)
+        self.assertEqual(len(app.route_cache), 0)
+        resp, body = self.simulate_request(app, 'GET', '/Foo', None, '')
+        self.assertEqual(body, 'Hello world')
+
+        app.map_connect('func', '/func', action=user, conditions={'function': lambda env, match: True})
+        resp, body = self.simulate_request(app, 'GET', '/Foo', None, '')
+        self.assertEqual(len(app.route_cache), 0)
+
+    def test_streaming(self):
+        closed = []
+
+        def report(request, response):
+            response.headers['Content-Type'] = 'text/csv'
+            try:
+                yield 'id,name\n'
+                for i in range(3):
+                    yield '{0},row {0}\n'.format(i).encode('utf-8')
+            finally:
+                closed.append(True)
+
+        def assigned(request, response):
+            response.body = iter([b'foo', u'b\xe4r'])
+            response.headers['Content-Type'] = 'text/plain'
+
+        app = Distill()
+        app.map_connect('report', '/report', action=report)
+        app.map_connect('assigned', '/assigned', action=assigned)
+
+        headers = []
+        env = {'wsgi.input': StringIO(''), 'wsgi.errors': None, 'wsgi.url_scheme': 'https',
+               'PATH_INFO': '/report', 'SERVER_PORT': '8080', 'QUERY_STRING': '', 'SERVER_NAME': 'foobar.baz',
+               'REQUEST_METHOD': 'GET'}
+        result = app(env, lambda status, h, exc_info=None: headers.extend(h))
+        self.assertNotIn('Content-Length', dict(headers))
+        self.assertEqual(dict(headers)['Content-Type'], 'text/csv')
+        self.assertFalse(closed)
+        self.assertEqual(next(result), b'id,name\n')
+        result.close()
+        self.assertEqual(closed, [True])
+
+        env['PATH_INFO'] = '/assigned'
+        result = app(env, lambda status, h, exc_info=None: None)
+        self.assertEqual(list(result), [b'foo', u'b\xe4r'.encode('utf-8')])
+
+        app.map_connect('file', '/file', action=lambda request, response: BytesIO(b'line 1\nline 2\n'))
+        env['PATH_INFO'] = '/file'
+        result = app(env, lambda status, h, exc_info=None: headers.extend(h))
+        self.assertEqual(b''.join(result), b'line 1\nline 2\n')
+        result.close()
+
+    def test_streaming_request_body(self):
+        def echo(request, response):
+            view = request.body_view
+
+            def chunks():
+                yield view[:3]
+                yield view[3:]
+            response.body = chunks()
+
+        app = Distill()
+        app.map_connect('echo', '/echo', action=echo)
+        env = {'wsgi.input': BytesIO(b'foobar'), 'wsgi.errors': None, 'wsgi.url_scheme': 'https',
+               'PATH_INFO': '/echo', 'SERVER_PORT': '8080', 'QUERY_STRING': '', 'SERVER_NAME': 'foobar.baz',
+               'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/octet-stream', 'CONTENT_LENGTH': '6'}
+        result = app(env, lambda status, h, exc_info=None: None)
+        # The body is still being read, so its buffer isn't back in the pool yet
+        self.assertEqual(len(app.buffer_pool), 0)
+        self.assertEqual([bytes(chunk) for chunk in result], [b'foo', b'bar'])
+        result.close()
+        self.assertEqual(len(app.buffer_pool), 1)
+
+    def test_response_cache(self):
+        calls = []
+
+        @cache_response(60, vary=['Accept-Language'])
+        def cached(request, response):
+            calls.append(request.headers.get('Accept-Language'))
+            response.body = json.dumps({'calls': len(calls)})
+
+        def per_route(request, response):
+            calls.append(None)
+            response.body = '{}'
+
+        app = Distill(settings={'distill.response_cache.enabled': True,
+                                'distill.document_root': '', 'distill.etags.enabled': True})
+        app.map_connect('cached', '/cached', action=cached)
+        app.map_connect('route', '/route', action=per_route, cache_ttl=60)
+
+        resp, body = self.simulate_request(app, 'GET', '/cached', None, '')
+        self.assertEqual(json.loads(body)['calls'], 1)
+        resp, body = self.simulate_request(app, 'GET', '/cached', None, '')
+        self.assertEqual(json.loads(body)['calls'], 1)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(app.response_cache.hits, 1)
+
+        resp, body = self.simulate_request(app, 'GET', '/cached', None, '', HTTP_IF_NONE_MATCH=resp.headers['ETag'])
+        self.assertEqual(resp.status, '304 Not Modified')
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertEqual(len(calls), 1)
+
+        self.simulate_request(app, 'GET', '/cached', None, '', HTTP_ACCEPT_LANGUAGE='de')
+        self.assertEqual(calls, [None, 'de'])
+        self.simulate_request(app, 'POST', '/cached', None, '')
+        self.assertEqual(len(calls), 3)
+
+        self.simulate_request(app, 'GET', '/route', None, '')
+        self.simulate_request(app, 'GET', '/route', None, '')
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(app.response_cache.stores, 3)
+
+    def test_render_factories(self):
+        root = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root, 'test.mako'), 'w') as fp:
+                fp.write('Goodbye ${user}!')
+
+            @renderer('test.mako')
+            def page(request, response):
+                return {'user': 'Foobar'}
+
+            @renderer('text')
+            def text(request, response):
+                return 'foo'
+
+            apps = []
+            for document_root, prefix in ((os.path.join(os.path.dirname(__file__), 'res'), 'first'),
+                                          (root, 'second')):
+                app = Distill(settings={'distill.document_root': document_root})
+                app.add_renderer('text', lambda data, request, response, prefix=prefix: prefix + ' ' + data)
+                app.map_connect('page', '/page', action=page)
+                app.map_connect('text', '/text', action=text)
+                apps.append(app)
+
+            self.assertIsNot(apps[0].render_factory, apps[1].render_factory)
+            self.assertEqual(self.simulate_request(apps[0], 'GET', '/page', None, '')[1], 'Hello Foobar!')
+            self.assertEqual(self.simulate_request(apps[1], 'GET', '/page', None, '')[1], 'Goodbye Foobar!')
+            self.assertEqual(self.simulate_request(apps[0], 'GET', '/text', None, '')[1], 'first foo')
+            self.assertEqual(self.simulate_request(apps[1], 'GET', '/text', None, '')[1], 'second foo')
+            self.assertIn('test.mako', apps[0].warmup())
+            self.assertEqual(list(apps[1].warmup()), ['test.mako'])
+
+            # Called on the class, the renderer goes to the application created last
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                Distill.add_renderer('text', lambda data, request, response: 'class ' + data)
+            self.assertEqual(caught[0].category, DeprecationWarning)
+            self.assertEqual(self.simulate_request(apps[0], 'GET', '/text', None, '')[1], 'first foo')
+            self.assertEqual(self.simulate_request(apps[1], 'GET', '/text', None, '')[1], 'class foo')
+        finally:
+            shutil.rmtree(root)
+
     @staticmethod
-    def simulate_request(app, method, path, querystring, body):
+    def simulate_request(app, method, path, querystring, body, **environ):
         fake_env = {'wsgi.input': StringIO(body), 'wsgi.errors': None, 'wsgi.url_scheme': 'https',
                     'CONTENT_LENGTH': len(body), 'PATH_INFO': path, 'SERVER_PORT': '8080',
                     'CONTENT_TYPE': 'application/x-www-form-urlencoded', 'HTTP_X_H_Test': 'Foobar',
                     'HTTP_CONTENT_TYPE': 'application/x-www-form-urlencoded', 'QUERY_STRING': querystring,
                     'HTTP_HOST': 'foobar.baz:8080', 'SERVER_NAME': 'foobar.baz', 'HTTP_FOO': 'bar',
                     'SCRIPT_NAME': '/some/script/dir', 'REQUEST_METHOD': method}
+        fake_env.update(environ)
 
         resp = Response()
 
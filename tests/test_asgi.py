@@ -0,0 +1,223 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from distill.application import Distill
+from distill.asgi import ThreadPool
+from distill.decorators import before, after, blocking
+from distill.exceptions import HTTPNotFound, HTTPBadRequest
+from distill.renderers import renderer
+from distill.request import Request
+
+
+async def do_before(request, response):
+    await asyncio.sleep(0)
+    response.headers['X-Before'] = 'true'
+
+
+def do_after(request, response):
+    response.headers['X-After'] = 'true'
+
+
+@before(do_before)
+@after(do_after)
+@renderer('json')
+async def userinfo(request, response):
+    await asyncio.sleep(0)
+    return {'user': request.matchdict['user'], 'post': request.POST}
+
+
+def sync_action(request, response):
+    return 'Hello world'
+
+
+async def bad_request(request, response):
+    raise HTTPBadRequest()
+
+
+async def on_bad_request(request, response):
+    await asyncio.sleep(0)
+    response.status = '200 OK'
+    return 'Handled'
+
+
+class AsyncController(object):
+    @renderer('json')
+    async def GET_home(self, request, response):
+        return {'data': True}
+
+
+def record_thread(request, response):
+    response.headers['X-Thread'] = threading.current_thread().name
+
+
+@blocking
+@renderer('json')
+def blocking_action(request, response):
+    return {'thread': threading.current_thread().name}
+
+
+@blocking
+class BlockingController(object):
+    def GET_home(self, request, response):
+        return threading.current_thread().name
+
+
+class TestASGI(unittest.TestCase):
+    def setUp(self):
+        self.app = Distill()
+        self.app.map_connect('userinfo', '/{user}/userinfo', action=userinfo)
+        self.app.map_connect('sync', '/sync', action=sync_action)
+        self.app.map_connect('bad', '/bad', action=bad_request)
+        self.app.map_connect('controller', '/controller', controller='async', action='GET_home')
+        self.app.add_controller('async', AsyncController)
+        self.app.on_except(HTTPBadRequest, on_bad_request)
+
+        async def middleware(request, response):
+            response.headers['X-Middleware'] = request.path
+
+        self.app.use(middleware)
+
+    def simulate_request(self, method, path, body=b'', headers=None):
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+                 'headers': headers or [], 'server': ('foobar.baz', 8080), 'client': ('127.0.0.1', 5000)}
+        messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                    {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.app.asgi(scope, receive, send))
+        start = sent[0]
+        body = b''.join(m['body'] for m in sent[1:])
+        self.assertFalse(sent[-1]['more_body'])
+        return start['status'], dict(start['headers']), body
+
+    def test_async_action(self):
+        body = b'foo=bar'
+        status, headers, body = self.simulate_request('POST', '/Dreae/userinfo', body, [
+            (b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', b'7')])
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'X-Before'], b'true')
+        self.assertEqual(headers[b'X-After'], b'true')
+        self.assertEqual(headers[b'X-Middleware'], b'/Dreae/userinfo')
+        self.assertEqual(json.loads(body.decode('utf-8')), {'user': 'Dreae', 'post': {'foo': 'bar'}})
+
+    def test_sync_action(self):
+        status, headers, body = self.simulate_request('GET', '/sync')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'Hello world')
+        self.assertEqual(headers[b'Content-Length'], b'11')
+
+    def test_controller(self):
+        status, headers, body = self.simulate_request('GET', '/controller')
+        self.assertEqual(json.loads(body.decode('utf-8')), {'data': True})
+
+    def test_errors(self):
+        status, headers, body = self.simulate_request('GET', '/bad')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'Handled')
+
+        status, headers, body = self.simulate_request('GET', '/nothing/here')
+        self.assertEqual(status, 404)
+        self.assertEqual(json.loads(body.decode('utf-8'))['title'], HTTPNotFound().title)
+
+    def test_blocking(self):
+        self.app.map_connect('blocking', '/blocking', action=blocking_action)
+        self.app.map_connect('blockingcontroller', '/blockingcontroller', controller='blocking', action='GET_home')
+        self.app.add_controller('blocking', BlockingController, lifecycle='singleton')
+        self.app.use(record_thread, before=False)
+        loop_thread = threading.current_thread().name
+
+        status, headers, body = self.simulate_request('GET', '/blocking')
+        thread = json.loads(body.decode('utf-8'))['thread']
+        self.assertNotEqual(thread, loop_thread)
+        self.assertNotEqual(headers[b'X-Thread'].decode('utf-8'), loop_thread)
+
+        status, headers, body = self.simulate_request('GET', '/blockingcontroller')
+        self.assertNotEqual(body.decode('utf-8'), loop_thread)
+
+        status, headers, body = self.simulate_request('GET', '/sync')
+        self.assertEqual(headers[b'X-Thread'].decode('utf-8'), loop_thread)
+        self.assertEqual(self.app.asgi.pool.queue_depth, 0)
+        self.assertEqual(self.app.asgi.pool.active, 0)
+        self.app.asgi.pool.shutdown()
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.app.asgi({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+    def test_streaming(self):
+        loop_thread = threading.current_thread().name
+        threads = []
+
+        def stream(request, response):
+            response.headers['X-Streamed'] = 'true'
+            for chunk in ('foo', 'bar', 'baz'):
+                threads.append(threading.current_thread().name)
+                yield chunk
+
+        self.app.map_connect('stream', '/stream', action=stream)
+        status, headers, body = self.simulate_request('GET', '/stream')
+        self.assertEqual(body, b'foobarbaz')
+        self.assertEqual(headers[b'X-Streamed'], b'true')
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+        self.app.asgi.pool.shutdown()
+
+    def test_release_on_error(self):
+        def broken(request, response):
+            raise ValueError()
+
+        self.app.map_connect('broken', '/broken', action=broken)
+        with mock.patch.object(Request, 'release') as release:
+            with self.assertRaises(ValueError):
+                self.simulate_request('GET', '/broken')
+            self.assertEqual(release.call_count, 1)
+
+    def test_pool_cancel(self):
+        pool = ThreadPool(1)
+        started = threading.Event()
+        finish = threading.Event()
+        calls = []
+
+        def wait():
+            started.set()
+            finish.wait()
+
+        async def main():
+            first = asyncio.ensure_future(pool.run(wait))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            second = asyncio.ensure_future(pool.run(calls.append, 1))
+            await asyncio.sleep(0)
+            self.assertEqual(pool.queue_depth, 1)
+            second.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+            self.assertEqual(pool.queue_depth, 0)
+            finish.set()
+            await first
+
+        asyncio.run(main())
+        pool.shutdown()
+        self.assertEqual(calls, [])
+        self.assertEqual(pool.queue_depth, 0)
+        self.assertEqual(pool.active, 0)
@@ -0,0 +1,26 @@
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from distill.buffers import BufferPool
+
+
+class TestBuffers(unittest.TestCase):
+    def test_pool(self):
+        pool = BufferPool(size=1, max_size=1024, min_size=64)
+        buf = pool.acquire(100)
+        self.assertEqual(len(buf), 128)
+        pool.release(buf)
+        self.assertEqual(len(pool), 1)
+        self.assertIs(pool.acquire(10), buf)
+        self.assertIsNot(pool.acquire(10), buf)
+
+        pool.release(buf)
+        pool.release(bytearray(64))
+        self.assertEqual(len(pool), 1)
+        self.assertIsNot(pool.acquire(256), buf)
+
+        big = pool.acquire(2048)
+        self.assertEqual(len(big), 2048)
+        pool.release(big)
+        self.assertIsNot(pool.acquire(2048), big)
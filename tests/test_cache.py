@@ -0,0 +1,118 @@
+import threading
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from distill.cache import FragmentCache, LRUCache, MemoryCache, ResponseCache, _generation
+from distill.response import Response
+
+
+class TestCache(unittest.TestCase):
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get('foo'))
+        self.assertEqual(cache.misses, 1)
+        cache.put('foo', 1)
+        cache.put('bar', 2)
+        self.assertEqual(cache.get('foo'), 1)
+        self.assertEqual(cache.hits, 1)
+        cache.put('baz', 3)
+        self.assertNotIn('bar', cache)
+        self.assertIn('foo', cache)
+        self.assertIn('baz', cache)
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_memory_cache(self):
+        cache = MemoryCache(max_bytes=10)
+        cache.set('foo', 'a', 4)
+        cache.set('bar', 'b', 4)
+        self.assertEqual(cache.get('foo'), 'a')
+        cache.set('baz', 'c', 4)
+        self.assertNotIn('bar', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.bytes, 8)
+        cache.set('big', 'd', 11)
+        self.assertNotIn('big', cache)
+        cache.set('old', 'e', 1, ttl=-1)
+        self.assertIsNone(cache.get('old'))
+        cache.delete('foo')
+        self.assertEqual(cache.bytes, 4)
+
+        # Pinned entries are never evicted, and add doesn't replace anything
+        self.assertTrue(cache.add('pinned', 'f', 1, pin=True))
+        self.assertFalse(cache.add('pinned', 'g', 1))
+        self.assertFalse(cache.add('baz', 'g', 1))
+        self.assertTrue(cache.add('old', 'g', 1))
+        for i in range(10):
+            cache.set(i, i, 4)
+        self.assertEqual(cache.get('pinned'), 'f')
+        self.assertLessEqual(cache.bytes, 10)
+        cache.delete('pinned')
+        self.assertNotIn('pinned', cache)
+
+    def test_generation(self):
+        backend = MemoryCache(max_bytes=100)
+        generations = []
+        start = threading.Event()
+
+        def generation():
+            start.wait()
+            generations.append(_generation(backend, 'gen'))
+
+        threads = [threading.Thread(target=generation) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(generations)), 1)
+
+        # Filling the backend doesn't evict the generation
+        for i in range(100):
+            backend.set(i, i, 10)
+        self.assertEqual(_generation(backend, 'gen'), generations[0])
+
+    def test_fragment_cache(self):
+        backend = MemoryCache()
+        cache = FragmentCache(backend)
+        cache.set('page.mako', 'nav', u'\xe9' * 10)
+        self.assertEqual(cache.get('page.mako', 'nav'), u'\xe9' * 10)
+        # Sizes are counted in encoded bytes
+        self.assertEqual(backend.bytes, 20)
+
+    def test_response_cache(self):
+        cache = ResponseCache()
+        env = {'PATH_INFO': '/foo', 'QUERY_STRING': 'a=1', 'HTTP_ACCEPT_LANGUAGE': 'en'}
+        resp = Response(headers={'Content-Type': 'text/plain', 'Vary': 'Accept-Encoding'})
+        resp.body = 'Hello'
+        resp.finalize(None)
+        self.assertIsNone(cache.get(env))
+        self.assertTrue(cache.store(env, resp, 60, vary=['Accept-Language']))
+        cached = cache.get(env)
+        self.assertEqual(cached.status, '200 OK')
+        self.assertEqual(cached.iterable, [b'Hello'])
+        self.assertIsNone(cache.get(dict(env, HTTP_ACCEPT_LANGUAGE='de')))
+        self.assertIsNone(cache.get(dict(env, HTTP_ACCEPT_ENCODING='gzip')))
+        self.assertIsNone(cache.get(dict(env, QUERY_STRING='a=2')))
+        self.assertEqual((cache.hits, cache.misses, cache.stores), (1, 4, 1))
+        self.assertIsNone(cache.get(dict(env, HTTP_HOST='other.example')))
+        self.assertIsNone(cache.get(dict(env, SCRIPT_NAME='/mounted')))
+        self.assertIsNone(cache.get(dict(env, **{'wsgi.url_scheme': 'https'})))
+
+        # Responses aren't shared with or stored for requests carrying credentials
+        self.assertIsNone(cache.get(dict(env, HTTP_COOKIE='session=1')))
+        self.assertFalse(cache.store(dict(env, HTTP_AUTHORIZATION='Basic Zm9v'), resp, 60))
+        self.assertTrue(cache.store(dict(env, HTTP_COOKIE='session=1'), resp, 60, vary=['Cookie']))
+        self.assertIsNotNone(cache.get(dict(env, HTTP_COOKIE='session=1')))
+
+        cache.invalidate('/foo', 'a=1')
+        self.assertIsNone(cache.get(env))
+
+        resp.headers['Set-Cookie'] = 'foo=bar'
+        resp.finalize(None)
+        self.assertFalse(cache.store(env, resp, 60))
+        resp = Response(status='404 Not Found')
+        resp.finalize(None)
+        self.assertFalse(cache.store(env, resp, 60))
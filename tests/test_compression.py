@@ -0,0 +1,99 @@
+import gzip
+import zlib
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from io import BytesIO
+from distill.application import Distill
+from distill.compression import Compressor, negotiate
+from distill.response import Response
+
+text = u'Hello world, h\xe9llo world. ' * 100
+
+
+class TestCompression(unittest.TestCase):
+    def test_negotiate(self):
+        self.assertEqual(negotiate('gzip, deflate, br'), 'gzip')
+        self.assertEqual(negotiate('deflate;q=1.0, gzip;q=0.5'), 'deflate')
+        self.assertEqual(negotiate('gzip;q=0, *'), 'deflate')
+        self.assertEqual(negotiate('x-gzip'), 'gzip')
+        self.assertIsNone(negotiate('br, identity'))
+        self.assertIsNone(negotiate('*;q=0'))
+        self.assertIsNone(negotiate(None))
+
+    def compress(self, resp, accept='gzip', **kwargs):
+        Compressor(**kwargs).compress({'HTTP_ACCEPT_ENCODING': accept}, resp)
+        resp.finalize(None)
+        return b''.join(resp.iterable)
+
+    def test_body(self):
+        resp = Response(headers={'Content-Type': 'text/html; charset=utf-8'})
+        resp.body = text
+        body = self.compress(resp)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(resp.headers['Content-Length'], str(len(body)))
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(body)).read().decode('utf-8'), text)
+
+        resp = Response(headers={'Content-Type': 'application/json', 'Vary': 'Cookie'})
+        resp.body = text
+        body = self.compress(resp, 'deflate')
+        self.assertEqual(resp.headers['Vary'], 'Cookie, Accept-Encoding')
+        self.assertEqual(zlib.decompress(body).decode('utf-8'), text)
+
+        for headers, body, accept in [({'Content-Type': 'text/html'}, 'small', 'gzip'),
+                                      ({'Content-Type': 'image/png'}, text, 'gzip'),
+                                      ({'Content-Type': 'text/html', 'Content-Encoding': 'br'}, text, 'gzip'),
+                                      ({'Content-Type': 'text/html'}, text, 'identity')]:
+            resp = Response(headers=headers)
+            resp.body = body
+            self.compress(resp, accept)
+            self.assertNotEqual(resp.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+
+    def test_stream(self):
+        closed = []
+
+        def chunks():
+            try:
+                for i in range(10):
+                    yield text
+            finally:
+                closed.append(True)
+
+        resp = Response(headers={'Content-Type': 'text/csv'})
+        resp.body = chunks()
+        Compressor(min_size=10 ** 6).compress({'HTTP_ACCEPT_ENCODING': 'gzip'}, resp)
+        resp.finalize(None)
+        first = next(resp.iterable)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # Each chunk is flushed, so it can be decompressed as soon as it arrives
+        self.assertEqual(decompressor.decompress(first).decode('utf-8'), text)
+        rest = b''.join(resp.iterable)
+        self.assertEqual(decompressor.decompress(rest).decode('utf-8'), text * 9)
+        resp.iterable.close()
+        self.assertEqual(closed, [True])
+        self.assertNotIn('Content-Length', resp.headers)
+
+        resp = Response(headers={'Content-Type': 'text/plain'})
+        resp.file = BytesIO(text.encode('utf-8'))
+        resp.file_len = len(text.encode('utf-8'))
+        body = self.compress(resp)
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(body)).read().decode('utf-8'), text)
+        self.assertNotIn('Content-Length', resp.headers)
+
+    def test_application(self):
+        def action(request, response):
+            response.headers['Content-Type'] = 'text/plain'
+            return text
+
+        app = Distill(settings={'distill.compression.enabled': True, 'distill.compression.level': 1})
+        app.map_connect('action', '/', action=action)
+        headers = {}
+        env = {'wsgi.input': BytesIO(b''), 'wsgi.errors': None, 'wsgi.url_scheme': 'http', 'PATH_INFO': '/',
+               'SERVER_PORT': '80', 'SERVER_NAME': 'localhost', 'REQUEST_METHOD': 'GET',
+               'HTTP_ACCEPT_ENCODING': 'gzip'}
+        body = b''.join(app(env, lambda status, h, exc_info=None: headers.update(h)))
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(body)).read().decode('utf-8'), text)
@@ -0,0 +1,108 @@
+import os
+import tempfile
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from io import BytesIO
+from distill.application import Distill
+from distill.conditional import etag_matches, not_modified, parse_http_date
+from distill.decorators import etag
+from distill.renderers import renderer
+from distill.response import Response
+
+calls = []
+
+
+@etag(lambda request: 'v' + request.matchdict['version'])
+@renderer('json')
+def versioned(request, response):
+    calls.append(True)
+    return {'version': request.matchdict['version']}
+
+
+def page(request, response):
+    response.headers['Content-Type'] = 'text/html'
+    return 'Hello world ' * 200
+
+
+class TestConditional(unittest.TestCase):
+    def request(self, app, path, **headers):
+        env = {'wsgi.input': BytesIO(b''), 'wsgi.errors': None, 'wsgi.url_scheme': 'http', 'PATH_INFO': path,
+               'SERVER_PORT': '80', 'SERVER_NAME': 'localhost', 'REQUEST_METHOD': 'GET'}
+        env.update(headers)
+        result = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            result['status'] = status
+            result['headers'] = dict(response_headers)
+
+        result['body'] = b''.join(app(env, start_response))
+        return result
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"foo"', '"foo"'))
+        self.assertTrue(etag_matches('"bar", W/"foo"', '"foo"'))
+        self.assertTrue(etag_matches('"foo"', 'W/"foo"'))
+        self.assertTrue(etag_matches('*', '"foo"'))
+        self.assertFalse(etag_matches('"bar"', '"foo"'))
+
+    def test_response(self):
+        resp = Response()
+        resp.body = 'Foobar'
+        resp.add_etag()
+        self.assertTrue(resp.etag.startswith('"'))
+        resp.etag = 'foo'
+        self.assertEqual(resp.headers['ETag'], '"foo"')
+        resp.last_modified = 0
+        self.assertEqual(resp.last_modified, 'Thu, 01 Jan 1970 00:00:00 GMT')
+
+        env = {'REQUEST_METHOD': 'GET', 'HTTP_IF_NONE_MATCH': '"foo"'}
+        self.assertTrue(not_modified(env, resp))
+        env['REQUEST_METHOD'] = 'POST'
+        self.assertFalse(not_modified(env, resp))
+        env = {'REQUEST_METHOD': 'GET', 'HTTP_IF_MODIFIED_SINCE': 'Thu, 01 Jan 1970 00:00:01 GMT'}
+        self.assertTrue(not_modified(env, resp))
+        env['HTTP_IF_MODIFIED_SINCE'] = 'garbage'
+        self.assertFalse(not_modified(env, resp))
+
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        os.write(fd, b'Foobar')
+        os.close(fd)
+        resp = Response()
+        resp.file = open(path, 'rb')
+        resp.add_etag()
+        resp.file.close()
+        self.assertTrue(resp.etag.startswith('W/"'))
+        self.assertEqual(parse_http_date(resp.last_modified), int(os.stat(path).st_mtime))
+
+    def test_application(self):
+        app = Distill(settings={'distill.etags.enabled': True, 'distill.compression.enabled': True})
+        app.map_connect('page', '/', action=page)
+        app.map_connect('versioned', '/versioned/{version}', action=versioned)
+
+        first = self.request(app, '/')
+        tag = first['headers']['ETag']
+        self.assertEqual(first['status'], '200 OK')
+        second = self.request(app, '/', HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(second['status'], '304 Not Modified')
+        self.assertEqual(second['body'], b'')
+        self.assertEqual(second['headers']['ETag'], tag)
+        self.assertNotIn('Content-Type', second['headers'])
+
+        compressed = self.request(app, '/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['headers']['ETag'], 'W/' + tag)
+        self.assertEqual(self.request(app, '/', HTTP_ACCEPT_ENCODING='gzip',
+                                      HTTP_IF_NONE_MATCH=compressed['headers']['ETag'])['status'],
+                         '304 Not Modified')
+
+        del calls[:]
+        resp = self.request(app, '/versioned/1')
+        self.assertEqual(resp['headers']['ETag'], '"v1"')
+        resp = self.request(app, '/versioned/1', HTTP_IF_NONE_MATCH='"v1"')
+        self.assertEqual(resp['status'], '304 Not Modified')
+        self.assertEqual(len(calls), 1)
+        resp = self.request(app, '/versioned/2', HTTP_IF_NONE_MATCH='"v1"')
+        self.assertEqual(resp['status'], '200 OK')
+        self.assertEqual(len(calls), 2)
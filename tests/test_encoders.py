@@ -0,0 +1,130 @@
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+import json
+from distill.encoders import JSONEncoders, compile_fields
+from distill.exceptions import HTTPNotAcceptable
+from distill.messagepack import unpackb
+from distill.renderers import JSON, Negotiate
+from distill.response import Response
+
+
+class Point(object):
+    __json_fields__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Point3D(Point):
+    __json_fields__ = ('x', 'y', 'z')
+
+    def __init__(self, x, y, z):
+        Point.__init__(self, x, y)
+        self.z = z
+
+
+class User(object):
+    def __init__(self, name):
+        self.name = name
+
+    def json(self, request):
+        return {'name': self.name, 'request': request}
+
+
+class TestEncoders(unittest.TestCase):
+    def test_compile_fields(self):
+        self.assertEqual(compile_fields(['x', 'y'])(Point(1, 2), None), {'x': 1, 'y': 2})
+        point = Point(1, 2)
+        setattr(point, 'not valid', 3)
+        self.assertEqual(compile_fields(['x', 'not valid'])(point, None), {'x': 1, 'not valid': 3})
+        setattr(point, 'from', 4)
+        self.assertEqual(compile_fields(['x', 'from'])(point, None), {'x': 1, 'from': 4})
+
+    def test_encoders(self):
+        encoders = JSONEncoders()
+        self.assertIsNone(encoders.encoder(object))
+        self.assertEqual(encoders.encoder(Point3D)(Point3D(1, 2, 3), None), {'x': 1, 'y': 2, 'z': 3})
+        self.assertEqual(encoders.encoder(User)(User('foo'), 'req'), {'name': 'foo', 'request': 'req'})
+
+        encoders.register(Point, lambda obj, request: [obj.x, obj.y])
+        self.assertEqual(encoders.encoder(Point3D)(Point3D(1, 2, 3), None), [1, 2])
+
+        default = encoders.default(None)
+        self.assertEqual(json.dumps({'p': Point(1, 2)}, default=default), '{"p": [1, 2]}')
+        self.assertRaises(TypeError, json.dumps, object(), default=default)
+
+        # A json method set on the instance rather than the class
+        class Plain(object):
+            pass
+        obj = Plain()
+        obj.json = lambda request: 'instance'
+        self.assertEqual(json.dumps([obj], default=default), '["instance"]')
+
+    def test_prepare(self):
+        encoders = JSONEncoders()
+        data = [Point(1, 2), Point(3, 4), User('foo')]
+        prepared = encoders.prepare(data, None)
+        self.assertEqual(prepared[:2], [{'x': 1, 'y': 2}, {'x': 3, 'y': 4}])
+        self.assertIs(prepared[2], data[2])
+
+        data = {'items': [Point(1, 2)], 'count': 1, 'names': ['foo']}
+        prepared = encoders.prepare(data, None)
+        self.assertEqual(prepared, {'items': [{'x': 1, 'y': 2}], 'count': 1, 'names': ['foo']})
+        self.assertIsNot(prepared, data)
+        self.assertIs(encoders.prepare(data['names'], None), data['names'])
+
+    def test_renderer(self):
+        renderer = JSON(encoders=JSONEncoders())
+        rendered = renderer({'points': [Point(1, 2), Point3D(1, 2, 3)], 'user': User('foo')}, 'req', Response())
+        self.assertEqual(json.loads(rendered), {'points': [{'x': 1, 'y': 2}, {'x': 1, 'y': 2, 'z': 3}],
+                                                'user': {'name': 'foo', 'request': 'req'}})
+
+    def test_stream(self):
+        renderer = JSON(encoders=JSONEncoders())
+        data = {'points': [Point(i, i) for i in range(1000)]}
+        chunks = list(renderer(data, None, Response(), stream=True, chunk_size=1024))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(chunk) < 1100 for chunk in chunks))
+        self.assertEqual(''.join(chunks), renderer(data, None, Response()))
+
+        # Generators are encoded as arrays, whether streamed or not
+        data = {'points': (Point(i, i) for i in range(3)), 'names': iter(['a'])}
+        streamed = ''.join(renderer(data, None, Response(), stream=True))
+        self.assertEqual(json.loads(streamed), {'points': [{'x': i, 'y': i} for i in range(3)], 'names': ['a']})
+        self.assertEqual(json.loads(''.join(renderer((i for i in range(3)), None, Response(), stream=True))),
+                         [0, 1, 2])
+        self.assertEqual(json.loads(renderer([iter([1, 2])], None, Response())), [[1, 2]])
+
+        chunks = list(renderer([1, 2], None, Response(), pad=True, stream=True))
+        self.assertEqual(chunks, [")]}',\n[1, 2]"])
+        self.assertRaises(TypeError, list, renderer([object()], None, Response(), stream=True))
+
+    def test_negotiate(self):
+        class FakeRequest(object):
+            def __init__(self, accept):
+                self.headers = {'Accept': accept} if accept else {}
+
+        renderer = Negotiate()
+        data = {'points': [Point(1, 2)]}
+        response = Response()
+        self.assertEqual(json.loads(renderer(data, FakeRequest(None), response)), {'points': [{'x': 1, 'y': 2}]})
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(response.headers['Vary'], 'Accept')
+
+        response = Response()
+        body = renderer(data, FakeRequest('application/json;q=0.5, application/x-msgpack'), response)
+        self.assertEqual(unpackb(body), {'points': [{'x': 1, 'y': 2}]})
+        self.assertEqual(response.headers['Content-Type'], 'application/x-msgpack')
+
+        # Keyword arguments meant for the JSON renderer are ignored
+        response = Response()
+        body = renderer(data, FakeRequest('application/msgpack'), response, stream=True, pad=True, chunk_size=16)
+        self.assertEqual(unpackb(body), {'points': [{'x': 1, 'y': 2}]})
+
+        response = Response()
+        renderer(data, FakeRequest('text/html, application/*;q=0.1'), response)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertRaises(HTTPNotAcceptable, renderer, data, FakeRequest('text/html'), Response())
@@ -15,4 +15,5 @@ class TestExceptions(unittest.TestCase):
         moved = HTTPMoved()
         movedpermanently = HTTPMovedPermanently()
         badrequest = HTTPBadRequest()
+        toolarge = HTTPRequestEntityTooLarge()
         base = HTTPErrorResponse("716 I am not a teapot", "This unit is not a teapot")
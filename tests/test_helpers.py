@@ -1,4 +1,4 @@
-from distill.helpers import CaseInsensitiveDict, url_decode
+from distill.helpers import best_match, CaseInsensitiveDict, CopyOnWriteDict, MultiDict, decode_query, unquote_bytes, url_decode
 
 try:
     import testtools as unittest
@@ -35,4 +35,74 @@ class TestHelpers(unittest.TestCase):
 
     def test_urldecdoe(self):
         url = "%7B%22Foo%22%3A+%22foo+bar%22%7d"
-        self.assertEqual(url_decode(url), '{"Foo": "foo bar"}')
\ No newline at end of file
+        self.assertEqual(url_decode(url), '{"Foo": "foo bar"}')
+
+    def test_copy_on_write_dict(self):
+        base = {'foo': 'bar', 'bar': 'baz'}
+        view = CopyOnWriteDict(base)
+        self.assertEqual(view['foo'], 'bar')
+        self.assertEqual(view, base)
+        view['foo'] = 'foo'
+        view['baz'] = 'foo'
+        del view['bar']
+        self.assertEqual(view['foo'], 'foo')
+        self.assertEqual(view.get('baz'), 'foo')
+        self.assertNotIn('bar', view)
+        self.assertIsNone(view.get('bar'))
+        self.assertRaises(KeyError, lambda: view['bar'])
+        self.assertRaises(KeyError, view.__delitem__, 'bar')
+        self.assertEqual(len(view), 2)
+        self.assertEqual(view.copy(), {'foo': 'foo', 'baz': 'foo'})
+        self.assertEqual(base, {'foo': 'bar', 'bar': 'baz'})
+        view['bar'] = 'bar'
+        self.assertEqual(sorted(view), ['bar', 'baz', 'foo'])
+
+    def test_decode_query(self):
+        self.assertEqual(unquote_bytes(b'%7B%22Foo%22%3A+%22foo+bar%22%7d'), b'{"Foo": "foo bar"}')
+        self.assertEqual(unquote_bytes(b'100%+%zz%4'), b'100% %zz%4')
+        self.assertEqual(unquote_bytes(b'%%41%%%e2%82%ac%ZZ\xff%4'), b'%A%%\xe2\x82\xac%ZZ\xff%4')
+
+        params = decode_query('foo=bar&baz=%C3%A9&foo=foo+bar&empty=&flag&&f%20o=1')
+        self.assertEqual(params['foo'], 'foo bar')
+        self.assertEqual(params.getall('foo'), ['bar', 'foo bar'])
+        self.assertEqual(params.getone('baz'), u'\xe9')
+        self.assertRaises(KeyError, params.getone, 'foo')
+        self.assertRaises(KeyError, params.getone, 'missing')
+        self.assertEqual(params.getall('missing'), [])
+        self.assertEqual(params['empty'], '')
+        self.assertEqual(params['flag'], '')
+        self.assertEqual(params['f o'], '1')
+        self.assertEqual(decode_query(b''), {})
+
+        params = decode_query('a%3Db=c%26d&a%3db=%5C%41%2B&x=100%+off')
+        self.assertEqual(params.getall('a=b'), ['c&d', '\\A+'])
+        self.assertEqual(params['x'], '100% off')
+
+        self.assertEqual(len(decode_query('a=1&b=2', max_fields=2)), 2)
+        self.assertRaises(ValueError, decode_query, 'a=1&b=2&c=3', max_fields=2)
+
+    def test_multi_dict(self):
+        params = MultiDict(foo='bar')
+        params.add('foo', 'baz')
+        copy = params.copy()
+        self.assertEqual(copy.getall('foo'), ['bar', 'baz'])
+        params['foo'] = 'foo'
+        self.assertEqual(params.getall('foo'), ['foo'])
+        params.update(bar='bar')
+        self.assertEqual(params.setdefault('bar', 'baz'), 'bar')
+        self.assertEqual(params.pop('bar'), 'bar')
+        self.assertEqual(params.getall('bar'), [])
+        del params['foo']
+        self.assertEqual(params, {})
+        self.assertEqual(copy, {'foo': 'baz'})
+
+    def test_best_match(self):
+        offers = ['application/json', 'application/msgpack']
+        self.assertEqual(best_match(None, offers), 'application/json')
+        self.assertEqual(best_match('application/msgpack', offers), 'application/msgpack')
+        self.assertEqual(best_match('*/*', offers), 'application/json')
+        self.assertEqual(best_match('application/*;q=0.5, application/msgpack', offers), 'application/msgpack')
+        self.assertEqual(best_match('application/json;q=0, */*', offers), 'application/msgpack')
+        self.assertEqual(best_match('application/json;q=0.2, application/msgpack;q=0.8', offers),
+                         'application/msgpack')
+        self.assertIsNone(best_match('text/html', offers))
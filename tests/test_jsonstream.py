@@ -0,0 +1,45 @@
+import json
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from io import BytesIO
+from distill.jsonstream import iter_json
+
+records = [{'id': i, 'name': u'récord {0}'.format(i), 'tags': ['a', 'b'], 'score': i * 1.5, 'ok': i % 2 == 0}
+           for i in range(200)]
+
+
+class TestJSONStream(unittest.TestCase):
+    def test_array(self):
+        data = json.dumps(records, ensure_ascii=False, indent=1).encode('utf-8')
+        for chunk_size in (1, 3, 100, 65536):
+            self.assertEqual(list(iter_json(BytesIO(data), chunk_size=chunk_size)), records)
+        self.assertEqual(list(iter_json(BytesIO(b'[12345, 6]'), chunk_size=2)), [12345, 6])
+        self.assertEqual(list(iter_json(BytesIO(b' [ ] '))), [])
+
+    def test_split_numbers(self):
+        data = b'[1.5, 2e10, -3, 1.25e-3, 7E+2, {"a": 1e5, "b": 2.5}]'
+        expected = [1.5, 2e10, -3, 1.25e-3, 7e2, {'a': 1e5, 'b': 2.5}]
+        for chunk_size in range(1, len(data) + 1):
+            self.assertEqual(list(iter_json(BytesIO(data), chunk_size=chunk_size)), expected)
+            self.assertEqual(dict(iter_json(BytesIO(b'{"a": 1e5, "b": 2.5}'), chunk_size=chunk_size)),
+                             {'a': 1e5, 'b': 2.5})
+
+    def test_object(self):
+        data = json.dumps({'foo': records[:3], 'bar': 'baz'}).encode('utf-8')
+        self.assertEqual(dict(iter_json(BytesIO(data), chunk_size=5)), {'foo': records[:3], 'bar': 'baz'})
+        self.assertEqual(list(iter_json(BytesIO(b'{}'))), [])
+
+    def test_other(self):
+        self.assertEqual(list(iter_json(BytesIO(b'"foo"'), chunk_size=1)), ['foo'])
+        self.assertEqual(list(iter_json(BytesIO(b'[1, 2]trailing'), length=6)), [1, 2])
+
+    def test_errors(self):
+        for data in (b'', b'[1, 2', b'[1 2]', b'[1, 2] 3', b'{"foo" 1}', b'{1: 2}', b'[{"foo": }]', b'[1.]',
+                     b'[1e, 2]'):
+            self.assertRaises(ValueError, list, iter_json(BytesIO(data), chunk_size=2))
+        items = iter_json(BytesIO(b'[1, 2, }'))
+        self.assertEqual(next(items), 1)
+        self.assertEqual(next(items), 2)
+        self.assertRaises(ValueError, next, items)
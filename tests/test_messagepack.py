@@ -0,0 +1,41 @@
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from distill.messagepack import ExtType, packb, unpackb
+
+
+class TestMessagePack(unittest.TestCase):
+    def test_round_trip(self):
+        values = [None, True, False, 0, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 64 - 1,
+                  -1, -32, -33, -128, -129, -32769, -2 ** 31 - 1, -2 ** 63, 1.5, -0.25,
+                  u'', u'a' * 31, u'a' * 32, u'a' * 256, u'a' * 65536, u'b\xe4r ✓',
+                  b'', b'\x00\xff' * 200, [], list(range(16)), list(range(70000)),
+                  {}, dict((str(i), i) for i in range(16)), {u'a': [1, {u'b': None}]},
+                  ExtType(5, b'abcd'), ExtType(-1, b'abc')]
+        for value in values:
+            self.assertEqual(unpackb(packb(value)), value)
+        self.assertEqual(unpackb(packb((1, 2))), [1, 2])
+        self.assertEqual(unpackb(bytearray(packb([1]))), [1])
+
+    def test_format(self):
+        self.assertEqual(packb({u'compact': True, u'schema': 0}),
+                         b'\x82\xa7compact\xc3\xa6schema\x00')
+        self.assertEqual(packb(-1), b'\xff')
+        self.assertEqual(packb(200), b'\xcc\xc8')
+        self.assertEqual(packb(u'a' * 40)[:2], b'\xd9\x28')
+        self.assertEqual(packb(b'ab'), b'\xc4\x02ab')
+        self.assertEqual(unpackb(b'\xca\x3f\xc0\x00\x00'), 1.5)
+        self.assertEqual(unpackb(b'\x81\x92\x01\x02\xc0'), {(1, 2): None})
+
+    def test_errors(self):
+        self.assertRaises(TypeError, packb, object())
+        self.assertEqual(packb(object(), default=lambda obj: u'obj'), packb(u'obj'))
+        self.assertRaises(OverflowError, packb, 2 ** 64)
+        self.assertRaises(ValueError, unpackb, packb([1, 2])[:-1])
+        self.assertRaises(ValueError, unpackb, packb(1) + b'\x01')
+        self.assertRaises(ValueError, unpackb, b'\xc1')
+        self.assertRaises(ValueError, unpackb, b'\xa2\xff\xff')
+        self.assertRaises(ValueError, unpackb, b'')
+        self.assertRaises(ValueError, unpackb, b'\x81\x80\x01')
+        self.assertRaises(ValueError, unpackb, b'\x81\x91\x80\x01')
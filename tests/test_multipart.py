@@ -0,0 +1,61 @@
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from io import BytesIO
+from distill.exceptions import HTTPBadRequest, HTTPRequestEntityTooLarge
+from distill.multipart import MultipartParser, parse_form, parse_header
+
+body = (b'preamble\r\n'
+        b'--AaB03x\r\n'
+        b'Content-Disposition: form-data; name="submit-name"\r\n'
+        b'\r\n'
+        b'Larry\r\n'
+        b'--AaB03x\r\n'
+        b'Content-Disposition: form-data; name="files"; filename="file1.txt"\r\n'
+        b'Content-Type: text/plain\r\n'
+        b'\r\n' +
+        b'Hello world\r\n' * 100 +
+        b'\r\n--AaB03x--\r\n')
+
+
+class TestMultipart(unittest.TestCase):
+    def test_parse_header(self):
+        self.assertEqual(parse_header('form-data; name="foo"; filename="a \\"b\\".txt"'),
+                         ('form-data', {'name': 'foo', 'filename': 'a "b".txt'}))
+        self.assertEqual(parse_header('multipart/form-data; boundary=AaB03x'),
+                         ('multipart/form-data', {'boundary': 'AaB03x'}))
+
+    def test_parse(self):
+        for chunk_size in (1, 7, 64, 65536):
+            parts = list(MultipartParser(BytesIO(body), 'AaB03x', len(body), chunk_size=chunk_size,
+                                         spool_threshold=256))
+            self.assertEqual(len(parts), 2)
+            self.assertEqual(parts[0].name, 'submit-name')
+            self.assertEqual(parts[0].value, 'Larry')
+            self.assertEqual(parts[1].filename, 'file1.txt')
+            self.assertEqual(parts[1].type, 'text/plain')
+            self.assertEqual(parts[1].file.read(), b'Hello world\r\n' * 100)
+            self.assertEqual(parts[1].value, b'Hello world\r\n' * 100)
+            # Spooled to disk once past the threshold
+            self.assertTrue(parts[1].file._rolled)
+
+    def test_parse_form(self):
+        form = parse_form(BytesIO(body), 'multipart/form-data; boundary="AaB03x"')
+        self.assertEqual(form['submit-name'], 'Larry')
+        self.assertEqual(form['files'].filename, 'file1.txt')
+
+    def test_limits(self):
+        def parse(data=body, **kwargs):
+            return list(MultipartParser(BytesIO(data), 'AaB03x', **kwargs))
+
+        self.assertRaises(HTTPRequestEntityTooLarge, parse, max_part_size=100)
+        self.assertRaises(HTTPRequestEntityTooLarge, parse, max_field_size=3)
+        self.assertRaises(HTTPRequestEntityTooLarge, parse, max_body_size=100)
+        self.assertRaises(HTTPRequestEntityTooLarge, parse, content_length=len(body), max_body_size=100)
+        self.assertRaises(HTTPRequestEntityTooLarge, parse, max_parts=1)
+        self.assertEqual(len(parse(max_field_size=5)), 2)
+
+        self.assertRaises(HTTPBadRequest, parse, body[:-20])
+        self.assertRaises(HTTPBadRequest, parse, b'no boundary here')
+        self.assertRaises(HTTPBadRequest, MultipartParser, BytesIO(body), None)
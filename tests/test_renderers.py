@@ -1,11 +1,15 @@
 import json
 import os
+import shutil
+import tempfile
+import warnings
+from mako.lookup import TemplateLookup
 try:
     import testtools as unittest
 except ImportError:
     import unittest
 from distill.exceptions import HTTPInternalServerError
-from distill.renderers import RenderFactory, renderer
+from distill.renderers import RenderFactory, RenderPool, TemplateStream, renderer
 from distill.response import Response
 
 
@@ -84,6 +88,109 @@ class TestRenderers(unittest.TestCase):
         rendered = fake_on_get_string(None, resp)
         self.assertEqual(rendered, 'Hello world!')
 
+    def test_production(self):
+        root = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root, 'page.mako'), 'w') as fp:
+                fp.write('Hello ${user}!')
+            os.mkdir(os.path.join(root, 'partials'))
+            with open(os.path.join(root, 'partials', 'item.mako'), 'w') as fp:
+                fp.write('${item}')
+
+            factory = RenderFactory({'distill.document_root': root, 'distill.production': True})
+            compiled = factory.precompile()
+            self.assertEqual(sorted(compiled), ['page.mako', 'partials/item.mako'])
+            self.assertEqual(factory.compile_times, compiled)
+            self.assertEqual(factory.precompile(), compiled)
+
+            with open(os.path.join(root, 'page.mako'), 'w') as fp:
+                fp.write('Goodbye ${user}!')
+            mtime = os.path.getmtime(os.path.join(root, 'page.mako')) + 10
+            os.utime(os.path.join(root, 'page.mako'), (mtime, mtime))
+            self.assertEqual(factory('page.mako', {'user': 'Foobar'}, None, Response()), 'Hello Foobar!')
+
+            factory = RenderFactory({'distill.document_root': root})
+            self.assertEqual(factory('page.mako', {'user': 'Foobar'}, None, Response()), 'Goodbye Foobar!')
+        finally:
+            shutil.rmtree(root)
+
+    def test_fragment_cache(self):
+        root = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root, 'page.mako'), 'w') as fp:
+                fp.write('<%block name="nav" cached="True" cache_key="nav">${user}</%block>'
+                         '<%block name="short" cached="True" cache_key="short" cache_timeout="-1">${user}</%block>'
+                         '|${user}')
+
+            factory = RenderFactory({'distill.document_root': root})
+            self.assertEqual(factory('page.mako', {'user': 'foo'}, None, Response()), 'foofoo|foo')
+            self.assertEqual(factory('page.mako', {'user': 'bar'}, None, Response()), 'foobar|bar')
+            self.assertEqual(factory.fragment_cache.hits, 1)
+
+            factory.fragment_cache.invalidate('page.mako', 'nav')
+            self.assertEqual(factory('page.mako', {'user': 'baz'}, None, Response()), 'bazbaz|baz')
+            factory.fragment_cache.clear()
+            self.assertEqual(factory('page.mako', {'user': 'foo'}, None, Response()), 'foofoo|foo')
+        finally:
+            shutil.rmtree(root)
+
+    def test_stream(self):
+        root = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root, 'list.mako'), 'w') as fp:
+                fp.write('<ul>\n% for item in items:\n<li>${item}</li>\n% endfor\n</ul>')
+            with open(os.path.join(root, 'error.mako'), 'w') as fp:
+                fp.write('${"x" * 100}${1 // zero}')
+            RenderFactory.create({'distill.document_root': root})
+
+            @renderer('list.mako', stream=True, chunk_size=100)
+            def listing(request, response):
+                return {'items': range(1000)}
+
+            resp = Response()
+            stream = listing(None, resp)
+            self.assertIsInstance(stream, TemplateStream)
+            self.assertEqual(resp.headers['Content-Type'], 'text/html')
+            chunks = list(stream)
+            self.assertGreater(len(chunks), 10)
+            self.assertEqual(u''.join(chunks), RenderFactory.render('list.mako', {'items': range(1000)}, None, resp))
+
+            stream = listing(None, resp)
+            self.assertEqual(next(stream)[:4], '<ul>')
+            stream.close()
+            self.assertTrue(stream._rendered.wait(5))
+            self.assertRaises(StopIteration, next, stream)
+
+            # A stream which is neither read nor closed gives up rendering
+            stream = RenderFactory.render('list.mako', {'items': range(1000)}, None, resp, stream=True,
+                                          chunk_size=10, timeout=0.2)
+            next(stream)
+            self.assertTrue(stream._rendered.wait(5))
+
+            stream = RenderFactory.render('error.mako', {'zero': 0}, None, resp, stream=True, chunk_size=10)
+            self.assertEqual(next(stream), 'x' * 100)
+            self.assertRaises(ZeroDivisionError, next, stream)
+        finally:
+            shutil.rmtree(root)
+
+    def test_stream_pool(self):
+        root = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root, 'exit.mako'), 'w') as fp:
+                fp.write('${stop()}')
+
+            def stop():
+                raise SystemExit()
+
+            pool = RenderPool(2)
+            lookup = TemplateLookup(directories=[root])
+            streams = [TemplateStream(lookup.get_template('exit.mako'), {'stop': stop}, pool=pool) for _ in range(5)]
+            for stream in streams:
+                self.assertRaises(SystemExit, next, stream)
+            self.assertEqual(len(pool._threads), 2)
+        finally:
+            shutil.rmtree(root)
+
     def test_add_renderer(self):
         RenderFactory.create({})
 
@@ -95,7 +202,10 @@ class TestRenderers(unittest.TestCase):
                 response.headers['Content-Type'] = 'text/plain'
                 return str(data)
 
-        RenderFactory.add_renderer('text2', TextRenderer())
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            RenderFactory.add_renderer('text2', TextRenderer())
+        self.assertEqual(caught[0].category, DeprecationWarning)
 
         @renderer('text2')
         def fake_on_get(request, response):
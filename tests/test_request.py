@@ -3,6 +3,9 @@ try:
     import testtools as unittest
 except ImportError:
     import unittest
+from distill.buffers import BufferPool
+from distill.exceptions import HTTPBadRequest, HTTPRequestEntityTooLarge
+from distill.messagepack import packb
 from distill.request import Request
 from routes import Mapper
 try:
@@ -38,9 +41,12 @@ class TestRequest(unittest.TestCase):
                 self.settings = settings
                 self.map = Mapper()
 
-        app = FakeApp({})
+        app = FakeApp({'foo': 'bar'})
 
         req = Request(fake_env, app)
+        req.settings['foo'] = 'baz'
+        self.assertEqual(req.settings['foo'], 'baz')
+        self.assertEqual(app.settings['foo'], 'bar')
         self.assertEqual(req.method, 'POST')
         self.assertEqual(req.POST['hello'], 'world')
         self.assertEqual(req.POST['foo'], 'foo bar')
@@ -102,6 +108,9 @@ class TestRequest(unittest.TestCase):
         req = Request(fake_env, app)
         self.assertEqual(req.POST['files'].filename, 'file1.txt')
         self.assertEqual(req.POST['files'].file.read(), b'Hello world')
+        upload = req.POST['files'].file
+        req.release()
+        self.assertTrue(upload.closed)
 
     def test_json(self):
         json = b'{"foo": "bar"}'
@@ -126,3 +135,96 @@ class TestRequest(unittest.TestCase):
         app = FakeApp({})
         req = Request(fake_env, app)
         self.assertEqual(req.json_body, {"foo": "bar"})
+
+        body = packb({u'foo': [1, b'bar']})
+        fake_env.update({'wsgi.input': BytesIO(body), 'CONTENT_LENGTH': len(body), 'CONTENT_TYPE': 'application/msgpack'})
+        req = Request(fake_env, FakeApp({}))
+        self.assertEqual(req.msgpack_body, {u'foo': [1, b'bar']})
+
+    def test_lazy(self):
+        data = b'hello=world'
+        fake_env = {'wsgi.input': BytesIO(data), 'wsgi.errors': None, 'wsgi.url_scheme': 'https',
+                    'CONTENT_LENGTH': len(data), 'PATH_INFO': '/foo/bar', 'SERVER_PORT': '8080',
+                    'CONTENT_TYPE': 'application/x-www-form-urlencoded', 'QUERY_STRING': 'foo=bar',
+                    'SERVER_NAME': 'foobar.baz', 'REQUEST_METHOD': 'POST'}
+
+        class FakeApp(object):
+            def __init__(self, settings):
+                self.settings = settings
+                self.map = None
+
+        req = Request(fake_env, FakeApp({}))
+        self.assertEqual(fake_env['wsgi.input'].tell(), 0)
+        self.assertEqual(req.GET, {'foo': 'bar'})
+        self.assertEqual(fake_env['wsgi.input'].tell(), 0)
+        self.assertEqual(req.POST, {'hello': 'world'})
+        self.assertFalse(hasattr(req, 'body'))
+
+        fake_env['wsgi.input'] = BytesIO(data)
+        fake_env['CONTENT_TYPE'] = 'text/plain'
+        req = Request(fake_env, FakeApp({}))
+        self.assertEqual(req.POST, {})
+        self.assertEqual(req.body, data)
+        self.assertRaises(ValueError, lambda: req.json_body)
+
+    def test_max_fields(self):
+        fake_env = {'wsgi.input': BytesIO(b''), 'wsgi.errors': None, 'wsgi.url_scheme': 'https',
+                    'PATH_INFO': '/foo/bar', 'SERVER_PORT': '8080', 'QUERY_STRING': 'a=1&b=2&c=3',
+                    'SERVER_NAME': 'foobar.baz', 'REQUEST_METHOD': 'GET'}
+
+        class FakeApp(object):
+            def __init__(self, settings):
+                self.settings = settings
+                self.map = None
+
+        req = Request(fake_env, FakeApp({'distill.request.max_fields': 2}))
+        self.assertRaises(HTTPBadRequest, lambda: req.GET)
+
+    def test_body_view(self):
+        data = b'{"foo": "bar"}'
+        fake_env = {'wsgi.input': BytesIO(data), 'wsgi.errors': None, 'wsgi.url_scheme': 'https',
+                    'CONTENT_LENGTH': len(data), 'PATH_INFO': '/foo/bar', 'SERVER_PORT': '8080',
+                    'CONTENT_TYPE': 'application/json', 'QUERY_STRING': '',
+                    'SERVER_NAME': 'foobar.baz', 'REQUEST_METHOD': 'POST'}
+
+        class FakeApp(object):
+            def __init__(self, settings):
+                self.settings = settings
+                self.map = None
+                self.buffer_pool = BufferPool(min_size=16)
+
+        app = FakeApp({})
+        req = Request(fake_env, app)
+        view = req.body_view
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(view.tobytes(), data)
+        self.assertEqual(req.json_body, {'foo': 'bar'})
+        self.assertEqual(req.body, data)
+
+        req.release()
+        self.assertEqual(len(app.buffer_pool), 1)
+        self.assertRaises(ValueError, view.tobytes)
+        req.release()
+
+        # A slice still held by the action keeps the buffer out of the pool
+        fake_env['wsgi.input'] = BytesIO(data)
+        req = Request(fake_env, app)
+        part = req.body_view[2:5]
+        req.release()
+        self.assertEqual(len(app.buffer_pool), 0)
+        self.assertEqual(part.tobytes(), b'foo')
+        del part
+
+        fake_env['wsgi.input'] = BytesIO(b'[{"foo": "bar"}, 2]trailing')
+        fake_env['CONTENT_LENGTH'] = 19
+        req = Request(fake_env, app)
+        self.assertEqual(list(req.iter_json(chunk_size=4)), [{'foo': 'bar'}, 2])
+
+        # The client's Content-Length is checked before a buffer is taken
+        fake_env['wsgi.input'] = BytesIO(data)
+        fake_env['CONTENT_LENGTH'] = 1 << 40
+        req = Request(fake_env, app)
+        self.assertRaises(HTTPRequestEntityTooLarge, lambda: req.body_view)
+        fake_env['CONTENT_LENGTH'] = len(data)
+        req = Request(fake_env, FakeApp({'distill.request.max_body_size': 8}))
+        self.assertRaises(HTTPRequestEntityTooLarge, lambda: req.body)
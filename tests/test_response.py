@@ -4,7 +4,7 @@ except ImportError:
     import unittest
 
 from functools import reduce
-from distill.response import Response
+from distill.response import Response, is_stream, primed
 from io import BytesIO
 
 
@@ -26,6 +26,38 @@ class TestResponse(unittest.TestCase):
         resp.finalize(lambda f, blocksize: iter(lambda: f.read(8 * 1024), b''))
         self.assertEqual([block for block in resp.iterable], [b'Foobar'])
 
+    def test_stream(self):
+        resp = Response()
+        resp.body = (chunk for chunk in ['foo', b'bar'])
+        resp.headers['Content-Length'] = '6'
+        resp.finalize(None)
+        self.assertEqual(list(resp.iterable), [b'foo', b'bar'])
+        self.assertEqual(resp.headers['Content-Length'], '6')
+
+        resp = Response()
+        resp.body = u'\xe9t\xe9'
+        resp.finalize(None)
+        self.assertEqual(resp.headers['Content-Length'], '5')
+
+        resp = Response()
+        resp.file = BytesIO(b"Foobar")
+        resp.finalize(None)
+        resp.iterable.close()
+        self.assertTrue(resp.file.closed)
+
+        self.assertTrue(is_stream(iter([b'foo'])))
+        self.assertFalse(is_stream(BytesIO(b'foo')))
+
+        def chunks():
+            yield b'foo'
+            started.append(True)
+            yield b'bar'
+        started = []
+        body = primed(chunks())
+        self.assertEqual(started, [])
+        self.assertEqual(list(body), [b'foo', b'bar'])
+        self.assertEqual(list(primed(chunk for chunk in [])), [])
+
     def test_body(self):
         resp = Response()
         resp.finalize(None)
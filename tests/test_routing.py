@@ -0,0 +1,61 @@
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from routes import Mapper
+from distill.routing import Dispatcher
+
+
+def action(request, response):
+    return "Hello world"
+
+
+class TestRouting(unittest.TestCase):
+    def build_mapper(self):
+        map_ = Mapper()
+        map_.connect('home', '/', action=action, conditions={"method": ["GET"]})
+        map_.connect('homepost', '/', action='post', conditions={"method": ["POST"]})
+        map_.connect('userinfo', '/:user/userinfo', action=action)
+        map_.connect('json', '/{id:\\d+}.json', action=action)
+        map_.connect('files', '/files/*path', action=action)
+        map_.connect('static', '/static/{path:.*}', action=action)
+        map_.connect('range', '/x/{a}-{b}/y', action=action)
+        map_.connect('controller', '/controller', action='GET_home', controller='test')
+        map_.connect('dynamic', '/c/{controller}/{action}', foo='bar')
+        map_.connect('user', '/:user', action=action)
+        map_.connect('deep', '/a/b/c/d', action=action)
+        return map_
+
+    def test_matches_mapper(self):
+        map_ = self.build_mapper()
+        dispatcher = Dispatcher(map_)
+        paths = ['/', '', '/Foo', '/Foo/userinfo', '/Foo/userinfo/bar', '/12.json', '/ab.json',
+                 '/files/', '/files/a/b/c', '/static/', '/static/css/site.css', '/static',
+                 '/x/1-2/y', '/x/12/y', '/controller', '/c/users/edit', '/c/users',
+                 '/a/b/c/d', '/a/b/c', '/a/b/c/d/e', '/nothing/here/at/all']
+        for method in ['GET', 'POST']:
+            env = {'REQUEST_METHOD': method}
+            for path in paths:
+                self.assertEqual(dispatcher.match(path, env), map_.match(path, env))
+
+    def test_order(self):
+        map_ = Mapper()
+        map_.connect('user', '/:user', action='user')
+        map_.connect('about', '/about', action='about')
+        map_.connect('about2', '/about', action='about2')
+        dispatcher = Dispatcher(map_)
+        self.assertEqual(dispatcher.match('/about'), map_.match('/about'))
+        self.assertEqual(dispatcher.match('/Foo'), {'user': 'Foo', 'action': 'user'})
+
+    def test_fallback(self):
+        map_ = self.build_mapper()
+        map_.prefix = '/app'
+        dispatcher = Dispatcher(map_)
+        self.assertEqual(dispatcher.match('/app/Foo/userinfo', {}), map_.match('/app/Foo/userinfo', {}))
+
+        map_ = Mapper()
+        map_.minimization = True
+        map_.connect(':controller/:action/:id')
+        dispatcher = Dispatcher(map_)
+        for path in ['/blog', '/blog/view', '/blog/view/3', '/']:
+            self.assertEqual(dispatcher.match(path, {}), map_.match(path, {}))
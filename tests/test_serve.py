@@ -0,0 +1,148 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+from distill.application import Distill
+from distill.response import Response
+from distill.serve import WorkerServer, bind, load_app
+
+
+def hello(request, response):
+    return 'Hello {0}'.format(os.getpid())
+
+
+def echo(request, response):
+    return request.body.decode('utf-8')
+
+
+def stream(request, response):
+    resp = Response()
+    resp.file = open(__file__, 'rb')
+    return resp
+
+
+app = Distill()
+app.map_connect('hello', '/', action=hello)
+app.map_connect('echo', '/echo', action=echo)
+app.map_connect('stream', '/stream', action=stream)
+
+
+def chunked_app(env, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'Hello ', b'world']
+
+
+class TestServe(unittest.TestCase):
+    def start_worker(self, wsgi_app, **kwargs):
+        sock = bind('127.0.0.1', 0)
+        server = WorkerServer(sock, wsgi_app, **kwargs)
+        thread = threading.Thread(target=server.serve, args=(5,))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(sock.close)
+        return server, thread, sock.getsockname()[1]
+
+    def test_keep_alive(self):
+        server, thread, port = self.start_worker(app)
+        conn = HTTPConnection('127.0.0.1', port)
+        conn.request('GET', '/')
+        resp = conn.getresponse()
+        self.assertEqual(resp.read(), 'Hello {0}'.format(os.getpid()).encode('utf-8'))
+        sock = conn.sock
+
+        conn.request('POST', '/echo', body=b'Foobar', headers={'Content-Type': 'text/plain'})
+        resp = conn.getresponse()
+        self.assertEqual(resp.read(), b'Foobar')
+        self.assertIs(conn.sock, sock)
+
+        conn.request('GET', '/stream')
+        resp = conn.getresponse()
+        with open(__file__, 'rb') as fp:
+            self.assertEqual(resp.read(), fp.read())
+
+        conn.request('HEAD', '/')
+        resp = conn.getresponse()
+        self.assertEqual(resp.read(), b'')
+        self.assertEqual(resp.status, 200)
+
+        conn.request('GET', '/nothing/here')
+        resp = conn.getresponse()
+        self.assertEqual(resp.status, 404)
+        resp.read()
+
+        conn.request('GET', '/')
+        self.assertEqual(conn.getresponse().status, 200)
+        conn.close()
+
+        server.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_chunked(self):
+        server, thread, port = self.start_worker(chunked_app)
+        conn = HTTPConnection('127.0.0.1', port)
+        conn.request('POST', '/', body=iter([b'foo', b'bar']), encode_chunked=True)
+        resp = conn.getresponse()
+        self.assertEqual(resp.getheader('Transfer-Encoding'), 'chunked')
+        self.assertEqual(resp.read(), b'Hello world')
+        conn.close()
+        server.stop()
+
+    def test_max_requests(self):
+        server, thread, port = self.start_worker(app, max_requests=2)
+        conn = HTTPConnection('127.0.0.1', port)
+        for _ in range(2):
+            conn.request('GET', '/')
+            conn.getresponse().read()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(server.handled, 2)
+
+    def test_load_app(self):
+        self.assertIs(load_app('tests.test_serve:app'), app)
+        self.assertIs(load_app('tests.test_serve'), app)
+
+    def test_prefork(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.Popen([sys.executable, '-m', 'distill.serve', 'serve', 'tests.test_serve:app',
+                                 '--bind', '127.0.0.1:{0}'.format(port), '--workers', '2',
+                                 '--max-requests', '5', '--graceful-timeout', '2'], cwd=root)
+        try:
+            pids = set()
+            deadline = time.time() + 10
+            while time.time() < deadline and len(pids) < 3:
+                try:
+                    conn = HTTPConnection('127.0.0.1', port, timeout=5)
+                    conn.request('GET', '/')
+                    pids.add(conn.getresponse().read())
+                    conn.close()
+                except socket.error:
+                    time.sleep(0.1)
+            # Workers are recycled after 5 requests each
+            self.assertGreaterEqual(len(pids), 3)
+
+            proc.send_signal(signal.SIGHUP)
+            time.sleep(0.5)
+            conn = HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/')
+            self.assertEqual(conn.getresponse().status, 200)
+            conn.close()
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            self.assertEqual(proc.wait(10), 0)
@@ -1,8 +1,9 @@
 import os
 import shutil
+import tempfile
 from distill.request import Request
 from distill.response import Response
-from distill.sessions import UnencryptedLocalSessionStorage
+from distill.sessions import UnencryptedLocalSessionStorage, SharedMemorySessionStorage
 
 try:
     import testtools as unittest
@@ -79,4 +80,40 @@ class TestSessions(unittest.TestCase):
         req = Request(fake_env, FakeApp)
         req.cookies['ssid'] = files[0]
         req.session = factory(req)
-        self.assertNotIn('ssid', req.cookies)
\ No newline at end of file
+        self.assertNotIn('ssid', req.cookies)
+
+    def test_shared_memory_storage(self):
+        directory = tempfile.mkdtemp()
+        try:
+            factory = SharedMemorySessionStorage({'distill.shm_cache.path': os.path.join(directory, 'sess.shm'),
+                                                  'distill.shm_cache.slots': 16})
+
+            class FakeApp(object):
+                settings = {}
+                map = None
+
+            fake_env = {'wsgi.input': None, 'wsgi.errors': None, 'PATH_INFO': '/', 'QUERY_STRING': '', 'REQUEST_METHOD': 'GET',
+                        'SERVER_NAME': 'foobar.baz', 'SERVER_PORT': '8080', 'wsgi.url_scheme': 'https'}
+            req = Request(fake_env, FakeApp)
+            resp = Response()
+            req.session = factory(req)
+            req.session['Foo'] = 'bar'
+            for f in req.resp_callbacks:
+                f(req, resp)
+            ssid = req.session.ssid
+
+            req = Request(fake_env, FakeApp)
+            req.cookies['ssid'] = ssid
+            req.session = factory(req)
+            self.assertEqual(req.session['Foo'], 'bar')
+            req.session.invalidate()
+            for f in req.resp_callbacks:
+                f(req, resp)
+
+            req = Request(fake_env, FakeApp)
+            req.cookies['ssid'] = ssid
+            req.session = factory(req)
+            self.assertNotIn('ssid', req.cookies)
+            factory._cache.close()
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+from distill.cache import FragmentCache, ResponseCache
+from distill.response import Response
+from distill.shmcache import SharedMemoryCache, default_path
+
+
+class TestSharedMemoryCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.shm')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cache(self):
+        cache = SharedMemoryCache(self.path, slots=8, slot_size=256, ways=4)
+        self.assertEqual(cache.slots, 8)
+        self.assertIsNone(cache.get('foo'))
+        self.assertTrue(cache.set('foo', {'bar': [1, 2]}))
+        self.assertEqual(cache.get('foo'), {'bar': [1, 2]})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.set('foo', 'baz')
+        self.assertEqual(cache.get('foo'), 'baz')
+        self.assertEqual(len(cache), 1)
+
+        self.assertFalse(cache.set('big', b'x' * 256))
+        self.assertNotIn('big', cache)
+        cache.set('old', 1, ttl=-1)
+        self.assertNotIn('old', cache)
+        cache.delete('foo')
+        self.assertNotIn('foo', cache)
+
+        for i in range(20):
+            cache.set(('key', i), i, ttl=60 + i)
+        self.assertEqual(len(cache), 8)
+        self.assertEqual(cache.evictions, 12)
+        self.assertEqual(cache.get(('key', 19)), 19)
+
+        other = SharedMemoryCache(self.path, slots=8, slot_size=256, ways=4)
+        self.assertEqual(other.get(('key', 19)), 19)
+        other.clear()
+        self.assertEqual(len(cache), 0)
+
+        # Pinned entries aren't evicted, and add doesn't replace anything
+        self.assertTrue(cache.add('pinned', 1, pin=True))
+        self.assertFalse(cache.add('pinned', 2))
+        cache.set('old', 1, ttl=-1)
+        self.assertTrue(cache.add('old', 2))
+        for i in range(20, 40):
+            cache.set(('key', i), i)
+        self.assertEqual(cache.get('pinned'), 1)
+        cache.delete('pinned')
+        cache.delete('old')
+        other.close()
+        cache.close()
+
+        cache = SharedMemoryCache(self.path, slots=16, slot_size=256)
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_from_settings(self):
+        settings = {'distill.shm_cache.path': self.path, 'distill.shm_cache.slots': 16}
+        cache = SharedMemoryCache.from_settings(settings)
+        self.assertIs(SharedMemoryCache.from_settings(settings), cache)
+        self.assertEqual(cache.slots, 16)
+        cache.close()
+        self.assertIsNot(SharedMemoryCache.from_settings(settings), cache)
+        SharedMemoryCache.from_settings(settings).close()
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'requires file ownership')
+    def test_permissions(self):
+        with open(self.path, 'wb'):
+            pass
+        os.chmod(self.path, 0o666)
+        self.assertRaises(OSError, SharedMemoryCache, self.path)
+        os.chmod(self.path, 0o600)
+        SharedMemoryCache(self.path).close()
+
+        link = os.path.join(self.dir, 'link.shm')
+        os.symlink(self.path, link)
+        self.assertRaises(OSError, SharedMemoryCache, link)
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'requires file ownership')
+    def test_default_path(self):
+        environ = dict(os.environ)
+        self.addCleanup(os.environ.update, environ)
+        os.environ['XDG_RUNTIME_DIR'] = self.dir
+        self.assertEqual(default_path(), os.path.join(self.dir, 'distill.shm'))
+        os.chmod(self.dir, 0o777)
+        self.assertRaises(OSError, default_path)
+        os.chmod(self.dir, 0o700)
+
+        del os.environ['XDG_RUNTIME_DIR']
+        path = default_path()
+        self.assertEqual(os.path.basename(os.path.dirname(path)), 'distill-{0}'.format(os.getuid()))
+        self.assertEqual(os.stat(os.path.dirname(path)).st_mode & 0o777, 0o700)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+    def test_processes(self):
+        cache = SharedMemoryCache(self.path, slots=64, slot_size=512)
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            try:
+                for i in range(200):
+                    cache.set('counter', i)
+                cache.set('done', True)
+            finally:
+                os._exit(0)
+        deadline = time.time() + 10
+        seen = []
+        while not cache.get('done') and time.time() < deadline:
+            value = cache.get('counter')
+            if value is not None:
+                seen.append(value)
+        os.waitpid(pid, 0)
+        self.assertEqual(cache.get('counter'), 199)
+        self.assertEqual(seen, sorted(seen))
+        cache.close()
+
+    def test_response_cache(self):
+        env = {'PATH_INFO': '/foo', 'QUERY_STRING': ''}
+        resp = Response(headers={'Content-Type': 'text/plain'})
+        resp.body = 'Hello'
+        resp.finalize(None)
+        ResponseCache(SharedMemoryCache(self.path)).store(env, resp, 60)
+        cached = ResponseCache(SharedMemoryCache(self.path)).get(env)
+        self.assertEqual(cached.iterable, [b'Hello'])
+
+    def test_clear_shared_backend(self):
+        backend = SharedMemoryCache(self.path)
+        backend.set(('distill.session', 'abc'), {'user': 1})
+        responses = ResponseCache(backend)
+        fragments = FragmentCache(backend)
+        env = {'PATH_INFO': '/foo', 'QUERY_STRING': ''}
+        resp = Response(headers={'Content-Type': 'text/plain'})
+        resp.body = 'Hello'
+        resp.finalize(None)
+        responses.store(env, resp, 60)
+        fragments.set('page.mako', 'nav', u'<nav/>')
+
+        other = FragmentCache(backend, namespace='/srv/other')
+        self.assertIsNone(other.get('page.mako', 'nav'))
+        other.set('page.mako', 'nav', u'<nav>other</nav>')
+        self.assertEqual(fragments.get('page.mako', 'nav'), u'<nav/>')
+
+        fragments.clear()
+        self.assertIsNone(fragments.get('page.mako', 'nav'))
+        self.assertEqual(other.get('page.mako', 'nav'), u'<nav>other</nav>')
+        self.assertIsNotNone(responses.get(env))
+        responses.clear()
+        self.assertIsNone(responses.get(env))
+        self.assertEqual(backend.get(('distill.session', 'abc')), {'user': 1})
+        backend.close()
@@ -0,0 +1,218 @@
+import os
+import shutil
+import tempfile
+import threading
+try:
+    import testtools as unittest
+except ImportError:
+    import unittest
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+from wsgiref.validate import validator
+from distill.application import Distill
+from distill.exceptions import HTTPNotFound
+from distill.serve import FileWrapper, WorkerServer, bind
+from distill.conditional import http_date
+from distill.static import FileCache, FileSlice, parse_range
+
+data = bytes(bytearray(range(256))) * 40
+
+
+class TestStatic(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.mkdir(os.path.join(self.root, 'css'))
+        with open(os.path.join(self.root, 'video.bin'), 'wb') as fp:
+            fp.write(data)
+        with open(os.path.join(self.root, 'css', 'index.html'), 'wb') as fp:
+            fp.write(b'<html></html>')
+        with open(os.path.join(self.root, '.secret'), 'wb') as fp:
+            fp.write(b'secret')
+
+        self.app = Distill()
+        self.static = self.app.add_static('/static/', self.root, max_age=60)
+
+    def request(self, path, file_wrapper=False, **headers):
+        env = {'wsgi.input': BytesIO(b''), 'wsgi.errors': None, 'wsgi.url_scheme': 'http', 'PATH_INFO': path,
+               'SERVER_PORT': '80', 'SERVER_NAME': 'localhost', 'REQUEST_METHOD': 'GET'}
+        if file_wrapper:
+            env['wsgi.file_wrapper'] = FileWrapper
+        env.update(headers)
+        result = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            if exc_info:
+                raise exc_info[1]
+            result['status'] = status
+            result['headers'] = dict(response_headers)
+
+        iterable = self.app(env, start_response)
+        result['body'] = b''.join(bytes(chunk) for chunk in iterable)
+        if hasattr(iterable, 'close'):
+            iterable.close()
+        return result
+
+    def test_wsgi_validate(self):
+        # Without wsgi.file_wrapper files are sent from a memory map
+        app = validator(self.app)
+        for path, headers in (('/static/video.bin', {}), ('/static/video.bin', {'HTTP_RANGE': 'bytes=10-19'}),
+                              ('/static/video.bin', {'HTTP_RANGE': 'bytes=0-9, 20-29'})):
+            env = {'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': ''}
+            env.update(headers)
+            setup_testing_defaults(env)
+            env.pop('wsgi.file_wrapper', None)
+            iterable = app(env, lambda status, response_headers, exc_info=None: lambda data: None)
+            try:
+                body = b''.join(iterable)
+            finally:
+                iterable.close()
+            if not headers:
+                self.assertEqual(body, data)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-499', 1000), [(0, 500)])
+        self.assertEqual(parse_range('bytes=500-, -100', 1000), [(500, 1000), (900, 1000)])
+        self.assertEqual(parse_range('bytes=900-2000', 1000), [(900, 1000)])
+        self.assertEqual(parse_range('bytes=1000-', 1000), [])
+        self.assertIsNone(parse_range('bytes=5-1', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        self.assertIsNone(parse_range('bytes=' + ','.join(['0-1'] * 20), 1000))
+
+    def test_get(self):
+        for file_wrapper in (False, True):
+            resp = self.request('/static/video.bin', file_wrapper)
+            self.assertEqual(resp['status'], '200 OK')
+            self.assertEqual(resp['body'], data)
+            self.assertEqual(resp['headers']['Content-Length'], str(len(data)))
+            self.assertEqual(resp['headers']['Content-Type'], 'application/octet-stream')
+            self.assertEqual(resp['headers']['Accept-Ranges'], 'bytes')
+            self.assertEqual(resp['headers']['Cache-Control'], 'public, max-age=60')
+
+        resp = self.request('/static/css/')
+        self.assertEqual(resp['body'], b'<html></html>')
+        self.assertEqual(resp['headers']['Content-Type'], 'text/html')
+        # The directory is found from the cached stat of its entry
+        self.assertIn(os.path.join(self.root, 'css'), self.static.cache._files)
+
+        for path in ('/static/.secret', '/static/../' + os.path.basename(self.root) + '/video.bin',
+                     '/static/missing', '/static/'):
+            self.assertRaises(HTTPNotFound, self.request, path)
+
+        etag = self.request('/static/video.bin')['headers']['ETag']
+        resp = self.request('/static/video.bin', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp['status'], '304 Not Modified')
+        self.assertEqual(resp['body'], b'')
+        self.assertEqual(self.static.cache._files[os.path.join(self.root, 'video.bin')].refs, 0)
+
+    def test_ranges(self):
+        for file_wrapper in (False, True):
+            resp = self.request('/static/video.bin', file_wrapper, HTTP_RANGE='bytes=100-199')
+            self.assertEqual(resp['status'], '206 Partial Content')
+            self.assertEqual(resp['body'], data[100:200])
+            self.assertEqual(resp['headers']['Content-Range'], 'bytes 100-199/{0}'.format(len(data)))
+            self.assertEqual(resp['headers']['Content-Length'], '100')
+
+        resp = self.request('/static/video.bin', HTTP_RANGE='bytes=0-9,-10')
+        self.assertEqual(resp['status'], '206 Partial Content')
+        content_type = resp['headers']['Content-Type']
+        self.assertTrue(content_type.startswith('multipart/byteranges; boundary='))
+        self.assertEqual(resp['headers']['Content-Length'], str(len(resp['body'])))
+        boundary = content_type.split('=')[1].encode('ascii')
+        parts = resp['body'].split(b'--' + boundary)
+        self.assertEqual(len(parts), 4)
+        self.assertTrue(parts[1].endswith(b'\r\n\r\n' + data[:10] + b'\r\n'))
+        self.assertIn(b'Content-Range: bytes 10230-10239/10240', parts[2])
+        self.assertTrue(parts[2].endswith(data[-10:] + b'\r\n'))
+
+        resp = self.request('/static/video.bin', HTTP_RANGE='bytes=20000-')
+        self.assertEqual(resp['status'], '416 Range Not Satisfiable')
+        self.assertEqual(resp['headers']['Content-Range'], 'bytes */10240')
+
+        etag = self.request('/static/video.bin')['headers']['ETag']
+        resp = self.request('/static/video.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(resp['status'], '206 Partial Content')
+        resp = self.request('/static/video.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(resp['status'], '200 OK')
+        self.assertEqual(resp['body'], data)
+
+        # A date must be the exact Last-Modified date
+        mtime = os.stat(os.path.join(self.root, 'video.bin')).st_mtime
+        resp = self.request('/static/video.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=http_date(mtime))
+        self.assertEqual(resp['status'], '206 Partial Content')
+        resp = self.request('/static/video.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=http_date(mtime + 60))
+        self.assertEqual(resp['status'], '200 OK')
+
+    def test_file_cache(self):
+        cache = FileCache(ttl=0, max_open=1)
+        path = os.path.join(self.root, 'video.bin')
+        cached = cache.acquire(path)
+        other = cache.acquire(os.path.join(self.root, 'css', 'index.html'))
+        # Evicted, but still open until released
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cached.pread(4, 1), data[1:5])
+        cache.release(cached)
+        self.assertIsNone(cached.fd)
+
+        cache.release(other)
+        self.assertIs(cache.acquire(other.path), other)
+        cache.release(other)
+        os.utime(other.path, (0, 0))
+        self.assertIsNot(cache.acquire(other.path), other)
+        self.assertIsNone(other.fd)
+
+    def test_file_slice(self):
+        cache = FileCache()
+        path = os.path.join(self.root, 'video.bin')
+        cached = cache.acquire(path)
+        cached.refs += 2
+        whole = FileSlice(cache, cached, 0, len(data))
+        part = FileSlice(cache, cached, 1000, 100)
+        self.assertEqual(whole.fileno(), cached.fd)
+        # A slice past the start has its own descriptor, positioned at its start
+        fd = part.fileno()
+        self.assertNotEqual(fd, cached.fd)
+        self.assertEqual(os.lseek(fd, 0, os.SEEK_CUR), 1000)
+        self.assertEqual(os.lseek(cached.fd, 0, os.SEEK_CUR), 0)
+        self.assertEqual(part.read(), data[1000:1100])
+        part.close()
+        whole.close()
+
+        os.rename(os.path.join(self.root, 'css', 'index.html'), path)
+        part = FileSlice(cache, cached, 1000, 100)
+        self.assertRaises(OSError, part.fileno)
+        part.close()
+        cache.release(cached)
+
+    def test_mmap_changed(self):
+        path = os.path.join(self.root, 'video.bin')
+        cached = self.static.cache.acquire(path)
+        self.assertIsNotNone(cached.mmap())
+        # A file truncated in place isn't mapped past its end
+        with open(path, 'r+b') as fp:
+            fp.truncate(100)
+        self.assertIsNone(cached.mmap())
+        self.static.cache.release(cached)
+
+    def test_sendfile(self):
+        sock = bind('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        server = WorkerServer(sock, self.app)
+        thread = threading.Thread(target=server.serve, args=(5,))
+        thread.daemon = True
+        thread.start()
+
+        conn = HTTPConnection('127.0.0.1', sock.getsockname()[1])
+        conn.request('GET', '/static/video.bin', headers={'Range': 'bytes=1000-4999'})
+        resp = conn.getresponse()
+        self.assertEqual(resp.status, 206)
+        self.assertEqual(resp.read(), data[1000:5000])
+        conn.request('GET', '/static/video.bin')
+        self.assertEqual(conn.getresponse().read(), data)
+        conn.close()
+        server.stop()
+        thread.join(5)